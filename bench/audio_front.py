@@ -0,0 +1,80 @@
+"""
+Per-request cost of the audio front end: legacy (two BytesIO copies,
+torchaudio.load, fresh Resample) vs decode-once (`decode_wav` + cached
+resampler).
+
+    python -m bench.audio_front some.wav [--iters 20]
+
+Peak is measured with tracemalloc, which sees Python and numpy buffers but
+not torch's allocator, so it understates both paths by the same tensors.
+"""
+import argparse
+import io
+import time
+import tracemalloc
+
+import torchaudio
+
+from src.audio_front import decode_wav, to_16k_mono
+
+
+def _drain(f, chunk=64 * 1024):
+    """Read the file the way the multipart upload does: in chunks."""
+    while f.read(chunk):
+        pass
+
+
+def legacy(wav_bytes: bytes):
+    stt_buf = io.BytesIO(wav_bytes)
+    spk_buf = io.BytesIO(wav_bytes)
+    wav, sr = torchaudio.load(spk_buf, format="wav")
+    if sr != 16000:
+        wav = torchaudio.transforms.Resample(
+            orig_freq=sr,
+            new_freq=16000,
+            lowpass_filter_width=64,
+            rolloff=0.9475937167399596,
+            resampling_method="sinc_interp_kaiser",
+            beta=14.769656459379492,
+        )(wav)
+    if wav.size(0) > 1:
+        wav = wav.mean(dim=0, keepdim=True)
+    _drain(stt_buf)
+    return wav
+
+
+def decode_once(wav_bytes: bytes):
+    audio = decode_wav(wav_bytes)
+    wav = to_16k_mono(audio)
+    _drain(audio.file())
+    return wav
+
+
+def measure(fn, wav_bytes: bytes, iters: int):
+    fn(wav_bytes)  # warm caches (resampler kernel, codecs)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for _ in range(iters):
+        fn(wav_bytes)
+    elapsed = (time.perf_counter() - t0) / iters
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("wav")
+    ap.add_argument("--iters", type=int, default=20)
+    args = ap.parse_args()
+    with open(args.wav, "rb") as f:
+        wav_bytes = f.read()
+
+    print(f"payload: {len(wav_bytes) / 1e6:.2f} MB")
+    for name, fn in (("legacy", legacy), ("decode-once", decode_once)):
+        ms, peak = measure(fn, wav_bytes, args.iters)
+        print(f"{name:>12}: {ms:8.2f} ms/request, peak traced {peak:8.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Search latency of the in-process memory store at a few sizes.
+
+    python -m bench.local_memory [--sizes 1000 10000 100000] [--dim 1536] [--k 10]
+
+Rows are random unit vectors added through `add_embeddings` (no embedding
+API calls); queries use the same speaker filter as the app. Compare with
+bench/memory_hnsw.py for the Postgres path.
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.local_vectorstore import LocalVectorStore
+
+SPEAKERS = ["Hilla", "Mom", "Dad", "*"]
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", nargs="+", type=int, default=[1_000, 10_000, 100_000])
+    ap.add_argument("--dim", type=int, default=1536)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=500)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'rows':>8} {'filter':>8} {'p50 us':>9} {'p95 us':>9} {'append ms':>10}")
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            store = LocalVectorStore(None, path=str(Path(tmp) / "memories"), dim=args.dim)
+            vecs = rng.standard_normal((n, args.dim)).astype(np.float32)
+            t0 = time.perf_counter()
+            for start in range(0, n, 1000):
+                stop = min(n, start + 1000)
+                store.add_embeddings(
+                    [f"memory {i}" for i in range(start, stop)],
+                    vecs[start:stop],
+                    [{"household": "default", "speaker": SPEAKERS[i % 4]} for i in range(start, stop)],
+                    [str(i) for i in range(start, stop)],
+                )
+            append_ms = (time.perf_counter() - t0) * 1000 / max(1, n // 1000)
+
+            queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32).tolist()
+            for label, flt in (
+                ("none", None),
+                ("speaker", {"household": {"$in": ["default"]}, "speaker": {"$in": ["Hilla", "*"]}}),
+            ):
+                lat = []
+                for q in queries:
+                    t0 = time.perf_counter()
+                    store.similarity_search_with_score_by_vector(q, k=args.k, filter=flt)
+                    lat.append(time.perf_counter() - t0)
+                print(
+                    f"{n:>8} {label:>8} {_pct(lat, 0.5) * 1e6:>9.0f} {_pct(lat, 0.95) * 1e6:>9.0f}"
+                    f" {append_ms:>10.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
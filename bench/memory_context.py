@@ -0,0 +1,130 @@
+"""
+Prompt size of the memory block: legacy dict repr vs the context builder.
+
+    MEMORY_CONTEXT_LOG=retrievals.jsonl uvicorn src.app:app   # record real turns
+    python -m bench.memory_context retrievals.jsonl [--budget 160] [--min-sim 0.25]
+
+Each line is {"query", "speaker", "query_vec", "matches": [{"id", "content",
+"metadata", "score", "vector"?}]}. Both variants are rendered into the
+per-turn system message (`spells.pipa_turn`) and counted with the model's
+tokenizer. Without a file, a few synthetic turns full of near-duplicates
+are used.
+"""
+import argparse
+import json
+import statistics
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.memory_context import build_memory_context, count_tokens
+from src.spells import pipa_turn
+
+_FACTS = [
+    "Hilla likes cats.", "Hilla really likes cats.", "Hilla loves cats a lot.",
+    "Hilla goes to daycare every morning at 8.", "Hilla's favourite colour is purple.",
+    "Hilla has a grey cat called Pipsa.", "The family lives in Oulu.",
+    "Hilla wants to be a streamer when she grows up.", "Hilla is allergic to peanuts.",
+    "Hilla likes pancakes with strawberry jam.",
+]
+
+
+def _synthetic_turns(n=20, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    # a shared "about Hilla" direction keeps similarities in the range real embeddings show
+    base = rng.standard_normal((len(_FACTS), dim)) + 1.2 * rng.standard_normal(dim)
+    base[1] = base[0] + 0.1 * rng.standard_normal(dim)  # the cat near-duplicates
+    base[2] = base[0] + 0.1 * rng.standard_normal(dim)
+    base /= np.linalg.norm(base, axis=1, keepdims=True)
+    turns = []
+    for _ in range(n):
+        q = base[rng.integers(0, len(_FACTS))] + 0.8 * rng.standard_normal(dim) / np.sqrt(dim)
+        q /= np.linalg.norm(q)
+        order = np.argsort(-(base @ q))
+        turns.append({
+            "query": "Hilla said: what should we do today?",
+            "speaker": "Hilla",
+            "query_vec": q.tolist(),
+            "matches": [
+                {
+                    "id": uuid.uuid4().hex,
+                    "content": _FACTS[i],
+                    "metadata": {"id": uuid.uuid4().hex, "household": "default", "speaker": "Hilla",
+                                 "added": 1760000000.123456},
+                    "score": float(1.0 - base[i] @ q),
+                    "vector": base[i].tolist(),
+                }
+                for i in order
+            ],
+        })
+    return turns
+
+
+def _legacy_block(turn) -> str:
+    """What the prompt got before: the repr of _read_from_memory's dict."""
+    matches = [
+        {"content": m["content"], "metadata": m["metadata"], "score": m["score"]}
+        for m in turn["matches"]
+    ]
+    return str({"Context from memory": matches})
+
+
+def _builder_block(turn, **kwargs) -> str:
+    vectors = {
+        m["id"]: np.asarray(m["vector"], dtype=np.float32)
+        for m in turn["matches"] if m.get("vector") is not None
+    }
+    retrieval = SimpleNamespace(
+        matches=turn["matches"], vectors=vectors,
+        query=np.asarray(turn["query_vec"], dtype=np.float32),
+    )
+    return build_memory_context(retrieval, **kwargs)
+
+
+def _turn_tokens(turn, block) -> int:
+    msg = pipa_turn.format(now="Saturday 2026-10-17 09:00", speaker=turn["speaker"], memories=block)
+    return count_tokens(msg)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("log", nargs="?")
+    ap.add_argument("--budget", type=int, default=None)
+    ap.add_argument("--min-sim", type=float, default=None)
+    ap.add_argument("--mmr-lambda", type=float, default=None)
+    ap.add_argument("--show", type=int, default=1, help="print the blocks of the first N turns")
+    args = ap.parse_args()
+
+    if args.log:
+        with open(args.log, encoding="utf-8") as f:
+            turns = [json.loads(line) for line in f if line.strip()]
+    else:
+        turns = _synthetic_turns()
+
+    kwargs = {}
+    if args.budget is not None:
+        kwargs["budget_tokens"] = args.budget
+    if args.min_sim is not None:
+        kwargs["min_sim"] = args.min_sim
+    if args.mmr_lambda is not None:
+        kwargs["mmr_lambda"] = args.mmr_lambda
+
+    legacy, built = [], []
+    for n, turn in enumerate(turns):
+        old, new = _legacy_block(turn), _builder_block(turn, **kwargs)
+        legacy.append(_turn_tokens(turn, old))
+        built.append(_turn_tokens(turn, new))
+        if n < args.show:
+            print(f"--- legacy ({legacy[-1]} tokens)\n{old}\n--- builder ({built[-1]} tokens)\n{new}\n")
+
+    print(f"{len(turns)} turns (per-turn system message tokens)")
+    print(f"{'variant':>8} {'mean':>7} {'p95':>7} {'max':>7}")
+    for name, vals in (("legacy", legacy), ("builder", built)):
+        p95 = sorted(vals)[int(0.95 * (len(vals) - 1))]
+        print(f"{name:>8} {statistics.mean(vals):>7.0f} {p95:>7} {max(vals):>7}")
+    print(f"reduction: {100 * (1 - sum(built) / sum(legacy)):.0f}%")
+
+
+if __name__ == "__main__":
+    main()
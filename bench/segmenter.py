@@ -0,0 +1,99 @@
+"""
+Time-to-first-chunk of the reply segmenter on recorded delta streams.
+
+    REPLY_DELTA_LOG=deltas.jsonl uvicorn src.app:app   # record real replies
+    python -m bench.segmenter deltas.jsonl
+
+Each line is {"deltas": [[offset_s, "text"], ...]}. Streams are replayed
+against a simulated clock and compared with the legacy splitter (regex on
+. ! ? over the whole buffer). Without a file, a few built-in streams are used.
+"""
+import argparse
+import json
+import re
+import statistics
+
+from src.segmenter import SentenceSegmenter
+
+_SAMPLE_REPLIES = [
+    "Boop! Hi Hilla, did you know that a snail can sleep for 3.5 years? That is a super long nap! "
+    "Can you pretend to be a sleepy snail? 🐌💤",
+    "Ooh, a rainbow unicorn with sparkly pancake wings, flying over Oulu on a snowy Tuesday morning, "
+    "looking for the biggest cinnamon bun in the whole wide world! Hihi! 🦄🥞 What color is its tail?",
+    "Dr. Bunny says carrots help you see in the dark, but only a tiny bit. Zoom! Let's hop 3 times!",
+]
+
+
+def _synthetic(text: str, chars_per_delta: int = 4, delta_s: float = 0.03):
+    return [
+        [i / chars_per_delta * delta_s, text[i : i + chars_per_delta]]
+        for i in range(0, len(text), chars_per_delta)
+    ]
+
+
+def legacy_chunks(deltas):
+    """The original awake_mode splitter; returns [(emit_time, chunk)]."""
+    out, buf = [], ""
+    sentence_end = re.compile(r"([.!?])")
+    for t, delta in deltas:
+        buf += delta
+        while True:
+            m = sentence_end.search(buf)
+            if not m:
+                break
+            out.append((t, buf[: m.end()]))
+            buf = buf[m.end() :]
+    if buf:
+        out.append((deltas[-1][0], buf))
+    return out
+
+
+def segmenter_chunks(deltas, **kwargs):
+    now = [0.0]
+    seg = SentenceSegmenter(clock=lambda: now[0], **kwargs)
+    out = []
+    for t, delta in deltas:
+        now[0] = t
+        out.extend((t, c) for c in seg.push(delta))
+    tail = seg.flush()
+    if tail:
+        out.append((deltas[-1][0], tail))
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("log", nargs="?")
+    ap.add_argument("--first-min-chars", type=int, default=None)
+    ap.add_argument("--first-max-ms", type=float, default=None)
+    args = ap.parse_args()
+
+    if args.log:
+        with open(args.log, encoding="utf-8") as f:
+            streams = [json.loads(line)["deltas"] for line in f if line.strip()]
+    else:
+        streams = [_synthetic(t) for t in _SAMPLE_REPLIES]
+    streams = [s for s in streams if s]
+
+    kwargs = {}
+    if args.first_min_chars is not None:
+        kwargs["first_min_chars"] = args.first_min_chars
+    if args.first_max_ms is not None:
+        kwargs["first_max_ms"] = args.first_max_ms
+
+    print(f"{len(streams)} streams")
+    print(f"{'splitter':>10} {'TTFC p50 ms':>12} {'TTFC max ms':>12} {'chunks/reply':>13}")
+    for name, fn in (("legacy", legacy_chunks), ("segmenter", lambda d: segmenter_chunks(d, **kwargs))):
+        firsts, counts = [], []
+        for deltas in streams:
+            chunks = fn(deltas)
+            firsts.append(chunks[0][0] * 1000)
+            counts.append(len(chunks))
+        print(
+            f"{name:>10} {statistics.median(firsts):>12.0f} {max(firsts):>12.0f}"
+            f" {statistics.mean(counts):>13.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
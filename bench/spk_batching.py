@@ -0,0 +1,70 @@
+"""
+Batched vs unbatched ECAPA speaker-embedding throughput.
+
+    python -m bench.spk_batching [--wav some.wav] [--seconds 3] [--requests 128]
+
+Each caller embeds the same preprocessed clip; "unbatched" calls
+`encode_batch` once per request, "batched" goes through EmbeddingBatcher.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from src.enroll_voice import embed_batch, load_16k_mono
+from src.spk_batcher import EmbeddingBatcher
+
+CONCURRENCY = (1, 4, 16, 64)
+
+
+def _run(embed_one, wav, concurrency: int, requests: int):
+    latencies = []
+
+    def call(_):
+        t0 = time.perf_counter()
+        embed_one(wav)
+        latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(call, range(requests)))
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "rps": requests / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--wav", help="clip to embed (default: synthetic noise)")
+    ap.add_argument("--seconds", type=float, default=3.0)
+    ap.add_argument("--requests", type=int, default=128)
+    ap.add_argument("--max-batch", type=int, default=16)
+    ap.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = ap.parse_args()
+
+    if args.wav:
+        wav = load_16k_mono(args.wav)
+    else:
+        wav = 0.05 * torch.randn(1, int(16000 * args.seconds))
+
+    batcher = EmbeddingBatcher(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    embed_batch([wav])  # warm-up
+
+    print(f"{'callers':>8} {'mode':>10} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for c in CONCURRENCY:
+        for mode, fn in (
+            ("unbatched", lambda w: embed_batch([w])[0]),
+            ("batched", batcher.embed),
+        ):
+            r = _run(fn, wav, c, args.requests)
+            print(f"{c:>8} {mode:>10} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
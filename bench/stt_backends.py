@@ -0,0 +1,56 @@
+"""
+Per-backend transcription latency and real-time factor over a folder of WAVs.
+
+    python -m bench.stt_backends path/to/wavs [--backends openai vosk] [--repeat 1]
+
+RTF = processing time / audio duration (below 1.0 is faster than real time).
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+from src.audio_front import decode_wav
+from src.stt_backends import OpenAIBackend, VoskBackend
+
+BACKENDS = {"openai": OpenAIBackend, "vosk": VoskBackend}
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[int(p * (len(values) - 1))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("folder")
+    ap.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=list(BACKENDS))
+    ap.add_argument("--repeat", type=int, default=1)
+    args = ap.parse_args()
+
+    clips = [(p, decode_wav(p.read_bytes())) for p in sorted(Path(args.folder).glob("*.wav"))]
+    if not clips:
+        raise SystemExit(f"no .wav files in {args.folder}")
+    print(f"{len(clips)} clips, {sum(a.duration_s for _, a in clips):.1f}s of audio")
+
+    print(f"{'backend':>8} {'p50 ms':>8} {'p95 ms':>8} {'mean RTF':>9} {'empty':>6}")
+    for name in args.backends:
+        backend = BACKENDS[name]()
+        backend.transcribe(clips[0][1])  # warm-up: model load, connection setup
+        latencies, rtfs, empty = [], [], 0
+        for _ in range(args.repeat):
+            for _, audio in clips:
+                t0 = time.perf_counter()
+                text = backend.transcribe(audio)
+                dt = time.perf_counter() - t0
+                latencies.append(dt)
+                rtfs.append(dt / max(audio.duration_s, 1e-6))
+                empty += not (text and str(text).strip())
+        print(
+            f"{name:>8} {_pct(latencies, 0.5) * 1000:>8.0f} {_pct(latencies, 0.95) * 1000:>8.0f}"
+            f" {statistics.mean(rtfs):>9.3f} {empty:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
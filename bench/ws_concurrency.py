@@ -0,0 +1,67 @@
+"""
+Concurrency check for /ws: do N simultaneous conversations on ONE worker
+overlap, or do their latencies serialize?
+
+    uvicorn src.app:app --workers 1 &
+    python -m bench.ws_concurrency speech.wav --clients 1 4 8
+
+Each client sends the same WAV and records time to first stream frame and
+to the final reply. With a non-blocking pipeline the mean latency at N
+clients stays close to the single-client latency; if the loop were blocked
+it would grow roughly N-fold (reported as the "serialization" ratio).
+
+Uses the `websockets` package, which uvicorn needs anyway to serve /ws.
+`bench.ws_concurrency_check` runs the same rounds against an in-process
+server with stubbed STT/LLM and fails when they serialize.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+import websockets
+
+
+async def _conversation(url: str, wav: bytes):
+    t0 = time.perf_counter()
+    first = None
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(wav)
+        while True:
+            msg = json.loads(await ws.recv())
+            if msg["type"] == "stream" and first is None:
+                first = time.perf_counter() - t0
+            if msg["type"] in ("reply", "error"):
+                break
+    return first, time.perf_counter() - t0
+
+
+async def _round(url: str, wav: bytes, clients: int):
+    results = await asyncio.gather(*(_conversation(url, wav) for _ in range(clients)))
+    firsts = [f for f, _ in results if f is not None]
+    totals = [t for _, t in results]
+    return (statistics.mean(firsts) if firsts else float("nan")), statistics.mean(totals)
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("wav")
+    ap.add_argument("--url", default="ws://127.0.0.1:8000/ws")
+    ap.add_argument("--clients", type=int, nargs="+", default=[1, 4, 8])
+    args = ap.parse_args()
+    with open(args.wav, "rb") as f:
+        wav = f.read()
+
+    await _conversation(args.url, wav)  # warm-up (model loads, connections)
+    base = None
+    print(f"{'clients':>8} {'first ms':>10} {'reply ms':>10} {'serialization':>14}")
+    for n in args.clients:
+        first, total = await _round(args.url, wav, n)
+        base = base or total
+        # 1.0 = fully overlapped, n = fully serialized
+        print(f"{n:>8} {first * 1000:>10.0f} {total * 1000:>10.0f} {total / base:>14.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
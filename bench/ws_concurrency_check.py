@@ -0,0 +1,163 @@
+"""
+Automated overlap check for /ws: N simultaneous conversations on one
+in-process server must take about as long as one.
+
+    python -m bench.ws_concurrency_check [--clients 8] [--max-ratio 1.5]
+
+The app runs for real (socket handling, admission, turn pipeline,
+segmenter, memory journal) but its external calls are stubs that only
+sleep: speech-to-text + speaker ID, memory retrieval and the streamed LLM
+reply. Every stub yields to the event loop, so N clients should finish in
+roughly the single-client time; anything on the turn path that blocks the
+loop makes the ratio grow towards N. Exits with status 1 when the mean
+reply time at N clients exceeds --max-ratio times the single-client one.
+
+Needs the app's dependencies (fastapi, uvicorn, websockets) but no models,
+database or API key; scratch files go to a temporary directory.
+"""
+import argparse
+import asyncio
+import io
+import os
+import socket
+import sys
+import tempfile
+import wave
+from types import SimpleNamespace
+
+from bench.ws_concurrency import _conversation, _round
+
+STT_S = 0.3  # stubbed transcription + speaker ID
+RETRIEVE_S = 0.05  # stubbed memory retrieval
+REPLY = ["Sure, I can help with that. ", "Here is ", "the first part. ", "And here ", "is the rest."]
+DELTA_S = 0.05  # stubbed LLM inter-delta gap
+
+
+def _environment(scratch: str, clients: int):
+    """Settings for a self-contained app: local memory files, no limits below `clients`."""
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ.update(
+        MEMORY_BACKEND="local",
+        MEMORY_LOCAL_PATH=os.path.join(scratch, "memories"),
+        MEMORY_JOURNAL=os.path.join(scratch, "memory_journal.db"),
+        MEMORY_CONSOLIDATE_STATE=os.path.join(scratch, "memory_consolidate.json"),
+        MEMORY_CONSOLIDATE_INTERVAL_S="0",
+        MEMORY_COALESCE_S="3600",  # journaled turns stay put: the stubs have no memory writer
+        ADMISSION_CLIENT_RATE="0",
+        ADMISSION_MAX_TURNS=str(clients),
+        ADMISSION_MAX_STT=str(clients),
+        ADMISSION_MAX_SPEAKER_ID=str(clients),
+        ADMISSION_MAX_LLM=str(clients),
+    )
+
+
+class _Stream:
+    """Async iterator shaped like an OpenAI chat completion stream."""
+
+    def __init__(self):
+        self._deltas = iter(REPLY)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        delta = next(self._deltas, None)
+        if delta is None:
+            raise StopAsyncIteration
+        await asyncio.sleep(DELTA_S)
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+    async def close(self):
+        pass
+
+
+def _stub_externals():
+    import numpy as np
+
+    from src import awake, startup
+    from src.audio_front import decode_wav
+    from src.memory_cache import Retrieval
+
+    async def warm_worker():
+        pass
+
+    def front_end(wav_buf: bytes):
+        return decode_wav(wav_buf), SimpleNamespace(speech_s=1.0, total_s=1.0)
+
+    async def transcribe(audio):
+        await asyncio.sleep(STT_S)
+        return "Hilla said: ", "what should we do today?"
+
+    async def retrieve(speaker, document, top_k=5):
+        await asyncio.sleep(RETRIEVE_S)
+        return Retrieval([], {}, np.zeros(1, dtype=np.float32))
+
+    async def create(**kwargs):
+        return _Stream()
+
+    startup.awarm_worker = warm_worker
+    awake._front_end = front_end
+    awake.transcribe_with_identify_async = transcribe
+    awake.aretrieve = retrieve
+    awake.aclient = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _wav(seconds: float = 1.0, rate: int = 16000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\0\0" * int(seconds * rate))
+    return buf.getvalue()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _check(clients: int, max_ratio: float) -> bool:
+    import uvicorn
+
+    from src.app import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    try:
+        while not server.started:
+            if serving.done():
+                serving.result()  # startup failed: raise its error
+            await asyncio.sleep(0.01)
+        url, wav = f"ws://127.0.0.1:{port}/ws", _wav()
+        await _conversation(url, wav)  # warm-up
+        _, base = await _round(url, wav, 1)
+        first, total = await _round(url, wav, clients)
+    finally:
+        server.should_exit = True
+        await serving
+
+    ratio = total / base
+    ok = ratio <= max_ratio
+    print(f"1 client: {base * 1000:.0f} ms; {clients} clients: {total * 1000:.0f} ms "
+          f"(first frame {first * 1000:.0f} ms); serialization {ratio:.2f} "
+          f"(limit {max_ratio:.2f}) -> {'ok' if ok else 'FAIL'}")
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--max-ratio", type=float, default=1.5)
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as scratch:
+        _environment(scratch, args.clients)
+        _stub_externals()
+        ok = asyncio.run(_check(args.clients, args.max_ratio))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+-- HNSW index + speaker/household partitioning for the memory collection.
+--
+--   psql "$DB_CONNECTION_STR" -v m=16 -v ef_construction=64 -v dim=1536 -f db/02_memory_hnsw.sql
+--
+-- Safe to re-run. m / ef_construction only take effect when the index is
+-- (re)built; drop ix_memory_embedding_hnsw to rebuild with new values.
+-- Query-time recall is tuned per connection with hnsw.ef_search
+-- (MEMORY_HNSW_EF_SEARCH in src/config.py).
+
+\c peepamemory
+
+\if :{?m}
+\else
+   \set m 16
+\endif
+\if :{?ef_construction}
+\else
+   \set ef_construction 64
+\endif
+\if :{?dim}
+\else
+   \set dim 1536
+\endif
+\if :{?household}
+\else
+   \set household 'default'
+\endif
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+CREATE TABLE IF NOT EXISTS schema_migrations (
+   version    TEXT PRIMARY KEY,
+   applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- step 1: the langchain_postgres tables (created here too, so the index can
+-- exist before the app's first start)
+CREATE TABLE IF NOT EXISTS langchain_pg_collection (
+   uuid      UUID PRIMARY KEY,
+   name      VARCHAR NOT NULL UNIQUE,
+   cmetadata JSON
+);
+
+CREATE TABLE IF NOT EXISTS langchain_pg_embedding (
+   id            VARCHAR PRIMARY KEY,
+   collection_id UUID REFERENCES langchain_pg_collection (uuid) ON DELETE CASCADE,
+   embedding     vector(:dim),
+   document      VARCHAR,
+   cmetadata     JSONB
+);
+
+-- step 2: HNSW needs a fixed dimension; older tables were created untyped
+ALTER TABLE langchain_pg_embedding ALTER COLUMN embedding TYPE vector(:dim);
+
+-- step 3: tag legacy memories; they were never attributed to a speaker, so
+-- they become household-wide ('*' is matched by every speaker's filter)
+UPDATE langchain_pg_embedding
+   SET cmetadata = coalesce(cmetadata, '{}'::jsonb)
+                   || jsonb_build_object('household', :'household')
+ WHERE cmetadata->>'household' IS NULL;
+
+UPDATE langchain_pg_embedding
+   SET cmetadata = cmetadata || '{"speaker": "*"}'::jsonb
+ WHERE cmetadata->>'speaker' IS NULL;
+
+-- step 4: indexes
+-- PGVector's default distance strategy is cosine -> vector_cosine_ops
+SET maintenance_work_mem = '1GB';
+CREATE INDEX IF NOT EXISTS ix_memory_embedding_hnsw
+   ON langchain_pg_embedding
+   USING hnsw (embedding vector_cosine_ops)
+   WITH (m = :m, ef_construction = :ef_construction);
+
+-- mem_manager.memory_filter only uses $in, which PGVector (use_jsonb) compiles to
+-- cmetadata->>'field' IN (...); $eq would compile to jsonb_path_match(), which
+-- neither index below can serve
+CREATE INDEX IF NOT EXISTS ix_memory_household_speaker
+   ON langchain_pg_embedding (collection_id, (cmetadata->>'household'), (cmetadata->>'speaker'));
+
+CREATE INDEX IF NOT EXISTS ix_cmetadata_gin
+   ON langchain_pg_embedding USING gin (cmetadata jsonb_path_ops);
+
+ANALYZE langchain_pg_embedding;
+
+INSERT INTO schema_migrations (version) VALUES ('02_memory_hnsw')
+   ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,30 @@
+"""
+gunicorn settings for the voice server:
+
+    gunicorn src.app:app
+
+With STARTUP_PRELOAD (on by default) the app is imported and its models
+(`startup.warm_models`) are loaded once in the master; workers are forked
+afterwards and share those pages copy-on-write instead of each loading
+ECAPA, the voiceprints, the wake bank and Vosk again. `gc.freeze()` moves
+everything loaded so far out of the collector's reach, so collections in
+the workers do not touch (and un-share) those objects.
+"""
+import gc
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("STARTUP_PRELOAD", "1") != "0"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def when_ready(server):
+    # master, after the app was preloaded and before the first worker is forked
+    if not preload_app:
+        return
+    from src import startup
+
+    startup.warm_models()
+    gc.freeze()
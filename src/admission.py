@@ -0,0 +1,211 @@
+"""
+Admission control and backpressure for the voice pipeline.
+
+A turn (one WAV message, or one stream from its start frame to its reply)
+passes two gates before any work starts:
+
+1. a per-client token bucket: ADMISSION_CLIENT_RATE turns/s, bursts of
+   ADMISSION_CLIENT_BURST;
+2. the "turn" stage: at most ADMISSION_MAX_TURNS pipelines at once.
+
+Inside a turn the expensive stages have limits of their own ("stt",
+"speaker_id", "llm"), so a burst of transcriptions cannot starve the LLM
+streams of admitted conversations or vice versa.
+
+Every stage has a bounded wait queue (ADMISSION_QUEUE) and a deadline
+(ADMISSION_WAIT_MS). A caller that finds the queue full, or is still
+waiting at the deadline, gets `Busy` with a retry hint estimated from the
+stage's queue and recent service times; the server sends it as a
+{"code": "BUSY", "retry_after_ms": ...} error frame. A few clients are told
+to come back instead of every admitted conversation slowing down.
+
+Limits are per process (per gunicorn worker). Everything here runs on the
+event loop; none of it is thread-safe.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from src.config import (
+    ADMISSION_CLIENT_BURST,
+    ADMISSION_CLIENT_RATE,
+    ADMISSION_MAX_LLM,
+    ADMISSION_MAX_SPEAKER_ID,
+    ADMISSION_MAX_STT,
+    ADMISSION_MAX_TURNS,
+    ADMISSION_QUEUE,
+    ADMISSION_WAIT_MS,
+)
+
+_MIN_RETRY_MS = 100
+_MAX_RETRY_MS = 30_000
+
+
+class Busy(Exception):
+    """A stage (or the client's rate limit) turned the request away; retry after `retry_after_ms`."""
+
+    code = "BUSY"
+
+    def __init__(self, stage: str, reason: str, retry_after_ms: int):
+        super().__init__(f"{stage} is busy ({reason}), retry in {retry_after_ms} ms")
+        self.stage = stage
+        self.reason = reason
+        self.retry_after_ms = retry_after_ms
+
+
+class RateLimited(Busy):
+    code = "RATE_LIMITED"
+
+
+def _clamp_ms(ms: float) -> int:
+    return int(min(max(ms, _MIN_RETRY_MS), _MAX_RETRY_MS))
+
+
+class Permit:
+    """One admitted slot of a stage; `release()` is idempotent."""
+
+    __slots__ = ("_stage", "_started", "_released")
+
+    def __init__(self, stage: "Stage", started: float):
+        self._stage = stage
+        self._started = started
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._stage._release(time.monotonic() - self._started)
+
+
+class Stage:
+    """Concurrency limit + bounded, deadline-bound wait queue for one pipeline stage."""
+
+    def __init__(self, name: str, limit: int, max_queue: int, max_wait_s: float, window: int = 1024):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self._sem = asyncio.Semaphore(limit) if limit > 0 else None
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+        self._service_s = 1.0  # EWMA of how long a permit is held
+        self._waits = deque(maxlen=window)
+
+    def retry_after_ms(self) -> int:
+        """Rough time until a newcomer would get a slot: the queue ahead of it, drained `limit` at a time."""
+        if self._sem is None:
+            return _MIN_RETRY_MS
+        return _clamp_ms(1000.0 * self._service_s * (self.queued + 1) / self.limit)
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        raise Busy(self.name, reason, self.retry_after_ms())
+
+    async def acquire(self) -> Permit:
+        """Wait for a slot; raises `Busy` if the queue is full or the deadline passes first."""
+        t = time.monotonic()
+        if self._sem is not None:
+            if not self._sem.locked():
+                await self._sem.acquire()  # a free slot: returns without suspending
+            else:
+                if self.queued >= self.max_queue:
+                    self._reject("queue_full")
+                self.queued += 1
+                try:
+                    await asyncio.wait_for(self._sem.acquire(), self.max_wait_s)
+                except asyncio.TimeoutError:
+                    self._reject("timeout")
+                finally:
+                    self.queued -= 1
+        now = time.monotonic()
+        self._waits.append(now - t)
+        self.active += 1
+        self.admitted += 1
+        return Permit(self, now)
+
+    def _release(self, held_s: float):
+        self.active -= 1
+        self._service_s += 0.1 * (held_s - self._service_s)
+        if self._sem is not None:
+            self._sem.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        permit = await self.acquire()
+        try:
+            yield permit
+        finally:
+            permit.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+
+        def pct(p):
+            return round(1000.0 * waits[min(len(waits) - 1, int(p * len(waits)))], 1) if waits else 0.0
+
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "wait_p50_ms": pct(0.50),
+            "wait_p95_ms": pct(0.95),
+            "service_ms": round(1000.0 * self._service_s, 1),
+        }
+
+
+class ClientRateLimiter:
+    """Token bucket per client key; the least recently seen clients are forgotten past `max_clients`."""
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 10_000):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, last refill]
+        self.rejected = 0
+
+    def check(self, key: str):
+        """Take one token for `key`; raises `RateLimited` when its bucket is empty."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None) or [float(self.burst), now]
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        self._buckets[key] = bucket
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        if bucket[0] < 1.0:
+            self.rejected += 1
+            raise RateLimited("client", "rate limit", _clamp_ms(1000.0 * (1.0 - bucket[0]) / self.rate))
+        bucket[0] -= 1.0
+
+    def stats(self) -> dict:
+        return {"rate": self.rate, "burst": self.burst, "clients": len(self._buckets), "rejected": self.rejected}
+
+
+_WAIT_S = ADMISSION_WAIT_MS / 1000.0
+_STAGES = {
+    "turn": Stage("turn", ADMISSION_MAX_TURNS, ADMISSION_QUEUE, _WAIT_S),
+    "stt": Stage("stt", ADMISSION_MAX_STT, ADMISSION_QUEUE, _WAIT_S),
+    "speaker_id": Stage("speaker_id", ADMISSION_MAX_SPEAKER_ID, ADMISSION_QUEUE, _WAIT_S),
+    "llm": Stage("llm", ADMISSION_MAX_LLM, ADMISSION_QUEUE, _WAIT_S),
+}
+_CLIENTS = ClientRateLimiter(ADMISSION_CLIENT_RATE, ADMISSION_CLIENT_BURST)
+
+
+def stage(name: str) -> Stage:
+    return _STAGES[name]
+
+
+def check_client(key: str):
+    _CLIENTS.check(key)
+
+
+def stats() -> dict:
+    return {"stages": {n: s.stats() for n, s in _STAGES.items()}, "clients": _CLIENTS.stats()}
@@ -1,84 +1,383 @@
-from src.awake import awake_mode
+from src import startup  # first: the "imports" startup phase is timed from here
+from src import admission, metrics, turns
+from src.awake import awake_mode, awake_stream
+from src.config import (
+    ADMISSION_CLIENT_HEADER,
+    MEMORY_BACKEND,
+    STREAM_IDLE_S,
+    STREAM_MAX_S,
+    WS_INBOX_FRAMES,
+)
+from src.db_pool import ahealth, pool_stats
+from src.memory_consolidate import start_scheduler
+from src.memory_queue import get_memory_queue
+from src.stream_session import StreamFormatError, StreamingSession
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
-from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, PlainTextResponse
 from starlette.websockets import WebSocketState
+from functools import partial
+from typing import Awaitable, Callable, Optional
 import asyncio
-import inspect  # new
+import json
+import time
+
+startup.mark("imports")
 
 app = FastAPI()
 MAX_WAV_BYTES = 25 * 1024 * 1024  # 25 MB
 
+
+@app.on_event("startup")
+async def _warm_up():
+    # models, speaker pool, memory pools and tokenizer load in the background:
+    # the socket is accepted right away and /ready flips when this worker is warm
+    app.state.warm_up = asyncio.create_task(startup.awarm_worker())
+    start_scheduler()  # periodic memory consolidation
+
+
+@app.get("/ready")
+async def ready():
+    b = startup.breakdown()
+    return JSONResponse(b, status_code=200 if b["ready"] else 503)
+
+
+@app.get("/health")
+async def health():
+    db = await ahealth() if MEMORY_BACKEND == "pgvector" else {}
+    return {
+        "status": "ok" if all(v == "ok" for v in db.values()) else "degraded",
+        "memory_backend": MEMORY_BACKEND,
+        "db": db,
+        "pools": pool_stats(),
+        "memory_queue": await asyncio.to_thread(get_memory_queue().stats),
+        "admission": admission.stats(),
+        "aborted_turns": turns.abort_stats(),
+    }
+
+
+def _collect():
+    """Gauges and counters kept by other subsystems, read at scrape time."""
+    adm = admission.stats()
+    stages = adm["stages"]
+    aborted = turns.abort_stats()
+    rejected = [
+        ({"stage": name, "reason": reason}, n)
+        for name, s in stages.items() for reason, n in s["rejected"].items()
+    ]
+    rejected.append(({"stage": "client", "reason": "rate_limit"}, adm["clients"]["rejected"]))
+    return [
+        ("ready", "1 once this worker has finished warming up.", "gauge", [({}, int(startup.is_ready()))]),
+        ("admission_active", "Admitted slots in use per stage.", "gauge",
+         [({"stage": name}, s["active"]) for name, s in stages.items()]),
+        ("admission_queued", "Callers waiting for a slot per stage.", "gauge",
+         [({"stage": name}, s["queued"]) for name, s in stages.items()]),
+        ("admission_admitted_total", "Slots granted per stage.", "counter",
+         [({"stage": name}, s["admitted"]) for name, s in stages.items()]),
+        ("admission_rejected_total", "Requests turned away per stage and reason.", "counter", rejected),
+        ("aborted_wasted_seconds_total", "Wall time spent on turns whose client went away.", "counter",
+         [({}, aborted["wasted_s"])]),
+        ("aborted_reply_tokens_total", "Reply tokens generated for turns whose client went away.", "counter",
+         [({}, aborted["reply_tokens"])]),
+    ]
+
+
+metrics.register_collector(_collect)
+
+
+def _collect_memory_queue(queue: dict):
+    """Memory queue gauges from `queue`, its stats as fetched off the event loop (they are SQLite reads)."""
+    return [
+        ("memory_queue_depth", "Memory writes waiting to be persisted.", "gauge", [({}, queue["depth"])]),
+        ("memory_queue_lag_seconds", "Age of the oldest unpersisted memory write.", "gauge",
+         [({}, queue["lag_s"])]),
+        ("memory_queue_dead", "Memory writes that exhausted their retries.", "gauge", [({}, queue["dead"])]),
+        ("memory_queue_processed_total", "Memory writes persisted by this worker.", "counter",
+         [({}, queue["processed"])]),
+    ]
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    queue = await asyncio.to_thread(get_memory_queue().stats)
+    return PlainTextResponse(
+        metrics.render(partial(_collect_memory_queue, queue)), media_type="text/plain; version=0.0.4"
+    )
+
 def _looks_like_wav(buf: bytes) -> bool:
     return len(buf) >= 44 and buf[0:4] == b"RIFF" and buf[8:12] == b"WAVE"
 
+async def _send_error(websocket: WebSocket, code: str, message: str, **extra):
+    if websocket.client_state == WebSocketState.CONNECTED:
+        await websocket.send_json(
+            {"type": "error", "error": {"code": code, "message": message, **extra}}
+        )
+
+async def _send_busy(websocket: WebSocket, busy: admission.Busy):
+    await _send_error(websocket, busy.code, str(busy), retry_after_ms=busy.retry_after_ms)
+
+def _client_key(websocket: WebSocket) -> str:
+    """Rate-limit key: the configured proxy header's first hop, else the peer address."""
+    if ADMISSION_CLIENT_HEADER:
+        forwarded = websocket.headers.get(ADMISSION_CLIENT_HEADER)
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return websocket.client.host if websocket.client else "unknown"
+
+async def _admit(websocket: WebSocket, client: str, turn: turns.Turn) -> Optional[admission.Permit]:
+    """Rate limit + turn slot for one turn; None (after a BUSY/RATE_LIMITED frame) if refused."""
+    try:
+        with turns.span("admission", turn):
+            admission.check_client(client)
+            return await admission.stage("turn").acquire()
+    except admission.Busy as e:
+        turns.finish(turn, e.code.lower())
+        await _send_busy(websocket, e)
+        return None
+
+def _drop_stream(session: StreamingSession, permit: admission.Permit, turn: turns.Turn, outcome: str):
+    """Cancel an open stream's recognition, free its turn slot and close its turn."""
+    session.cancel()
+    permit.release()
+    turns.finish(turn, outcome)
+
+_END = object()  # end of a turn's chunk stream
+
+
+async def _relay(websocket: WebSocket, stream_q: asyncio.Queue, turn: turns.Turn):
+    """Consumer: send each chunk as a stream frame until the pipeline is done."""
+    while True:
+        chunk = await stream_q.get()
+        if chunk is _END:
+            return
+        await websocket.send_json({"type": "stream", "text": chunk})
+        turn.chunks_sent += 1
+
+
+async def _run_turn(
+    websocket: WebSocket,
+    run: Callable[[Callable], Awaitable[Optional[str]]],
+    closed: asyncio.Event,
+    turn: turns.Turn,
+):
+    """
+    Run one pipeline, relaying its chunks as stream frames, then send the reply frame.
+
+    The pipeline (producer) and the relay (consumer) run as tasks; if the
+    client goes away first (`closed` is set by the connection's reader, or a
+    send fails) the pipeline task is cancelled right away: the LLM stream is
+    closed and pending STT/speaker-ID work is dropped.
+
+    `turn` is bound while the pipeline task is created, so its stages are
+    recorded as spans of this turn; the turn is finished here with its
+    outcome and its request ID goes back in the reply frame.
+    """
+    stream_q: asyncio.Queue = asyncio.Queue()  # fresh queue per message
+    token = turns.bind(turn)
+    try:
+        pipeline = asyncio.create_task(run(stream_q.put))  # inherits the bound turn
+    finally:
+        turns.unbind(token)
+    pipeline.add_done_callback(lambda _: stream_q.put_nowait(_END))
+    relay = asyncio.create_task(_relay(websocket, stream_q, turn))
+    gone = asyncio.create_task(closed.wait())
+
+    await asyncio.wait({relay, gone}, return_when=asyncio.FIRST_COMPLETED)
+    if gone.done() or relay.exception() is not None:
+        for t in (pipeline, relay, gone):
+            t.cancel()
+        await asyncio.gather(pipeline, relay, gone, return_exceptions=True)
+        turns.record_abort(turn, "disconnect")
+        return
+    gone.cancel()
+
+    # Deliver final result (and surface any errors cleanly)
+    try:
+        result = await pipeline
+    except admission.Busy as e:
+        # a stage inside the pipeline was saturated: no reply, the client retries
+        turns.finish(turn, e.code.lower())
+        await _send_busy(websocket, e)
+        return
+    except Exception as e:
+        result = None
+        turns.finish(turn, "error")
+        await _send_error(websocket, "SERVER_ERROR", str(e), request_id=turn.request_id)
+    else:
+        failed = any(not ok for _, _, _, ok in turn.spans)
+        turns.finish(turn, "ok" if result else "error" if failed else "empty")
+
+    if websocket.client_state == WebSocketState.CONNECTED:
+        await websocket.send_json(
+            {"type": "reply",
+             "text": result or "No transcription or an error occurred.",
+             "request_id": turn.request_id}
+        )
+
+
+async def _read_frames(websocket: WebSocket, inbox: asyncio.Queue, closed: asyncio.Event):
+    """
+    Reader: receive frames into `inbox` for the handler, so a disconnect is
+    seen (and `closed` set) even while a turn is running. Ends with None.
+    """
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            await inbox.put(message)
+    except WebSocketDisconnect:
+        pass  # client closed; we’re done
+    except Exception:
+        # protocol/receive error — close politely
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close(code=1003)
+    finally:
+        closed.set()
+        await inbox.put(None)
+
 @app.websocket("/ws")
 async def ws_handler(websocket: WebSocket):
+    """
+    Two protocols share the socket:
+
+    - whole-WAV mode: one binary frame holding a complete WAV file;
+    - streaming mode: a text frame {"type": "start", "sample_rate": 16000,
+      "channels": 1, "sample_width": 2[, "stt": "cloud"|"vosk"]}, then binary
+      frames of raw little-endian PCM, then {"type": "end"}. Recognition
+      runs while the chunks arrive; the LLM starts at the end frame.
+      "stt": "vosk" is refused (BAD_FORMAT) unless the server runs Vosk
+      (STT_POLICY or STREAM_STT), whose model is warmed at startup.
+
+    Each turn is admitted first (per-client rate limit, then a slot of the
+    "turn" stage; a stream holds its slot from the start frame to its
+    reply). Refused turns get a BUSY or RATE_LIMITED error frame carrying
+    `retry_after_ms`. An open stream that goes STREAM_IDLE_S without a
+    frame, or runs past STREAM_MAX_S, is dropped with a STREAM_TIMEOUT
+    error frame so idle clients cannot sit on turn slots.
+
+    Frames are received by a separate reader task; when the client
+    disconnects mid-turn, the turn is cancelled instead of running to the
+    end (see `_run_turn`), and frames still queued are dropped.
+
+    Every turn gets a request ID (returned in its reply frame) and a
+    per-stage latency breakdown, from WAV validation or the start frame to
+    the reply; see `turns` and GET /metrics.
+    """
     await websocket.accept()
-    while True:
-        try:
-            data = await websocket.receive_bytes()
-        except WebSocketDisconnect:
-            # client closed; we’re done
-            break
-        except Exception:
-            # protocol/receive error — close politely
-            if websocket.client_state == WebSocketState.CONNECTED:
-                await websocket.close(code=1003)
-            break
-
-        if len(data) > MAX_WAV_BYTES:
-            await websocket.send_json(
-                {"type": "error",
-                 "error": {"code": "PAYLOAD_TOO_LARGE", "message": "Max 25MB"}}
-            )
-            continue
-
-        if not _looks_like_wav(data):
-            # Invalid payload; close but don’t kill the whole server
-            if websocket.client_state == WebSocketState.CONNECTED:
-                await websocket.close(code=1003)
-            break
-
-        # fresh queue per message
-        stream_q: asyncio.Queue[str] = asyncio.Queue()
-
-        async def on_chunk(chunk: str):
-            await stream_q.put(chunk)
-
-        # Run awake_mode safely
-        if inspect.iscoroutinefunction(awake_mode):
-            task = asyncio.create_task(awake_mode(data, on_chunk))
-        else:
-            # If it’s sync or might block, run in a threadpool
-            task = asyncio.create_task(run_in_threadpool(awake_mode, data, on_chunk))
-
-        # Stream as chunks arrive; timeout is just a heartbeat
+    client = _client_key(websocket)
+    session: Optional[StreamingSession] = None
+    permit: Optional[admission.Permit] = None  # the open stream's turn slot
+    stream_turn: Optional[turns.Turn] = None
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=WS_INBOX_FRAMES)
+    closed = asyncio.Event()
+    reader = asyncio.create_task(_read_frames(websocket, inbox, closed))
+    try:
         while True:
-            if task.done() and stream_q.empty():
+            if session is None:
+                message = await inbox.get()
+            else:
+                # an open stream holds a turn slot: it must keep sending, and finish in time
+                left = STREAM_MAX_S - (time.perf_counter() - stream_turn.started)
+                try:
+                    message = await asyncio.wait_for(inbox.get(), max(0.0, min(STREAM_IDLE_S, left)))
+                except asyncio.TimeoutError:
+                    _drop_stream(session, permit, stream_turn, "timeout")
+                    session = None
+                    await _send_error(websocket, "STREAM_TIMEOUT", "Stream idle or too long")
+                    continue
+            if message is None or closed.is_set():
                 break
-            try:
-                chunk = await asyncio.wait_for(stream_q.get(), timeout=30)
-                if websocket.client_state == WebSocketState.CONNECTED:
-                    await websocket.send_json({"type": "stream", "text": chunk})
-            except asyncio.TimeoutError:
-                # No chunk yet; loop and check task status again
+
+            if message.get("text") is not None:
+                try:
+                    frame = json.loads(message["text"])
+                    kind = frame.get("type")
+                except (ValueError, AttributeError):
+                    await _send_error(websocket, "BAD_FRAME", "Expected a JSON object")
+                    continue
+
+                if kind == "start":
+                    if session is not None:
+                        _drop_stream(session, permit, stream_turn, "abandoned")
+                        session = None
+                    stream_turn = turns.Turn()
+                    permit = await _admit(websocket, client, stream_turn)
+                    if permit is None:
+                        continue
+                    token = turns.bind(stream_turn)  # recognition tasks record into this turn
+                    try:
+                        session = StreamingSession.from_start_frame(frame)
+                    except StreamFormatError as e:
+                        permit.release()
+                        turns.finish(stream_turn, "invalid")
+                        await _send_error(websocket, "BAD_FORMAT", str(e))
+                    except Exception as e:
+                        permit.release()
+                        turns.finish(stream_turn, "error")
+                        await _send_error(websocket, "SERVER_ERROR", str(e), request_id=stream_turn.request_id)
+                    finally:
+                        turns.unbind(token)
+                elif kind == "end":
+                    if session is None:
+                        await _send_error(websocket, "NO_STREAM", "No stream was started")
+                        continue
+                    current, session = session, None
+                    try:
+                        await _run_turn(
+                            websocket, lambda on_chunk: awake_stream(current, on_chunk), closed, stream_turn
+                        )
+                    finally:
+                        permit.release()
+                else:
+                    await _send_error(websocket, "BAD_FRAME", f"Unknown frame type: {kind}")
                 continue
 
-        # Deliver final result (and surface any errors cleanly)
-        try:
-            result = await task
-        except Exception as e:
-            result = None
-            # Optional: send an error frame instead of silently failing
-            if websocket.client_state == WebSocketState.CONNECTED:
-                await websocket.send_json(
-                    {"type": "error",
-                     "error": {"code": "SERVER_ERROR", "message": str(e)}}
-                )
+            data = message.get("bytes")
+            if data is None:
+                continue
 
-        if websocket.client_state == WebSocketState.CONNECTED:
-            await websocket.send_json(
-                {"type": "reply",
-                 "text": result or "No transcription or an error occurred."}
-            )
+            if session is not None:
+                if session.nbytes + len(data) > MAX_WAV_BYTES:
+                    _drop_stream(session, permit, stream_turn, "invalid")
+                    session = None
+                    await _send_error(websocket, "PAYLOAD_TOO_LARGE", "Max 25MB")
+                    continue
+                token = turns.bind(stream_turn)
+                try:
+                    session.feed(data)
+                except Exception as e:
+                    _drop_stream(session, permit, stream_turn, "error")
+                    session = None
+                    await _send_error(websocket, "SERVER_ERROR", str(e), request_id=stream_turn.request_id)
+                finally:
+                    turns.unbind(token)
+                continue
+
+            turn = turns.Turn()
+            with turns.span("validate", turn):
+                too_large = len(data) > MAX_WAV_BYTES
+                valid = not too_large and _looks_like_wav(data)
+            if too_large:
+                turns.finish(turn, "invalid")
+                await _send_error(websocket, "PAYLOAD_TOO_LARGE", "Max 25MB")
+                continue
+
+            if not valid:
+                turns.finish(turn, "invalid")
+                # Invalid payload; close but don’t kill the whole server
+                if websocket.client_state == WebSocketState.CONNECTED:
+                    await websocket.close(code=1003)
+                break
+
+            admitted = await _admit(websocket, client, turn)
+            if admitted is None:
+                continue
+            try:
+                await _run_turn(websocket, lambda on_chunk: awake_mode(data, on_chunk), closed, turn)
+            finally:
+                admitted.release()
+    finally:
+        reader.cancel()
+        if session is not None:
+            _drop_stream(session, permit, stream_turn, "abandoned")
     # No unconditional close here; the loop exits only on disconnect or fatal error
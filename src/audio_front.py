@@ -0,0 +1,259 @@
+"""
+Decode-once audio front end.
+
+`decode_wav` parses the RIFF header of an uploaded payload and exposes the
+PCM samples as a numpy view over the original buffer (no copy). The same
+`DecodedAudio` is handed to speaker ID (`to_16k_mono`) and to STT
+(`DecodedAudio.file()`, a read-only file object over the original bytes),
+so a request never holds more than one copy of the upload.
+
+torch / torchaudio are only imported by the functions that resample, so
+importing this module (and the server) does not load them.
+"""
+import io
+import struct
+import threading
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import torch
+    import torchaudio
+
+TARGET_SR = 16000
+
+_PCM = 1
+_FLOAT = 3
+_EXTENSIBLE = 0xFFFE
+
+
+class _ViewReader(io.RawIOBase):
+    """
+    Seekable read-only file object over one or more buffers (e.g. a WAV
+    header followed by a memoryview of samples); reads copy only what is
+    asked for.
+    """
+
+    def __init__(self, parts, name: str):
+        self._parts = [memoryview(p).cast("B") for p in parts]
+        self._size = sum(len(p) for p in self._parts)
+        self._pos = 0
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        want = min(len(b), self._size - self._pos)
+        done, offset = 0, 0
+        for part in self._parts:
+            if done == want:
+                break
+            lo = self._pos + done - offset
+            if 0 <= lo < len(part):
+                n = min(len(part) - lo, want - done)
+                b[done : done + n] = part[lo : lo + n]
+                done += n
+            offset += len(part)
+        self._pos += done
+        return done
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def _wav_header(tag: int, channels: int, sample_rate: int, bits: int, data_len: int) -> bytes:
+    block_align = channels * bits // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_len, b"WAVE",
+        b"fmt ", 16, tag, channels, sample_rate, sample_rate * block_align, block_align, bits,
+        b"data", data_len,
+    )
+
+
+class DecodedAudio:
+    def __init__(self, raw, data, tag, sample_rate, channels, bits, pcm, trimmed=False):
+        self.raw = raw                  # the whole WAV payload
+        self.data = data                # the (possibly trimmed) data chunk, a view into raw
+        self.tag = tag
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bits = bits
+        self.pcm = pcm                  # (frames, channels) view into `raw` when possible
+        self.trimmed = trimmed
+        self.mono = None                # float32 mono cache filled by mono_float()
+
+    @property
+    def duration_s(self) -> float:
+        return self.pcm.shape[0] / float(self.sample_rate)
+
+    def trim(self, start: int, end: int) -> "DecodedAudio":
+        """Frames [start, end) as a new DecodedAudio; still no copy of the samples."""
+        start, end = max(0, start), min(self.pcm.shape[0], end)
+        if start == 0 and end == self.pcm.shape[0]:
+            return self
+        align = self.channels * self.bits // 8
+        out = DecodedAudio(
+            self.raw,
+            self.data[start * align : end * align],
+            self.tag,
+            self.sample_rate,
+            self.channels,
+            self.bits,
+            self.pcm[start:end],
+            trimmed=True,
+        )
+        if self.mono is not None:
+            out.mono = self.mono[start:end]
+        return out
+
+    def wav_parts(self) -> list:
+        """Buffers that concatenate to a valid WAV file (a fresh header if trimmed)."""
+        if not self.trimmed:
+            return [self.raw]
+        header = _wav_header(self.tag, self.channels, self.sample_rate, self.bits, len(self.data))
+        return [header, self.data]
+
+    def file(self, name: str = "speech.wav"):
+        """File-like view of the WAV for upload clients."""
+        return io.BufferedReader(_ViewReader(self.wav_parts(), name))
+
+
+def decode_wav(buf) -> DecodedAudio:
+    """
+    Parse a RIFF/WAVE payload without copying its samples.
+
+    Raises:
+        ValueError: if the payload is not a WAV file we can read
+    """
+    raw = memoryview(buf).cast("B")
+    if len(raw) < 12 or raw[:4] != b"RIFF" or raw[8:12] != b"WAVE":
+        raise ValueError("Provided data does not appear to be a valid WAV file")
+
+    fmt = None
+    data_off = data_len = None
+    pos = 12
+    while pos + 8 <= len(raw):
+        cid = bytes(raw[pos : pos + 4])
+        size = struct.unpack_from("<I", raw, pos + 4)[0]
+        body = pos + 8
+        if cid == b"fmt ":
+            if size < 16 or body + 16 > len(raw):
+                raise ValueError("WAV fmt chunk is truncated")
+            fmt = struct.unpack_from("<HHIIHH", raw, body)
+            if fmt[0] == _EXTENSIBLE and size >= 26 and body + 26 <= len(raw):
+                # real format tag is the first 2 bytes of the SubFormat GUID
+                fmt = (struct.unpack_from("<H", raw, body + 24)[0],) + fmt[1:]
+        elif cid == b"data":
+            data_off = body
+            # streaming writers leave 0 / 0xFFFFFFFF here; take what is present
+            data_len = min(size, len(raw) - body) if size not in (0, 0xFFFFFFFF) else len(raw) - body
+            break
+        pos = body + size + (size & 1)
+
+    if fmt is None or data_off is None:
+        raise ValueError("WAV file is missing its fmt or data chunk")
+
+    tag, channels, sample_rate, _, block_align, bits = fmt
+    if channels < 1 or sample_rate < 1 or bits < 1:
+        raise ValueError("WAV header has no channels, sample rate or sample width")
+    if bits % 8 or block_align != channels * bits // 8:
+        raise ValueError(f"WAV block align {block_align} does not match {channels} x {bits} bits")
+    data_len -= data_len % block_align
+    data = raw[data_off : data_off + data_len]
+
+    if tag == _PCM and bits in (8, 16, 32):
+        dtype = {8: "u1", 16: "<i2", 32: "<i4"}[bits]
+        pcm = np.frombuffer(data, dtype=dtype)
+    elif tag == _FLOAT and bits in (32, 64):
+        pcm = np.frombuffer(data, dtype="<f4" if bits == 32 else "<f8")
+    elif tag == _PCM and bits == 24:
+        # no native int24: widen once (the only format that needs a copy)
+        b = np.frombuffer(data, dtype="u1").reshape(-1, 3).astype(np.uint32)
+        pcm = ((b[:, 0] << 8) | (b[:, 1] << 16) | (b[:, 2] << 24)).view(np.int32)
+    else:
+        raise ValueError(f"Unsupported WAV encoding (format {tag}, {bits} bits)")
+
+    return DecodedAudio(raw, data, tag, sample_rate, channels, bits, pcm.reshape(-1, channels))
+
+
+def from_pcm(pcm_bytes, sample_rate: int, channels: int = 1, bits: int = 16) -> DecodedAudio:
+    """Wrap headerless little-endian PCM (e.g. streamed chunks) as DecodedAudio."""
+    dtype = {8: "u1", 16: "<i2", 32: "<i4"}.get(bits)
+    if dtype is None:
+        raise ValueError(f"Unsupported PCM sample width: {bits} bits")
+    data = memoryview(pcm_bytes).cast("B")
+    align = channels * bits // 8
+    data = data[: len(data) - len(data) % align]
+    pcm = np.frombuffer(data, dtype=dtype).reshape(-1, channels)
+    # trimmed=True: there is no original header, file() synthesizes one
+    return DecodedAudio(data, data, _PCM, sample_rate, channels, bits, pcm, trimmed=True)
+
+
+def _scale(pcm: np.ndarray) -> float:
+    if pcm.dtype.kind == "f":
+        return 1.0
+    if pcm.dtype == np.uint8:
+        return 1.0 / 128.0
+    # 24-bit samples are widened into the top bytes of an int32
+    return 1.0 / float(2 ** (8 * pcm.dtype.itemsize - 1))
+
+
+_RESAMPLERS: "dict[tuple[int, int], torchaudio.transforms.Resample]" = {}
+_RESAMPLERS_LOCK = threading.Lock()
+
+
+def get_resampler(orig_freq: int, new_freq: int = TARGET_SR):
+    """Resampler with its sinc kernel built once per source rate."""
+    import torchaudio
+
+    key = (orig_freq, new_freq)
+    with _RESAMPLERS_LOCK:
+        r = _RESAMPLERS.get(key)
+        if r is None:
+            r = _RESAMPLERS[key] = torchaudio.transforms.Resample(
+                orig_freq=orig_freq,
+                new_freq=new_freq,
+                lowpass_filter_width=64,
+                rolloff=0.9475937167399596,
+                resampling_method="sinc_interp_kaiser",
+                beta=14.769656459379492,
+            )
+        return r
+
+
+def mono_float(audio: DecodedAudio) -> np.ndarray:
+    """Float32 mono samples in [-1, 1] at the source rate (computed once per audio)."""
+    if audio.mono is not None:
+        return audio.mono
+    pcm = audio.pcm
+    if pcm.dtype == np.uint8:
+        mono = pcm.mean(axis=1, dtype=np.float32) - 128.0
+    elif audio.channels == 1:
+        mono = pcm[:, 0].astype(np.float32)
+    else:
+        mono = pcm.mean(axis=1, dtype=np.float32)
+    mono *= _scale(pcm)
+    audio.mono = mono
+    return mono
+
+
+def to_16k_mono(audio: DecodedAudio) -> "torch.Tensor":
+    """Float32 16 kHz mono tensor (1, samples) built from the PCM view."""
+    import torch
+
+    wav = torch.from_numpy(mono_float(audio)).unsqueeze(0)
+    if audio.sample_rate != TARGET_SR:
+        with torch.no_grad():
+            wav = get_resampler(audio.sample_rate)(wav)
+    return wav
@@ -1,77 +1,232 @@
-import re
+import asyncio
+import json
+import time
 
-from src.config import MODEL_ID, NOW, client, logger
-from src.mem_manager import MemoryAgent, ReadMemoryAgent, _read_from_memory
-from src.spells import pipa_core, remember_read, remember_write
-from src.transcribe import transcribe_with_identify
+from src import admission, metrics, turns
+from src.audio_front import decode_wav, mono_float
+from src.config import (
+    MEMORY_CONTEXT_LOG,
+    MEMORY_ON_ABORT,
+    MODEL_ID,
+    REPLY_DELTA_LOG,
+    VAD_MIN_SPEECH_S,
+    aclient,
+    logger,
+)
+from src.memory_cache import aretrieve
+from src.memory_context import NO_MEMORIES, build_memory_context
+from src.memory_queue import get_memory_queue
+from src.prompt_builder import build_messages, log_usage, speaker_from_identity
+from src.segmenter import SentenceSegmenter
+from src.stream_session import StreamingSession
+from src.transcribe import transcribe_with_identify_async
+from src.vad import detect_speech
 from typing import Optional, Callable
-import threading  # NEW: use a background thread for the write
 
 
-def persist_interaction_memory(interaction: str):
-    """Background task: write the interaction to memory safely."""
+def _record_deltas(deltas: list):
+    """Append one reply's (offset_s, delta) stream for offline segmenter benchmarks."""
     try:
-        # Use the imported remember_write spell (not memory_spell)
-        MemoryAgent.invoke(remember_write.format(payload=interaction))
-    except Exception as e:
-        logger.exception(f"background memory write failed: {e}")
+        with open(REPLY_DELTA_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"deltas": deltas}, ensure_ascii=False) + "\n")
+    except OSError as e:
+        logger.warning("could not record reply deltas: %s", e)
+
+
+def _record_retrieval(query: str, speaker: str, retrieval):
+    """Append one turn's retrieval (matches + vectors) for bench/memory_context.py."""
+    rec = {
+        "query": query,
+        "speaker": speaker,
+        "query_vec": [round(float(x), 5) for x in retrieval.query],
+        "matches": [
+            {**m, "vector": [round(float(x), 5) for x in retrieval.vectors[m["id"]]]}
+            if m.get("id") in retrieval.vectors else m
+            for m in retrieval.matches
+        ],
+    }
+    try:
+        with open(MEMORY_CONTEXT_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+    except OSError as e:
+        logger.warning("could not record retrieval: %s", e)
+
+
+def _front_end(wav_buf: bytes):
+    """Decode + VAD (CPU-bound); returns (trimmed audio or None, VadResult)."""
+    audio = decode_wav(wav_buf)
+    speech = detect_speech(mono_float(audio), audio.sample_rate)
+    if speech.speech_s < VAD_MIN_SPEECH_S:
+        return None, speech
+    return audio.trim(speech.start, speech.end), speech
+
 
 async def awake_mode(wav_buf: bytes, on_chunk: Optional[Callable[[str], object]] = None) -> Optional[str]:
     try:
+        # 0) Voice activity: drop silent/too-short captures before any network call
+        with turns.span("front_end"):
+            audio, speech = await asyncio.to_thread(_front_end, wav_buf)
+        if audio is None:
+            logger.info(
+                "empty capture (VAD): %.2fs speech in %.2fs", speech.speech_s, speech.total_s
+            )
+            return None
+        logger.info("VAD: %.2fs speech in %.2fs capture", speech.speech_s, speech.total_s)
+
         # 1) Speech-to-text (+ identity)
-        identity, text = transcribe_with_identify(wav_buf)
-        input_text = (identity + (text or "").strip()).strip()
+        with turns.span("transcribe"):
+            identity, text = await transcribe_with_identify_async(audio)
+        return await respond(identity, text, on_chunk)
+
+    except admission.Busy:
+        raise  # the server answers with a BUSY frame
+    except Exception as e:
+        logger.exception(f"awake_mode error: {e}")
+        return None
 
-        from_mem = _read_from_memory(document=input_text, top_k=10)
-        #ReadMemoryAgent.invoke(remember_read.format(payload=input_text))
-        logger.info("Context form mem %s", from_mem)
 
-        if not text or not text.strip():
-            logger.info("empty capture.")
+async def awake_stream(session: StreamingSession, on_chunk: Optional[Callable[[str], object]] = None) -> Optional[str]:
+    """Streaming-mode twin of awake_mode: recognition already ran while the audio arrived."""
+    try:
+        with turns.span("transcribe"):
+            identity, text = await session.finish()
+        if identity is None:
             return None
+        return await respond(identity, text, on_chunk)
+    except asyncio.CancelledError:
+        session.cancel()  # client gone: drop the recognition still running
+        raise
+    except admission.Busy:
+        raise
+    except Exception as e:
+        logger.exception(f"awake_stream error: {e}")
+        return None
 
-        # 2) LLM reply
-        stream = client.chat.completions.create(
-            model=MODEL_ID,
-            stream=True,
-            messages=[
-                {"role": "system", "content": pipa_core.format(now=NOW, memories=from_mem)},
-                {"role": "user", "content": input_text},
-            ],
-        )
-
-        full = []
-        text_buffer = ""
-        sentence_end = re.compile(r"([.!?])")
+
+async def _emit(on_chunk, sentence: str):
+    turn = turns.current()
+    if turn is not None:
+        if not turn.chunks_emitted:
+            # what the listener waits for: first sentence, measured from the message
+            turns.observe("first_sentence", time.perf_counter() - turn.started)
+        turn.chunks_emitted += 1
+    metrics.CHUNKS.inc()
+    await on_chunk(sentence)
+
+
+def _persist_aborted(speaker: str, input_text: str, partial: str):
+    """Journal an interrupted turn according to MEMORY_ON_ABORT ("drop" | "utterance" | "partial")."""
+    turn = turns.current()
+    if turn is not None:
+        turn.reply = partial
+        turn.persisted = MEMORY_ON_ABORT
+    if MEMORY_ON_ABORT == "drop":
+        return
+    if MEMORY_ON_ABORT == "partial" and partial:
+        interaction = f"{input_text}\n\n System Response (interrupted): {partial}"
+    else:
+        interaction = f"{input_text}\n\n System Response: (none, the listener left)"
+    # the task is already being cancelled, so nothing can be awaited: the
+    # insert runs on the default executor and this coroutine does not wait for it
+    asyncio.get_running_loop().run_in_executor(None, _journal_aborted, speaker, interaction)
+
+
+def _journal_aborted(speaker: str, interaction: str):
+    try:
+        get_memory_queue().enqueue(speaker, interaction)
+    except Exception as e:
+        logger.exception(f"could not journal interrupted interaction: {e}")
+
+
+def _count_usage(usage):
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    metrics.LLM_TOKENS.inc("prompt", amount=usage.prompt_tokens - cached)
+    metrics.LLM_TOKENS.inc("cached", amount=cached)
+    metrics.LLM_TOKENS.inc("completion", amount=usage.completion_tokens)
+
+
+async def _stream_reply(input_text: str, speaker: str, from_mem: str, on_chunk, full: list):
+    """Stream the LLM reply into `full`, handing complete sentences to `on_chunk`."""
+    requested = time.perf_counter()
+    stream = await aclient.chat.completions.create(
+        model=MODEL_ID,
+        stream=True,
+        stream_options={"include_usage": True},
+        messages=build_messages(input_text, speaker, from_mem),
+    )
+
+    segmenter = SentenceSegmenter()
+    recorded = [] if REPLY_DELTA_LOG else None
+    t0 = time.monotonic()
+    try:
         # iterate streaming deltas
-        for event in stream:
+        async for event in stream:
+            if getattr(event, "usage", None):
+                # final chunk (include_usage) carries token counts, incl. cached prefix
+                log_usage(event.usage, logger)
+                _count_usage(event.usage)
             # OpenAI Chat Completions stream shape: choices[0].delta.content
-            delta = getattr(event.choices[0].delta, "content", None)
+            delta = getattr(event.choices[0].delta, "content", None) if event.choices else None
             if delta:
+                if not full:
+                    turns.observe("llm_ttft", time.perf_counter() - requested)
                 full.append(delta)
-                text_buffer += delta
-                while True:
-                    match = sentence_end.search(text_buffer)
-                    if not match:
-                        break
-                    end_idx = match.end()
-                    sentence = text_buffer[:end_idx]
-                    text_buffer = text_buffer[end_idx:]
+                metrics.LLM_DELTAS.inc()
+                if recorded is not None:
+                    recorded.append([round(time.monotonic() - t0, 4), delta])
+                for sentence in segmenter.push(delta):
                     if on_chunk:
                         logger.info(f"emitting chunk: {sentence}")
-                        await on_chunk(sentence)
+                        await _emit(on_chunk, sentence)
+    except asyncio.CancelledError:
+        # client gone: close the HTTP stream so generation (and billing) stops upstream
+        await stream.close()
+        raise
 
-        if text_buffer and on_chunk:
-            await on_chunk(text_buffer)
+    tail = segmenter.flush()
+    if tail and on_chunk:
+        await _emit(on_chunk, tail)
+    if recorded:
+        _record_deltas(recorded)
 
-        text_response = "".join(full) if full else ""
 
-        # 3) Persist memory in the background WITHOUT asyncio (we're in a worker thread)
-        interaction = f"{input_text}\n\n System Response: {text_response}"
-        threading.Thread(
-            target=persist_interaction_memory, args=(interaction,), daemon=True
-        ).start()
+async def respond(identity: str, text: str, on_chunk: Optional[Callable[[str], object]] = None) -> Optional[str]:
+    """Memory lookup, streamed LLM reply and background memory write for one utterance."""
+    input_text = (identity + (text or "").strip()).strip()
 
-    except Exception as e:
-        logger.exception(f"awake_mode error: {e}")
+    if not text or not text.strip():
+        logger.info("empty capture.")
         return None
+
+    speaker = speaker_from_identity(identity)
+    full = []
+    try:
+        with turns.span("memory_retrieval"):
+            retrieval = await aretrieve(speaker, document=input_text, top_k=10)
+            from_mem = build_memory_context(retrieval)
+        used = 0 if from_mem == NO_MEMORIES else from_mem.count("\n") + 1  # one line per memory
+        logger.info("Context form mem (%d of %d matches):\n%s",
+                    used, len(retrieval.matches), from_mem)
+        if MEMORY_CONTEXT_LOG:
+            _record_retrieval(input_text, speaker, retrieval)
+
+        # 2) LLM reply
+        # streams are limited separately from turns: they hold a connection for the whole reply
+        async with admission.stage("llm").slot():
+            with turns.span("llm"):
+                await _stream_reply(input_text, speaker, from_mem, on_chunk, full)
+    except asyncio.CancelledError:
+        _persist_aborted(speaker, input_text, "".join(full))
+        raise
+
+    text_response = "".join(full) if full else ""
+
+    # 3) Persist memory write-behind: journal it, the memory workers do the rest
+    interaction = f"{input_text}\n\n System Response: {text_response}"
+    try:
+        with turns.span("persist"):
+            await asyncio.to_thread(get_memory_queue().enqueue, speaker, interaction)
+    except Exception as e:
+        logger.exception(f"could not journal interaction: {e}")
+    return text_response
@@ -6,12 +6,7 @@ from typing import Literal
 from zoneinfo import ZoneInfo
 
 from dotenv import load_dotenv
-from langchain.agents import AgentType, initialize_agent
-from langchain_core.documents import Document
-from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_postgres.vectorstores import PGVector
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 logging.basicConfig(
     level=logging.INFO,
@@ -26,11 +21,136 @@ load_dotenv()
 MODEL_ID = "gpt-5-chat-latest"
 AP_KEY = os.getenv("OPENAI_API_KEY")
 DB_CONNECTION = os.getenv("DB_CONNECTION_STR")
+VOICEPRINT_DB = os.getenv("VOICEPRINT_DB", "voiceprints.npy")
+
+# speaker-embedding micro-batching (SPK_BATCH_MAX=1 disables it)
+SPK_BATCH_MAX = int(os.getenv("SPK_BATCH_MAX", "8"))
+SPK_BATCH_WAIT_MS = float(os.getenv("SPK_BATCH_WAIT_MS", "5"))
+
+# out-of-process speaker ID (SPK_POOL_WORKERS=0 keeps it in-process)
+SPK_POOL_WORKERS = int(os.getenv("SPK_POOL_WORKERS", "0"))
+SPK_POOL_TORCH_THREADS = int(os.getenv("SPK_POOL_TORCH_THREADS", "1"))
+
+# local Vosk model (wake-word spotting / offline STT)
+VOSK_MODEL_PATH = os.getenv("VOSK_MODEL_PATH", "models/vosk-model-small-en-us-0.15")
+# comma-separated phrases the offline wake spotter listens for instead of the
+# wake_up.json keys (e.g. in-vocabulary aliases of a made-up name)
+WAKE_SPOT_PHRASES = [p.strip() for p in os.getenv("WAKE_SPOT_PHRASES", "").split(",") if p.strip()]
+
+# transcription backend policy: cloud | local | local-first | race
+STT_POLICY = os.getenv("STT_POLICY", "cloud")
+STT_LOCAL_MAX_S = float(os.getenv("STT_LOCAL_MAX_S", "4.0"))
+
+# reply chunking: flush the first chunk early (clause after N chars, or after M ms)
+SEGMENT_FIRST_MIN_CHARS = int(os.getenv("SEGMENT_FIRST_MIN_CHARS", "24"))
+SEGMENT_FIRST_MAX_MS = float(os.getenv("SEGMENT_FIRST_MAX_MS", "400"))
+# optional JSONL file that records reply delta streams (bench/segmenter.py)
+REPLY_DELTA_LOG = os.getenv("REPLY_DELTA_LOG")
+
+# captures with less voiced audio than this are dropped before STT/speaker ID
+VAD_MIN_SPEECH_S = float(os.getenv("VAD_MIN_SPEECH_S", "0.3"))
+
+# streaming ingestion: "cloud" (segment-wise uploads) or "vosk" (local, incremental)
+STREAM_STT = os.getenv("STREAM_STT", "cloud")
+STREAM_SPK_WINDOW_S = float(os.getenv("STREAM_SPK_WINDOW_S", "3.0"))
+STREAM_SEGMENT_PAUSE_MS = float(os.getenv("STREAM_SEGMENT_PAUSE_MS", "700"))
+
+# write-behind memory queue: SQLite journal drained by a fixed worker pool
+MEMORY_JOURNAL = os.getenv("MEMORY_JOURNAL", "memory_journal.db")
+MEMORY_WORKERS = int(os.getenv("MEMORY_WORKERS", "2"))
+# per-speaker interactions arriving within this window become one agent run
+MEMORY_COALESCE_S = float(os.getenv("MEMORY_COALESCE_S", "20"))
+MEMORY_MAX_ATTEMPTS = int(os.getenv("MEMORY_MAX_ATTEMPTS", "5"))
+# a claimed batch is re-queued if its worker has not finished it within this many seconds
+MEMORY_LEASE_S = float(os.getenv("MEMORY_LEASE_S", "600"))
+# niceness of the writer threads (Linux), so they yield to the live turn
+MEMORY_WORKER_NICE = int(os.getenv("MEMORY_WORKER_NICE", "10"))
+
+# per-speaker retrieval cache: reuse matches of a recent query within this cosine distance
+MEMORY_CACHE_RADIUS = float(os.getenv("MEMORY_CACHE_RADIUS", "0.08"))
+MEMORY_CACHE_TTL_S = float(os.getenv("MEMORY_CACHE_TTL_S", "300"))
+MEMORY_CACHE_PER_SPEAKER = int(os.getenv("MEMORY_CACHE_PER_SPEAKER", "16"))
+
+# memory writer dedupe: skip a fact this close to an existing one, upsert "updates" above the lower bound
+MEMORY_DUPLICATE_SIM = float(os.getenv("MEMORY_DUPLICATE_SIM", "0.92"))
+MEMORY_UPDATE_SIM = float(os.getenv("MEMORY_UPDATE_SIM", "0.80"))
+
+# consolidation job: merge same-speaker memories at least this similar (0 interval disables)
+MEMORY_MERGE_SIM = float(os.getenv("MEMORY_MERGE_SIM", "0.90"))
+MEMORY_CONSOLIDATE_K = int(os.getenv("MEMORY_CONSOLIDATE_K", "20"))
+MEMORY_CONSOLIDATE_INTERVAL_S = float(os.getenv("MEMORY_CONSOLIDATE_INTERVAL_S", "21600"))
+MEMORY_CONSOLIDATE_STATE = os.getenv("MEMORY_CONSOLIDATE_STATE", "memory_consolidate.json")
+MEMORY_ARCHIVE = os.getenv("MEMORY_ARCHIVE", "memory_archive.jsonl")
+
+# memory block of the per-turn prompt: relevance cutoff, MMR trade-off, token budget
+MEMORY_CONTEXT_MIN_SIM = float(os.getenv("MEMORY_CONTEXT_MIN_SIM", "0.25"))
+MEMORY_CONTEXT_MMR_LAMBDA = float(os.getenv("MEMORY_CONTEXT_MMR_LAMBDA", "0.7"))
+MEMORY_CONTEXT_TOKENS = int(os.getenv("MEMORY_CONTEXT_TOKENS", "160"))
+# optional JSONL file that records each turn's retrieval (bench/memory_context.py)
+MEMORY_CONTEXT_LOG = os.getenv("MEMORY_CONTEXT_LOG")
+
+# memory store: "pgvector" (Postgres) or "local" (in-process, src/local_vectorstore.py)
+MEMORY_BACKEND = os.getenv("MEMORY_BACKEND", "pgvector")
+MEMORY_LOCAL_PATH = os.getenv("MEMORY_LOCAL_PATH", "memories")
+
+# memory partitioning and ANN search (see db/02_memory_hnsw.sql)
+HOUSEHOLD_ID = os.getenv("HOUSEHOLD_ID", "default")
+MEMORY_EMBED_DIM = int(os.getenv("MEMORY_EMBED_DIM", "1536"))
+MEMORY_HNSW_EF_SEARCH = int(os.getenv("MEMORY_HNSW_EF_SEARCH", "40"))
+# pgvector >= 0.8: keep scanning the graph until filtered results fill k ("relaxed_order")
+MEMORY_HNSW_ITERATIVE_SCAN = os.getenv("MEMORY_HNSW_ITERATIVE_SCAN", "")
+
+# memory DB pools: reads (live turn) and writes (background) never share connections
+MEMORY_READ_POOL_SIZE = int(os.getenv("MEMORY_READ_POOL_SIZE", "8"))
+MEMORY_READ_POOL_OVERFLOW = int(os.getenv("MEMORY_READ_POOL_OVERFLOW", "4"))
+MEMORY_WRITE_POOL_SIZE = int(os.getenv("MEMORY_WRITE_POOL_SIZE", "2"))
+MEMORY_WRITE_POOL_OVERFLOW = int(os.getenv("MEMORY_WRITE_POOL_OVERFLOW", "2"))
+MEMORY_DB_RECYCLE_S = int(os.getenv("MEMORY_DB_RECYCLE_S", "1800"))
+# psycopg server-side prepare after N executions of a statement (None disables; use with pgbouncer)
+MEMORY_DB_PREPARE_THRESHOLD = (
+    None if os.getenv("MEMORY_DB_PREPARE_THRESHOLD", "1").lower() == "none"
+    else int(os.getenv("MEMORY_DB_PREPARE_THRESHOLD", "1"))
+)
+
+# admission control (per process): concurrent turns and per-stage limits (0 = unlimited)
+ADMISSION_MAX_TURNS = int(os.getenv("ADMISSION_MAX_TURNS", "8"))
+ADMISSION_MAX_STT = int(os.getenv("ADMISSION_MAX_STT", "8"))
+ADMISSION_MAX_SPEAKER_ID = int(os.getenv("ADMISSION_MAX_SPEAKER_ID", "4"))
+ADMISSION_MAX_LLM = int(os.getenv("ADMISSION_MAX_LLM", "8"))
+# callers allowed to wait per stage, and for how long, before they are told BUSY
+ADMISSION_QUEUE = int(os.getenv("ADMISSION_QUEUE", "16"))
+ADMISSION_WAIT_MS = float(os.getenv("ADMISSION_WAIT_MS", "2000"))
+# per-client token bucket: sustained turns per second and burst size (rate 0 disables)
+ADMISSION_CLIENT_RATE = float(os.getenv("ADMISSION_CLIENT_RATE", "1.0"))
+ADMISSION_CLIENT_BURST = int(os.getenv("ADMISSION_CLIENT_BURST", "5"))
+# header naming the client behind a proxy (e.g. "x-forwarded-for"); default: peer address
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "")
+
+# what an interrupted turn (client gone mid-reply) leaves for the memory writer:
+# "drop" nothing, "utterance" what the speaker said, "partial" that plus the reply so far
+MEMORY_ON_ABORT = os.getenv("MEMORY_ON_ABORT", "utterance")
+# frames buffered per connection while a turn runs (the reader waits when full)
+WS_INBOX_FRAMES = int(os.getenv("WS_INBOX_FRAMES", "256"))
+# an open stream is dropped (and its turn slot freed) after this long without a frame,
+# or this long after its start frame
+STREAM_IDLE_S = float(os.getenv("STREAM_IDLE_S", "10"))
+STREAM_MAX_S = float(os.getenv("STREAM_MAX_S", "120"))
+
+# turns slower than this (ms) log their per-stage breakdown (0 disables);
+# with SLOW_TURN_LOG set it is also appended there as JSON lines
+SLOW_TURN_MS = float(os.getenv("SLOW_TURN_MS", "0"))
+SLOW_TURN_LOG = os.getenv("SLOW_TURN_LOG")
+
+# seconds between warm-up retries while a worker is not ready (e.g. DB still starting)
+STARTUP_RETRY_S = float(os.getenv("STARTUP_RETRY_S", "5"))
 
 client = OpenAI()
+aclient = AsyncOpenAI()
 
-LLM = ChatOpenAI(model="MODEL_ID", max_tokens=1024)
+TIMEZONE = ZoneInfo("Europe/Helsinki")
 
 
-NOW = datetime.now(ZoneInfo("Europe/Helsinki"))
+def local_now() -> datetime:
+    """Current local time; evaluate per request, never cache at import."""
+    return datetime.now(TIMEZONE)
 
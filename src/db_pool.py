@@ -0,0 +1,209 @@
+"""
+Connection pools for the memory store.
+
+Two independent pools, so a burst of background writes (memory agent,
+consolidation) never holds the connections a live turn is waiting on:
+
+- read:  async engine behind `get_async_vector_store()` (retrieval in `respond`)
+- write: sync engine behind `get_vector_store()` (memory workers, agent tools)
+
+Both are sized from config, ping connections on checkout (pool_pre_ping),
+recycle them periodically, and set the HNSW session options on connect.
+psycopg prepares statements server-side after `MEMORY_DB_PREPARE_THRESHOLD`
+executions, so the similarity query is planned once per connection;
+`awarm_read_pool` pre-connects the read pool and runs that query on every
+connection at startup. Checkout counts and pool wait times are kept per pool
+(`pool_stats()`).
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from src.config import (
+    DB_CONNECTION,
+    MEMORY_DB_PREPARE_THRESHOLD,
+    MEMORY_DB_RECYCLE_S,
+    MEMORY_HNSW_EF_SEARCH,
+    MEMORY_HNSW_ITERATIVE_SCAN,
+    MEMORY_READ_POOL_OVERFLOW,
+    MEMORY_READ_POOL_SIZE,
+    MEMORY_WRITE_POOL_OVERFLOW,
+    MEMORY_WRITE_POOL_SIZE,
+    logger,
+)
+
+
+class PoolMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidated = 0
+        self._waits = deque(maxlen=1024)  # seconds spent in Pool._do_get
+        self._lock = threading.Lock()
+
+    def observe_wait(self, seconds: float):
+        with self._lock:
+            self._waits.append(seconds)
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            waits = sorted(self._waits)
+        pct = lambda p: round(waits[int(p * (len(waits) - 1))] * 1000, 2) if waits else 0.0
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "invalidated": self.invalidated,
+            "wait_p50_ms": pct(0.5),
+            "wait_p95_ms": pct(0.95),
+            "wait_max_ms": round(waits[-1] * 1000, 2) if waits else 0.0,
+        }
+
+
+def _timed(base, metrics: PoolMetrics):
+    """`base` pool class whose checkouts record how long they waited."""
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return base._do_get(self)
+        finally:
+            metrics.observe_wait(time.perf_counter() - t0)
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
+
+
+def _connect_args() -> dict:
+    opts = f"-c hnsw.ef_search={MEMORY_HNSW_EF_SEARCH}"
+    if MEMORY_HNSW_ITERATIVE_SCAN:
+        opts += f" -c hnsw.iterative_scan={MEMORY_HNSW_ITERATIVE_SCAN}"
+    return {"options": opts, "prepare_threshold": MEMORY_DB_PREPARE_THRESHOLD}
+
+
+def _instrument(pool, metrics: PoolMetrics):
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_conn, record):
+        metrics.connects += 1
+
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_conn, record, proxy):
+        metrics.checkouts += 1
+
+    @event.listens_for(pool, "invalidate")
+    def _on_invalidate(dbapi_conn, record, exc):
+        metrics.invalidated += 1
+
+
+_METRICS = {"read": PoolMetrics("read"), "write": PoolMetrics("write")}
+_ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+
+
+def get_write_engine():
+    with _ENGINES_LOCK:
+        if "write" not in _ENGINES:
+            engine = create_engine(
+                DB_CONNECTION,
+                poolclass=_timed(QueuePool, _METRICS["write"]),
+                pool_size=MEMORY_WRITE_POOL_SIZE,
+                max_overflow=MEMORY_WRITE_POOL_OVERFLOW,
+                pool_pre_ping=True,
+                pool_recycle=MEMORY_DB_RECYCLE_S,
+                connect_args=_connect_args(),
+            )
+            _instrument(engine.pool, _METRICS["write"])
+            _ENGINES["write"] = engine
+        return _ENGINES["write"]
+
+
+def get_read_engine():
+    with _ENGINES_LOCK:
+        if "read" not in _ENGINES:
+            engine = create_async_engine(
+                DB_CONNECTION,
+                poolclass=_timed(AsyncAdaptedQueuePool, _METRICS["read"]),
+                pool_size=MEMORY_READ_POOL_SIZE,
+                max_overflow=MEMORY_READ_POOL_OVERFLOW,
+                pool_pre_ping=True,
+                pool_recycle=MEMORY_DB_RECYCLE_S,
+                connect_args=_connect_args(),
+            )
+            _instrument(engine.sync_engine.pool, _METRICS["read"])
+            _ENGINES["read"] = engine
+        return _ENGINES["read"]
+
+
+async def awarm_read_pool(search, dim: int):
+    """
+    Fill the read pool and prepare the similarity query on every connection:
+    `pool_size` concurrent searches each hold their own connection.
+    """
+    probe = [1.0] + [0.0] * (dim - 1)
+    t0 = time.perf_counter()
+    results = await asyncio.gather(
+        *(search(probe) for _ in range(MEMORY_READ_POOL_SIZE)), return_exceptions=True
+    )
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        logger.warning("read pool warm-up: %d/%d failed: %s", len(errors), len(results), errors[0])
+    logger.info(
+        "read pool warm: %d connections in %.0f ms",
+        len(results) - len(errors), (time.perf_counter() - t0) * 1000,
+    )
+
+
+def warm_write_pool():
+    """Open `pool_size` write connections up front (in parallel) and return them to the pool."""
+    engine = get_write_engine()
+    conns = []
+
+    def _open():
+        try:
+            conns.append(engine.connect())
+        except Exception as e:
+            logger.warning("write pool warm-up: %s", e)
+
+    threads = [threading.Thread(target=_open) for _ in range(MEMORY_WRITE_POOL_SIZE)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for c in conns:
+        c.close()
+
+
+async def ahealth() -> dict:
+    """SELECT 1 through both pools; {"read": "ok" | error, "write": ...}."""
+
+    async def _read():
+        async with get_read_engine().connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    def _write():
+        with get_write_engine().connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    out = {}
+    for name, check in (("read", _read()), ("write", asyncio.to_thread(_write))):
+        try:
+            await asyncio.wait_for(check, timeout=2.0)
+            out[name] = "ok"
+        except Exception as e:
+            out[name] = f"error: {e!r}"
+    return out
+
+
+def pool_stats() -> dict:
+    out = {}
+    for name, engine in list(_ENGINES.items()):
+        pool = engine.sync_engine.pool if name == "read" else engine.pool
+        out[name] = _METRICS[name].snapshot(pool)
+    return out
@@ -1,34 +1,43 @@
-import json
-from pathlib import Path
+import threading
 
 import numpy as np
-import torch
-import torchaudio
-from speechbrain.inference import EncoderClassifier
 
-# load once
-classifier = EncoderClassifier.from_hparams(
-    source="speechbrain/spkrec-ecapa-voxceleb", run_opts={"device": "cpu"}
-)
+# torch / torchaudio are imported where they are used, so the server can be
+# imported without them; `startup.warm_models` loads them before any request
+from src.audio_front import DecodedAudio, get_resampler, to_16k_mono
+from src.config import VOICEPRINT_DB, logger
+from src.vad import detect_speech
+from src.voiceprint_store import VoiceprintStore, migrate_json
 
-torch.amp.custom_fwd(device_type="cpu", cast_inputs=torch.float16)
-def fwd(x):
-    return x * 2
+ECAPA_SOURCE = "speechbrain/spkrec-ecapa-voxceleb"
+
+_CLASSIFIER = None
+_CLASSIFIER_LOCK = threading.Lock()
+
+
+def get_classifier():
+    """
+    The ECAPA encoder, loaded once per process on first use (or by
+    `startup.warm_models` in the gunicorn master, before workers fork).
+    """
+    global _CLASSIFIER
+    with _CLASSIFIER_LOCK:
+        if _CLASSIFIER is None:
+            # speechbrain pulls in most of its package on import; keep it off the import path
+            from speechbrain.inference import EncoderClassifier
+
+            logger.info("Loading ECAPA classifier %s", ECAPA_SOURCE)
+            _CLASSIFIER = EncoderClassifier.from_hparams(
+                source=ECAPA_SOURCE, run_opts={"device": "cpu"}
+            )
+            _CLASSIFIER.eval()
+        return _CLASSIFIER
 
-wrapped_fwd = torch.amp.custom_fwd(fwd, device_type="cpu", cast_inputs=torch.float16)
 
 def _ensure_16k_mono(wav, sr):
     """Resample to 16kHz mono tensor (1, samples)."""
     if sr != 16000:
-        resampler = torchaudio.transforms.Resample(
-            orig_freq=sr,
-            new_freq=16000,
-            lowpass_filter_width=64,
-            rolloff=0.9475937167399596,
-            resampling_method="sinc_interp_kaiser",
-            beta=14.769656459379492,
-        )
-        wav = resampler(wav)
+        wav = get_resampler(sr)(wav)
     # mono: average channels
     if wav.dim() == 2 and wav.size(0) > 1:
         wav = wav.mean(dim=0, keepdim=True)
@@ -40,30 +49,25 @@ def _ensure_16k_mono(wav, sr):
 def _trim_long_silences(wav, sample_rate=16000, max_silence_sec=5):
     """
     Remove silence longer than max_silence_sec at beginning/end.
-    Uses simple energy thresholding.
+    Speech is located with the frame-level VAD.
     """
-    energy = wav.abs().mean(dim=0)
-    threshold = 0.001  # tweakable
-    active = energy > threshold
-    if not active.any():
+    speech = detect_speech(wav.mean(dim=0).numpy(), sample_rate, pad_ms=max_silence_sec * 1000)
+    if not speech.has_speech:
         return wav
-
-    idx = active.nonzero().squeeze()
-    start, end = idx[0].item(), idx[-1].item()
-
-    # shrink silence windows > max_silence_sec
-    max_silence = int(max_silence_sec * sample_rate)
-    if start > max_silence:
-        start = max_silence
-    if (wav.size(1) - end) > max_silence:
-        end = wav.size(1) - max_silence
-    return wav[:, start:end]
+    return wav[:, speech.start : speech.end]
 
 
-def wav_to_embedding(file_or_path):
+def load_16k_mono(file_or_path):
     """
-    Accepts either a filesystem path OR a file-like object (BytesIO).
+    Accepts a filesystem path, a file-like object (BytesIO) or an already
+    decoded `DecodedAudio`. Returns the trimmed 16 kHz mono waveform,
+    shape (1, samples).
     """
+    if isinstance(file_or_path, DecodedAudio):
+        return _trim_long_silences(to_16k_mono(file_or_path))
+
+    import torchaudio
+
     # Load WAV (handle BytesIO or path)
     if hasattr(file_or_path, "read"):
         file_or_path.seek(0)  # important for BytesIO
@@ -72,53 +76,70 @@ def wav_to_embedding(file_or_path):
         wav, sr = torchaudio.load(file_or_path)
 
     wav = _ensure_16k_mono(wav, sr)
-    wav = _trim_long_silences(wav)
+    return _trim_long_silences(wav)
 
-    with torch.no_grad():
-        emb = classifier.encode_batch(wav)  # (1, 192) expected
-    emb = emb.squeeze(0).cpu().numpy()
 
+def _unit_embeddings(emb):
+    """(batch, dim) array -> finite, unit-normalized rows (zero rows stay zero)."""
     # Make the embedding robust
     if not np.isfinite(emb).all():
         # replace NaNs/inf with zeros (or small eps)
         emb = np.nan_to_num(emb, nan=0.0, posinf=0.0, neginf=0.0)
 
-    norm = np.linalg.norm(emb)
-    if norm > 0:
-        emb = emb / norm
-    else:
-        # fallback: return a zero vector instead of None/Falsey
-        emb = np.zeros_like(emb)
+    norms = np.linalg.norm(emb, axis=-1, keepdims=True)
+    # fallback: zero vector instead of None/Falsey
+    return np.divide(emb, norms, out=np.zeros_like(emb), where=norms > 0)
+
+
+def embed_batch(wavs):
+    """
+    Embed several 16 kHz mono waveforms (each (1, samples)) in one
+    `encode_batch` call. Shorter clips are zero-padded and masked through
+    relative lengths. Returns a list of unit-normalized embeddings.
+    """
+    import torch
 
-    return emb
+    lengths = [w.size(-1) for w in wavs]
+    longest = max(lengths)
+    batch = torch.zeros(len(wavs), longest)
+    for i, w in enumerate(wavs):
+        batch[i, : lengths[i]] = w.reshape(-1)
+    rel_lens = torch.tensor([n / longest for n in lengths])
 
+    with torch.no_grad():
+        emb = get_classifier().encode_batch(batch, rel_lens)  # (batch, 1, 192)
+    emb = _unit_embeddings(emb.reshape(len(wavs), -1).cpu().numpy())
+    return list(emb)
 
-def enroll(person, wav_paths, out_json="voiceprints.json"):
-    db = json.loads(Path(out_json).read_text()) if Path(out_json).exists() else {}
 
-    # compute embeddings for each clip (unit-normalized inside wav_to_embedding)
-    embs = [wav_to_embedding(p) for p in wav_paths]
+def wav_to_embedding(file_or_path):
+    """
+    Accepts a filesystem path, a file-like object (BytesIO) or a `DecodedAudio`.
+    """
+    import torch
 
-    # store as a list of vectors rather than a single mean
-    existing = db.get(person, [])
-    if (
-        isinstance(existing, list)
-        and existing
-        and isinstance(existing[0], (list, tuple))
-    ):
-        existing_vecs = existing
-    elif isinstance(existing, list) and existing:
-        # was a single vector before; convert to list of vectors
-        existing_vecs = [existing]
-    else:
-        existing_vecs = []
+    wav = load_16k_mono(file_or_path)
+
+    with torch.no_grad():
+        emb = get_classifier().encode_batch(wav)  # (1, 192) expected
+    emb = emb.reshape(1, -1).cpu().numpy()
+
+    return _unit_embeddings(emb)[0]
 
-    existing_vecs.extend(e.tolist() for e in embs)
-    db[person] = existing_vecs
 
-    Path(out_json).write_text(json.dumps(db, indent=2))
+def enroll(person, wav_paths, store_path=VOICEPRINT_DB):
+    """Append one template per clip for `person`; existing templates are not rewritten."""
+    # compute embeddings for each clip (unit-normalized inside wav_to_embedding)
+    embs = [wav_to_embedding(p) for p in wav_paths]
+
+    store = VoiceprintStore(store_path)
+    legacy = store.matrix_path.with_suffix(".json")
+    if not store.exists() and legacy.exists():
+        # carry the people enrolled in the old JSON file over before appending
+        migrate_json(legacy, store_path)
+    total = store.append(person, embs, sources=[str(p) for p in wav_paths])
     print(
-        f"Enrolled {person} with {len(wav_paths)} new clips; total templates now {len(existing_vecs)}."
+        f"Enrolled {person} with {len(wav_paths)} new clips; store now holds {total} templates."
     )
 
 
@@ -0,0 +1,567 @@
+"""
+In-process vector store for small single-home deployments (no Postgres).
+
+Layout (for the default base ``memories``):
+
+    memories.jsonl     document log: a {"op": "meta", "gen", "dim"} header, then
+                       {"op": "add", "id", "text", "metadata"} / {"op": "del", "id"}
+    memories.<gen>.npy float32 (n_added, dim) matrix of unit embeddings; row i
+                       belongs to the i-th "add" record of the log
+
+Appends follow the voiceprint store's ordering: matrix rows first, then log
+lines, then the fixed-size .npy header. On open, only rows that are both on
+disk and in the log are trusted, so a crash mid-append loses at most that
+append. Deletes (and upserts) only log a tombstone; once dead rows pass
+`compact_ratio`, a background thread rewrites live rows into
+``memories.<gen+1>.npy`` plus a fresh log, and the atomic replace of the log
+is the commit point.
+
+Several processes (gunicorn workers) may share the files. Every write,
+delete and compaction runs under an exclusive `fcntl` lock on
+``memories.lock`` and first replays the log records other processes
+appended (or reloads after their compaction), so rows are always appended
+at the end the log agrees on. Readers notice a grown or replaced log with
+one `stat` per search and catch up the same way, without taking the lock.
+
+Searches are exact: one matrix-vector product over the memory-mapped
+matrix, metadata filters become a boolean mask, and scores are cosine
+*distances* (lower is closer) like PGVector's default strategy. Readers
+work on an immutable snapshot, so they never wait for writers or compaction.
+"""
+import asyncio
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable, Optional
+from uuid import uuid4
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from src.config import logger
+from src.voiceprint_store import _HEADER_LEN, _npy_header
+
+
+def _unit(rows) -> np.ndarray:
+    rows = np.asarray(rows, dtype=np.float32)
+    if rows.ndim == 1:
+        rows = rows[None, :]
+    norms = np.linalg.norm(rows, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(rows / norms, dtype="<f4")
+
+
+def _fsync_write(f, data: bytes):
+    f.write(data)
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class _Snapshot:
+    """
+    Immutable view used by readers; writers publish a new one. `row_of`
+    maps each live id to its row, so a reader holding one snapshot never
+    pairs an id with a row of another.
+    """
+
+    __slots__ = ("matrix", "ids", "texts", "metas", "alive", "row_of", "_columns")
+
+    def __init__(self, matrix, ids, texts, metas, alive, row_of):
+        self.matrix = matrix
+        self.ids = ids
+        self.texts = texts
+        self.metas = metas
+        self.alive = alive
+        self.row_of = row_of
+        self._columns = {}
+
+    def column(self, field: str) -> np.ndarray:
+        col = self._columns.get(field)
+        if col is None:
+            col = np.array([m.get(field) for m in self.metas], dtype=object)
+            self._columns[field] = col
+        return col
+
+    def mask(self, filter: Optional[dict]) -> np.ndarray:
+        mask = self.alive.copy()
+        for field, cond in (filter or {}).items():
+            col = self.column(field)
+            if isinstance(cond, dict):
+                for op, value in cond.items():
+                    if op == "$eq":
+                        mask &= col == value
+                    elif op == "$ne":
+                        mask &= col != value
+                    elif op == "$in":
+                        mask &= np.isin(col, list(value))
+                    elif op == "$nin":
+                        mask &= ~np.isin(col, list(value))
+                    else:
+                        raise ValueError(f"unsupported filter operator: {op}")
+            else:
+                mask &= col == cond
+        return mask
+
+
+class LocalVectorStore(VectorStore):
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: Optional[str] = "memories",
+        dim: Optional[int] = None,
+        compact_ratio: float = 0.3,
+        compact_min_dead: int = 256,
+    ):
+        self._embedding = embedding
+        self.path = Path(path) if path else None  # None: RAM only, nothing persisted
+        self.compact_ratio = compact_ratio
+        self.compact_min_dead = compact_min_dead
+        self._write_lock = threading.Lock()
+        self._compacting = False
+        self._gen = 0
+        self._dim = dim
+        self._log_seen = None  # (inode, bytes replayed) of the log this process has caught up with
+        self._snap = _Snapshot(np.zeros((0, dim or 0), dtype="<f4"), [], [], [], np.zeros(0, bool), {})
+        if self.path is not None and self.log_path.exists():
+            with self._locked():
+                self._load(repair=True)
+
+    # ---- files -------------------------------------------------------------
+
+    @property
+    def log_path(self) -> Path:
+        return self.path.with_suffix(".jsonl")
+
+    @property
+    def lock_path(self) -> Path:
+        return self.path.with_suffix(".lock")
+
+    def _matrix_path(self, gen: int) -> Path:
+        return self.path.with_suffix(f".{gen}.npy")
+
+    def _file_rows(self, gen: int) -> int:
+        p = self._matrix_path(gen)
+        return (os.path.getsize(p) - _HEADER_LEN) // (self._dim * 4) if p.exists() else 0
+
+    def _map(self, n: int) -> np.ndarray:
+        if n == 0:
+            return np.zeros((0, self._dim), dtype="<f4")
+        return np.memmap(
+            self._matrix_path(self._gen), dtype="<f4", mode="r", offset=_HEADER_LEN,
+            shape=(n, self._dim),
+        )
+
+    @contextmanager
+    def _locked(self):
+        """This process's write lock plus, for a persisted store, the cross-process file lock."""
+        with self._write_lock:
+            if self.path is None:
+                yield
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a+b") as lock:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _read_log(self, offset: int = 0):
+        """Return (meta, ops, end offset of the intact prefix), reading from byte `offset`."""
+        meta, ops, good = None, [], offset
+        with open(self.log_path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn final line from an interrupted append
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                good += len(line)
+                if rec.get("op") == "meta":
+                    meta = rec
+                else:
+                    ops.append(rec)
+        return meta, ops, good
+
+    def _replay(self, ops, ids, texts, metas, alive, row_of, n_rows: int) -> int:
+        """Apply log records to the row lists and id map (in place); returns how many were applied."""
+        for n, rec in enumerate(ops):
+            if rec["op"] == "add":
+                if len(ids) >= n_rows:
+                    return n  # log line written, matrix row not: interrupted append
+                if rec["id"] in row_of:
+                    alive[row_of[rec["id"]]] = False
+                row_of[rec["id"]] = len(ids)
+                ids.append(rec["id"])
+                texts.append(rec["text"])
+                metas.append(rec.get("metadata") or {})
+                alive.append(True)
+            elif rec["op"] == "del":
+                row = row_of.pop(rec["id"], None)
+                if row is not None:
+                    alive[row] = False
+        return len(ops)
+
+    def _load(self, repair: bool):
+        """
+        (Re)build the state from the files. With `repair` (only under the
+        file lock) a torn log tail is cut and leftovers of an interrupted
+        compaction are removed.
+        """
+        ino = os.stat(self.log_path).st_ino
+        meta, ops, good = self._read_log()
+        if meta is None:
+            raise ValueError(f"{self.log_path} has no meta header")
+        self._gen, self._dim = meta["gen"], meta["dim"]
+        ids, texts, metas, alive, row_of = [], [], [], [], {}
+        applied = self._replay(ops, ids, texts, metas, alive, row_of, self._file_rows(self._gen))
+
+        self._log_seen = (ino, good)
+        if repair:
+            if applied < len(ops) or good < os.path.getsize(self.log_path):
+                self._rewrite_log(self._gen, ops[:applied])
+            for stray in self.path.parent.glob(self.path.name + ".*.npy"):
+                if stray != self._matrix_path(self._gen):
+                    stray.unlink(missing_ok=True)  # leftovers of an interrupted compaction
+
+        self._snap = _Snapshot(self._map(len(ids)), ids, texts, metas, np.array(alive, bool), row_of)
+        logger.info(
+            "local memory store: %d documents (%d rows) from %s",
+            int(self._snap.alive.sum()), len(ids), self.log_path,
+        )
+
+    def _stale(self) -> bool:
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return False
+        return self._log_seen is None or (st.st_ino, st.st_size) != self._log_seen
+
+    def _catch_up(self, repair: bool):
+        """Pick up what other processes wrote since this one last looked (caller holds `_write_lock`)."""
+        if not self._stale():
+            return
+        ino = os.stat(self.log_path).st_ino
+        if self._log_seen is None or ino != self._log_seen[0]:
+            self._load(repair)  # first sight of the log, or another process compacted it
+            return
+        meta, ops, good = self._read_log(self._log_seen[1])
+        snap = self._snap
+        ids, texts, metas = list(snap.ids), list(snap.texts), list(snap.metas)
+        alive, row_of = snap.alive.tolist(), dict(snap.row_of)
+        if self._replay(ops, ids, texts, metas, alive, row_of, self._file_rows(self._gen)) < len(ops):
+            self._load(repair)
+            return
+        if repair and good < os.path.getsize(self.log_path):
+            os.truncate(self.log_path, good)  # torn line of a writer that died mid-append
+        self._log_seen = (ino, good)
+        if ops:
+            self._snap = _Snapshot(self._map(len(ids)), ids, texts, metas, np.array(alive, bool), row_of)
+
+    def _refresh(self):
+        """Reader side of `_catch_up`: skipped while this process is writing (that catches up anyway)."""
+        if self.path is None or not self._stale() or not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            self._catch_up(repair=False)
+        finally:
+            self._write_lock.release()
+
+    def _rewrite_log(self, gen: int, ops: list):
+        tmp = self.log_path.with_suffix(".jsonl.tmp")
+        with open(tmp, "wb") as f:
+            lines = [json.dumps({"op": "meta", "gen": gen, "dim": self._dim})]
+            lines += [json.dumps(r, ensure_ascii=False) for r in ops]
+            _fsync_write(f, ("\n".join(lines) + "\n").encode("utf-8"))
+        os.replace(tmp, self.log_path)
+        st = os.stat(self.log_path)
+        self._log_seen = (st.st_ino, st.st_size)
+
+    def _append_log(self, records: list):
+        with open(self.log_path, "ab") as f:
+            data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+            _fsync_write(f, data.encode("utf-8"))
+            self._log_seen = (os.fstat(f.fileno()).st_ino, f.tell())
+
+    # ---- writes ------------------------------------------------------------
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_embeddings(
+        self,
+        texts: list[str],
+        embeddings,
+        metadatas: Optional[list[dict]] = None,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Same signature as PGVector.add_embeddings: store pre-computed vectors."""
+        metadatas = [dict(m or {}) for m in (metadatas or [{}] * len(texts))]
+        ids = [i or uuid4().hex for i in (ids or [None] * len(texts))]
+        rows = _unit(embeddings)
+        with self._locked():
+            if self.path is not None:
+                self._catch_up(repair=True)
+            snap = self._snap
+            if self._dim is None:
+                self._dim = rows.shape[1]
+            if rows.shape[1] != self._dim:
+                raise ValueError(f"embedding has dim {rows.shape[1]}, store expects {self._dim}")
+            start = len(snap.ids)
+            alive = np.concatenate([snap.alive, np.ones(len(ids), bool)])
+            row_of = dict(snap.row_of)
+            for i in ids:
+                if i in row_of:  # upsert: the old row becomes a tombstone
+                    alive[row_of[i]] = False
+
+            if self.path is not None:
+                self._persist_rows(start, rows)
+                self._append_log(
+                    [{"op": "add", "id": i, "text": t, "metadata": m}
+                     for i, t, m in zip(ids, texts, metadatas)]
+                )
+                total = start + len(ids)
+                with open(self._matrix_path(self._gen), "r+b") as f:
+                    _fsync_write(f, _npy_header(total, self._dim))
+                matrix = self._map(total)
+            else:
+                matrix = np.concatenate([np.asarray(snap.matrix).reshape(-1, self._dim), rows])
+
+            for n, i in enumerate(ids):
+                row_of[i] = start + n
+            self._snap = _Snapshot(
+                matrix, snap.ids + list(ids), snap.texts + list(texts),
+                snap.metas + list(metadatas), alive, row_of,
+            )
+        self._maybe_compact()
+        return list(ids)
+
+    def _persist_rows(self, start: int, rows: np.ndarray):
+        path = self._matrix_path(self._gen)
+        if not self.log_path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._rewrite_log(self._gen, [])
+            with open(path, "wb") as f:
+                _fsync_write(f, _npy_header(0, self._dim))
+        with open(path, "r+b") as f:
+            f.truncate(_HEADER_LEN + start * self._dim * 4)  # drop rows of a torn append
+            f.seek(0, os.SEEK_END)
+            _fsync_write(f, rows.tobytes())
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = [dict(m or {}) for m in (metadatas or [{}] * len(texts))]
+        ids = [i or uuid4().hex for i in (ids or [None] * len(texts))]
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_embeddings(texts, vectors, metadatas, ids)
+
+    async def aadd_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[list[dict]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = [dict(m or {}) for m in (metadatas or [{}] * len(texts))]
+        ids = [i or uuid4().hex for i in (ids or [None] * len(texts))]
+        vectors = await self._embedding.aembed_documents(texts)
+        return await asyncio.to_thread(self.add_embeddings, texts, vectors, metadatas, ids)
+
+    def delete(self, ids: Optional[list[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        with self._locked():
+            if self.path is not None:
+                self._catch_up(repair=True)
+            snap = self._snap
+            row_of = dict(snap.row_of)
+            rows = [row_of.pop(i) for i in ids if i in row_of]
+            if not rows:
+                return False
+            if self.path is not None:
+                self._append_log([{"op": "del", "id": i} for i in ids])
+            alive = snap.alive.copy()
+            alive[rows] = False
+            self._snap = _Snapshot(snap.matrix, snap.ids, snap.texts, snap.metas, alive, row_of)
+        self._maybe_compact()
+        return True
+
+    # ---- compaction --------------------------------------------------------
+
+    def dead_rows(self) -> int:
+        snap = self._snap
+        return len(snap.ids) - int(snap.alive.sum())
+
+    def _maybe_compact(self):
+        dead, total = self.dead_rows(), len(self._snap.ids)
+        if self._compacting or dead < self.compact_min_dead or dead < self.compact_ratio * total:
+            return
+        self._compacting = True
+        threading.Thread(target=self.compact, name="memory-compact", daemon=True).start()
+
+    def compact(self):
+        """Rewrite live rows into a new generation; readers keep the old snapshot meanwhile."""
+        try:
+            with self._locked():
+                if self.path is not None:
+                    self._catch_up(repair=True)
+                snap = self._snap
+                keep = np.flatnonzero(snap.alive)
+                if len(keep) == len(snap.ids):
+                    return  # another process compacted first
+                rows = np.ascontiguousarray(np.asarray(snap.matrix)[keep], dtype="<f4")
+                ids = [snap.ids[i] for i in keep]
+                texts = [snap.texts[i] for i in keep]
+                metas = [snap.metas[i] for i in keep]
+
+                if self.path is not None:
+                    gen = self._gen + 1
+                    with open(self._matrix_path(gen), "wb") as f:
+                        _fsync_write(f, _npy_header(len(ids), self._dim) + rows.tobytes())
+                    self._rewrite_log(
+                        gen,
+                        [{"op": "add", "id": i, "text": t, "metadata": m}
+                         for i, t, m in zip(ids, texts, metas)],
+                    )  # commit point
+                    old, self._gen = self._matrix_path(self._gen), gen
+                    matrix = self._map(len(ids))
+                    old.unlink(missing_ok=True)  # open memmaps keep their pages until released
+                else:
+                    matrix = rows
+
+                row_of = {i: n for n, i in enumerate(ids)}
+                self._snap = _Snapshot(matrix, ids, texts, metas, np.ones(len(ids), bool), row_of)
+            logger.info("local memory store compacted: %d -> %d rows", len(snap.ids), len(ids))
+        finally:
+            self._compacting = False
+
+    # ---- reads -------------------------------------------------------------
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        self._refresh()
+        snap = self._snap
+        if not snap.ids or k <= 0:
+            return []
+        mask = snap.mask(filter)
+        candidates = np.flatnonzero(mask)
+        if candidates.size == 0:
+            return []
+        # scoring every row and masking beats gathering the candidate rows first
+        sims = np.asarray(snap.matrix @ _unit(embedding)[0])
+        sims[~mask] = -np.inf
+        k = min(k, candidates.size)
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [
+            (
+                Document(id=snap.ids[r], page_content=snap.texts[r], metadata=dict(snap.metas[r])),
+                float(1.0 - sims[r]),
+            )
+            for r in top
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self._embedding.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[Document]:
+        return [d for d, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[Document]:
+        return [
+            d for d, _ in self.similarity_search_with_score_by_vector(embedding, k=k, filter=filter)
+        ]
+
+    # the search itself takes microseconds: no executor hop, only the embedding is awaited
+    async def asimilarity_search_with_score_by_vector(
+        self, embedding: list[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(embedding, k=k, filter=filter)
+
+    async def asimilarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        embedding = await self._embedding.aembed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k=k, filter=filter)
+
+    def get_by_ids(self, ids, /) -> list[Document]:
+        self._refresh()
+        snap = self._snap
+        out = []
+        for i in ids:
+            r = snap.row_of.get(i)
+            if r is not None:
+                out.append(Document(id=i, page_content=snap.texts[r], metadata=dict(snap.metas[r])))
+        return out
+
+    def vectors(self, ids) -> dict:
+        """{id: unit embedding} for the live ids among `ids`."""
+        self._refresh()
+        snap = self._snap
+        out = {}
+        for i in ids:
+            r = snap.row_of.get(i)
+            if r is not None:
+                out[i] = np.asarray(snap.matrix[r])
+        return out
+
+    def rows(self):
+        """Live rows as (ids, texts, metadatas, (n, dim) unit matrix); a consistent snapshot."""
+        self._refresh()
+        snap = self._snap
+        keep = np.flatnonzero(snap.alive)
+        return (
+            [snap.ids[i] for i in keep],
+            [snap.texts[i] for i in keep],
+            [snap.metas[i] for i in keep],
+            np.asarray(snap.matrix)[keep],
+        )
+
+    def __len__(self) -> int:
+        return int(self._snap.alive.sum())
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        path: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding, path=path, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
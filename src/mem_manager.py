@@ -1,17 +1,27 @@
+import asyncio
+import json
 import logging
 import os
 import sys
+import threading
+import time
 from typing import Literal
 from uuid import uuid4
 
 from dotenv import load_dotenv
-from langchain.agents import AgentType, initialize_agent
 from langchain_core.documents import Document
 from langchain_core.tools import tool
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_postgres.vectorstores import PGVector
 
-from src.config import client, logger
+from src import turns
+from src.config import (
+    HOUSEHOLD_ID,
+    MEMORY_BACKEND,
+    MEMORY_EMBED_DIM,
+    MEMORY_LOCAL_PATH,
+    client,
+    logger,
+)
 from langchain_core.runnables import RunnableLambda
 
 DB_CONNECTION = os.getenv("DB_CONNECTION_STR")
@@ -20,14 +30,140 @@ LLM = ChatOpenAI(model="gpt-4o-mini", max_tokens=1024)
 
 Embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
 
+# memories not tied to one person (and every memory written before tagging)
+SHARED_SPEAKER = "*"
+# speaker ids of unidentified voices (whos_voice / transcribe._compose)
+_ANONYMOUS = frozenset({"unknown", "Someone"})
 
-VectorStore = PGVector(
-    embeddings=Embeddings,
-    collection_name="docs_demo",
-    connection=DB_CONNECTION,
-    use_jsonb=True,            # recommended
-    create_extension=True,     # ensure vector extension is present
-)
+if MEMORY_BACKEND not in ("local", "pgvector"):
+    raise ValueError(f"unknown MEMORY_BACKEND: {MEMORY_BACKEND}")
+if MEMORY_BACKEND == "pgvector":
+    from src.db_pool import awarm_read_pool, get_read_engine, get_write_engine, warm_write_pool
+
+_STORES = None
+_STORES_LOCK = threading.Lock()
+
+
+def _build_stores():
+    if MEMORY_BACKEND == "local":
+        from src.local_vectorstore import LocalVectorStore
+
+        # one in-process store serves both paths; searches never leave the process
+        store = LocalVectorStore(Embeddings, path=MEMORY_LOCAL_PATH, dim=MEMORY_EMBED_DIM)
+        return store, store
+
+    from langchain_postgres.vectorstores import PGVector
+
+    sync_store = PGVector(
+        embeddings=Embeddings,
+        collection_name="docs_demo",
+        connection=get_write_engine(),      # background write pool (see db_pool)
+        embedding_length=MEMORY_EMBED_DIM,  # fixed dimension, required by the HNSW index
+        use_jsonb=True,            # recommended
+        create_extension=True,     # ensure vector extension is present
+    )
+
+    # Same collection over the async read pool, for reads on the event loop
+    async_store = PGVector(
+        embeddings=Embeddings,
+        collection_name="docs_demo",
+        connection=get_read_engine(),
+        embedding_length=MEMORY_EMBED_DIM,
+        use_jsonb=True,
+        create_extension=False,    # the sync store above already ensured it
+        async_mode=True,
+    )
+    return sync_store, async_store
+
+
+def _stores():
+    # built on first use, not at import: the sync PGVector talks to the
+    # database in its constructor (extension, tables, collection)
+    global _STORES
+    with _STORES_LOCK:
+        if _STORES is None:
+            _STORES = _build_stores()
+        return _STORES
+
+
+def get_vector_store():
+    """Sync store on the write pool: memory workers, consolidation, agent tools."""
+    return _stores()[0]
+
+
+def get_async_vector_store():
+    """Async store on the read pool: retrieval on the event loop."""
+    return _stores()[1]
+
+
+def memory_metadata(speaker: str = SHARED_SPEAKER) -> dict:
+    # "added" lets the consolidation job only look at rows written since its last run
+    return {"household": HOUSEHOLD_ID, "speaker": speaker or SHARED_SPEAKER, "added": time.time()}
+
+
+def memory_filter(speaker: str = None) -> dict:
+    """
+    This household's memories: the speaker's own plus the shared ones.
+
+    Only `$in`: with use_jsonb, PGVector compiles it to
+    `cmetadata->>'field' IN (...)`, which ix_memory_household_speaker
+    serves, while `$eq` becomes a jsonb_path_match() no index can use.
+    """
+    if not speaker or speaker == SHARED_SPEAKER or speaker in _ANONYMOUS:
+        return {"household": {"$in": [HOUSEHOLD_ID]}}
+    return {
+        "household": {"$in": [HOUSEHOLD_ID]},
+        "speaker": {"$in": [speaker, SHARED_SPEAKER]},
+    }
+
+
+async def awarm_pools():
+    """
+    Build the stores and pre-connect both pools; read connections also
+    prepare the similarity query. The local store only loads its files.
+    """
+    await asyncio.to_thread(_stores)
+    if MEMORY_BACKEND != "pgvector":
+        return
+    await asyncio.to_thread(warm_write_pool)
+    store = get_async_vector_store()
+    await awarm_read_pool(
+        lambda v: store.asimilarity_search_with_score_by_vector(
+            v, k=1, filter=memory_filter()
+        ),
+        MEMORY_EMBED_DIM,
+    )
+
+
+def _matches(results):
+    return [
+        {
+            "id": d.id or d.metadata.get("id"),
+            "content": d.page_content,
+            "metadata": d.metadata,
+            "score": float(score),
+        }
+        for d, score in results
+    ]
+
+
+async def afetch_vectors(ids: list) -> dict:
+    """Stored (unit) embeddings of the given memory ids, {id: vector}; unknown ids are omitted."""
+    ids = [i for i in ids if i]
+    if not ids:
+        return {}
+    if MEMORY_BACKEND == "local":
+        return get_async_vector_store().vectors(ids)
+
+    from sqlalchemy import text
+
+    with turns.span("memory_vectors"):
+        async with get_read_engine().connect() as conn:
+            result = await conn.execute(
+                text("SELECT id, embedding::text FROM langchain_pg_embedding WHERE id = ANY(:ids)"),
+                {"ids": ids},
+            )
+            return {i: json.loads(emb) for i, emb in result}
 
 
 @tool
@@ -50,21 +186,18 @@ def manage_memory(
     """
     if operation == "write":
         ts = uuid4().hex
-        docs = [Document(page_content=document, metadata={"id": ts})]
-        VectorStore.add_documents(docs)
+        docs = [Document(page_content=document, metadata={"id": ts, **memory_metadata()})]
+        get_vector_store().add_documents(docs)
         return {"status": "ok", "message": "memory written successfully", "id": ts}
 
     # read
-    results = VectorStore.similarity_search_with_score(document, k=k)
-    matches = [
-        {"content": d.page_content, "metadata": d.metadata, "score": float(score)}
-        for d, score in results
-    ]
-    return {"matches": matches}
+    results = get_vector_store().similarity_search_with_score(document, k=k, filter=memory_filter())
+    return {"matches": _matches(results)}
 
 def _read_from_memory(
     document: str,
     top_k: int = 5,
+    speaker: str = None,
 ):
     """
     Read your memories for related context.
@@ -77,12 +210,11 @@ def _read_from_memory(
         a dict with status and a list of matching documents + scores.
     """
 
-    results = VectorStore.similarity_search_with_score(document, k=top_k)
-    matches = [
-        {"content": d.page_content, "metadata": d.metadata, "score": float(score)}
-        for d, score in results
-    ]
-    return {"Context from memory": matches}
+    results = get_vector_store().similarity_search_with_score(
+        document, k=top_k, filter=memory_filter(speaker)
+    )
+    return {"Context from memory": _matches(results)}
+
 
 @tool
 def write_to_memory(
@@ -99,8 +231,8 @@ def write_to_memory(
         If writing: a dict with status and unique memory ID.
     """
     ts = uuid4().hex
-    docs = [Document(page_content=document, metadata={"id": ts})]
-    VectorStore.add_documents(docs)
+    docs = [Document(page_content=document, metadata={"id": ts, **memory_metadata()})]
+    get_vector_store().add_documents(docs)
     return {"status": "ok", "message": "memory written successfully", "id": ts}
 
 read_runnable = RunnableLambda(_read_from_memory)
@@ -109,18 +241,3 @@ read_from_memory = read_runnable.as_tool(
     description="Read your memories for related context.",
     arg_types={"docuement": str, "top_k": int},
 )
-
-
-ReadMemoryAgent= initialize_agent(
-    tools=[read_from_memory],
-    llm=LLM,
-    agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-    verbose=True,
-)
-
-MemoryAgent= initialize_agent(
-    tools=[write_to_memory, read_from_memory],
-    llm=LLM,
-    agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-    verbose=True,
-)
\ No newline at end of file
@@ -0,0 +1,282 @@
+"""
+Session-scoped cache in front of memory retrieval.
+
+Follow-up questions from the same child tend to land on the same memories,
+so `aretrieve` keeps the recent (query embedding -> matches) pairs per
+speaker and answers from them when a new query embeds within
+`radius` cosine distance of a cached one. Query embeddings are memoized on
+normalized text, so a repeated phrase costs no network round trip at all.
+
+Entries expire after `ttl_s`, each speaker keeps at most `per_speaker`
+entries (LRU), and `invalidate(speaker)` drops a speaker's entries once new
+memories have been written for them.
+
+Every gunicorn worker has its own cache, and any of them may write the
+memories. Invalidations therefore also bump a per-speaker (or "*" for
+everyone) generation row in the memory journal (MEMORY_JOURNAL), and
+`aretrieve` first compares those rows with the ones it last saw (`sync`,
+one small SQLite read in a worker thread), dropping what another process
+invalidated. `lookup` itself only touches memory, so the event loop never
+waits on SQLite, and the lock guarding the entries is never held across
+journal I/O. The journal is per host: with several hosts on one Postgres, a
+write on another host is only seen once the entries expire
+(MEMORY_CACHE_TTL_S).
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from src import turns
+from src.config import (
+    MEMORY_CACHE_PER_SPEAKER,
+    MEMORY_CACHE_RADIUS,
+    MEMORY_CACHE_TTL_S,
+    MEMORY_JOURNAL,
+    logger,
+)
+from src.mem_manager import Embeddings, _matches, afetch_vectors, get_async_vector_store, memory_filter
+from src.wakeup import _EmbeddingCache, _normalize_text, _unit
+
+
+@dataclass
+class Retrieval:
+    matches: list[dict]         # {"id", "content", "metadata", "score" (cosine distance)}
+    vectors: dict               # id -> unit embedding, for the matches the store could return
+    query: np.ndarray           # unit embedding of this turn's query
+
+
+class _Entry:
+    __slots__ = ("vec", "top_k", "result", "created")
+
+    def __init__(self, vec: np.ndarray, top_k: int, result: "Retrieval", created: float):
+        self.vec = vec
+        self.top_k = top_k
+        self.result = result
+        self.created = created
+
+
+_ALL = "*"  # generation scope of household-wide invalidations
+
+
+class RetrievalCache:
+    def __init__(
+        self,
+        radius: float = MEMORY_CACHE_RADIUS,
+        ttl_s: float = MEMORY_CACHE_TTL_S,
+        per_speaker: int = MEMORY_CACHE_PER_SPEAKER,
+        embed_cache_size: int = 1024,
+        clock=time.monotonic,
+        shared_path: Optional[str] = MEMORY_JOURNAL,  # None: invalidations stay in this process
+    ):
+        self.radius = radius
+        self.ttl_s = ttl_s
+        self.per_speaker = per_speaker
+        self._clock = clock
+        self._speakers: dict[str, "OrderedDict[int, _Entry]"] = {}
+        self._generation: dict[str, int] = {}  # bumped on invalidate
+        self._next_id = 0
+        self._shared_path = shared_path
+        self._db = None
+        self._seen: Optional[dict] = None  # shared generations as of the last sync
+        self._unsynced = False  # the last sync could not read the journal
+        self._lock = threading.Lock()  # entries and generations; never held across journal I/O
+        self._db_lock = threading.Lock()  # the journal connection
+        self.embeddings = _EmbeddingCache(embed_cache_size)
+        self.hits = 0
+        self.misses = 0
+
+    # ---- cross-process invalidation -----------------------------------------
+
+    def _shared(self):
+        # caller holds `_db_lock`
+        if self._db is None:
+            self._db = sqlite3.connect(self._shared_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS memory_cache_generations "
+                "(scope TEXT PRIMARY KEY, gen INTEGER NOT NULL)"
+            )
+        return self._db
+
+    def _drop_local(self, speaker: str):
+        # caller holds `_lock` (as for `_drop_all_local`)
+        self._speakers.pop(speaker, None)
+        self._generation[speaker] = self._generation.get(speaker, 0) + 1
+
+    def _drop_all_local(self):
+        for speaker in self._speakers:
+            self._generation[speaker] = self._generation.get(speaker, 0) + 1
+        self._speakers.clear()
+
+    def sync(self) -> bool:
+        """
+        Apply invalidations made by other processes; False if the journal
+        could not be read, in which case lookups miss until a sync succeeds.
+        Blocking: call it from a worker thread.
+        """
+        if self._shared_path is None:
+            return True
+        try:
+            with self._db_lock:
+                gens = dict(self._shared().execute("SELECT scope, gen FROM memory_cache_generations"))
+        except sqlite3.Error as e:
+            logger.warning("memory cache: could not read shared generations: %s", e)
+            with self._lock:
+                self._unsynced = True
+            return False
+        with self._lock:
+            if self._seen is not None:
+                if gens.get(_ALL) != self._seen.get(_ALL):
+                    self._drop_all_local()
+                else:
+                    for scope, gen in gens.items():
+                        if self._seen.get(scope) != gen:
+                            self._drop_local(scope)
+            self._seen = gens
+            self._unsynced = False
+        return True
+
+    def _publish(self, scope: str):
+        if self._shared_path is None:
+            return
+        try:
+            with self._db_lock:
+                db = self._shared()
+                db.execute(
+                    "INSERT INTO memory_cache_generations (scope, gen) VALUES (?, 1) "
+                    "ON CONFLICT(scope) DO UPDATE SET gen = gen + 1",
+                    (scope,),
+                )
+                gen = db.execute(
+                    "SELECT gen FROM memory_cache_generations WHERE scope = ?", (scope,)
+                ).fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning("memory cache: could not publish invalidation of %s: %s", scope, e)
+            return
+        with self._lock:
+            if self._seen is not None:
+                self._seen[scope] = gen
+
+    # ---- cache -------------------------------------------------------------
+
+    def lookup(self, speaker: str, vec: np.ndarray, top_k: int) -> Optional["Retrieval"]:
+        """Matches of the closest live entry within `radius` (as of the last `sync`), or None."""
+        now = self._clock()
+        with self._lock:
+            if self._unsynced:
+                self.misses += 1  # cannot tell whether another process wrote: search
+                return None
+            entries = self._speakers.get(speaker)
+            if not entries:
+                self.misses += 1
+                return None
+            best_id, best_sim = None, 1.0 - self.radius
+            for entry_id, e in list(entries.items()):
+                if now - e.created > self.ttl_s:
+                    del entries[entry_id]
+                    continue
+                if e.top_k < top_k:
+                    continue
+                sim = float(e.vec @ vec)
+                if sim >= best_sim:
+                    best_id, best_sim = entry_id, sim
+            if best_id is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best_id)
+            self.hits += 1
+            return entries[best_id].result
+
+    def generation(self, speaker: str) -> int:
+        with self._lock:
+            return self._generation.get(speaker, 0)
+
+    def put(self, speaker: str, vec: np.ndarray, top_k: int, result: "Retrieval", generation: int = None):
+        """Cache a search result; skipped if `speaker` was invalidated since `generation`."""
+        with self._lock:
+            if generation is not None and generation != self._generation.get(speaker, 0):
+                return
+            entries = self._speakers.setdefault(speaker, OrderedDict())
+            entries[self._next_id] = _Entry(vec, top_k, result, self._clock())
+            self._next_id += 1
+            while len(entries) > self.per_speaker:
+                entries.popitem(last=False)
+
+    def invalidate(self, speaker: str):
+        """Drop `speaker`'s entries here and, through the journal, in the other processes."""
+        with self._lock:
+            dropped = self._speakers.get(speaker)
+            self._drop_local(speaker)
+        self._publish(speaker)
+        if dropped:
+            logger.info("memory cache: dropped %d entries of %s", len(dropped), speaker)
+
+    def clear(self):
+        """Drop every speaker's entries (after a household-wide memory changed)."""
+        with self._lock:
+            self._drop_all_local()
+        self._publish(_ALL)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = sum(len(e) for e in self._speakers.values())
+        total = self.hits + self.misses
+        return {
+            "entries": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+_CACHE = RetrievalCache()
+
+
+def get_retrieval_cache() -> RetrievalCache:
+    return _CACHE
+
+
+async def _aembed_query(text: str) -> np.ndarray:
+    key = _normalize_text(text)
+    vec = _CACHE.embeddings.get(key)
+    if vec is None:
+        vec = _unit(await Embeddings.aembed_query(text))
+        _CACHE.embeddings.put(key, vec)
+    return vec
+
+
+async def aretrieve(speaker: str, document: str, top_k: int = 5) -> "Retrieval":
+    """
+    Cached retrieval for one turn: embeds the query once (memoized) and only
+    searches the store when no recent query of this speaker is close
+    enough. Matches come with their stored embeddings (for MMR in
+    `memory_context`), fetched once per cache entry.
+    """
+    with turns.span("memory_embed"):
+        vec = await _aembed_query(document)
+    await asyncio.to_thread(_CACHE.sync)
+    cached = _CACHE.lookup(speaker, vec, top_k)
+    if cached is not None:
+        return Retrieval(cached.matches[:top_k], cached.vectors, vec)
+
+    generation = _CACHE.generation(speaker)
+    with turns.span("memory_search"):
+        results = await get_async_vector_store().asimilarity_search_with_score_by_vector(
+            vec.tolist(), k=top_k, filter=memory_filter(speaker)
+        )
+    matches = _matches(results)
+    try:
+        vectors = await afetch_vectors([m["id"] for m in matches])
+    except Exception as e:
+        logger.warning("could not fetch memory vectors, MMR falls back to text dedupe: %s", e)
+        vectors = {}
+    vectors = {i: _unit(v) for i, v in vectors.items()}
+    result = Retrieval(matches, vectors, vec)
+    _CACHE.put(speaker, vec, top_k, result, generation)
+    return result
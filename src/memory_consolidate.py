@@ -0,0 +1,308 @@
+"""
+Background consolidation of near-duplicate memories.
+
+Incremental: each run only seeds from rows added since the previous run
+(checkpoint in MEMORY_CONSOLIDATE_STATE). The first run and `--full` seed
+from every row, including legacy rows that predate the "added" key. For
+each seed, its nearest memories among the seed speaker's own and the
+shared ('*') rows are fetched by vector (HNSW on Postgres, exact in the
+local store); pairs at or above MEMORY_MERGE_SIM are unioned into clusters.
+
+Each cluster of two or more rows collapses into one canonical fact: a
+shared row if there is one (so no speaker loses the fact), otherwise the
+newest row (the most current wording of e.g. a preference). Union-find
+chains, so a member is only merged when it is itself within
+MEMORY_MERGE_SIM of the canonical row; the rest are left alone. With
+`summarize=True` one LLM call per cluster rewrites the merged members into
+a single sentence, stored over the canonical row's id. The other rows are
+deleted, after being appended to MEMORY_ARCHIVE when archiving is on.
+
+Every gunicorn worker runs the scheduler, so a pass first takes an
+exclusive `fcntl` lock next to the checkpoint file; a pass that finds it
+held (another worker or the CLI is consolidating) is skipped, and a
+scheduled pass is also skipped when another process ran one within half
+an interval.
+
+    python -m src.memory_consolidate [--full] [--summarize] [--dry-run]
+"""
+import argparse
+import fcntl
+import json
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from src.config import (
+    HOUSEHOLD_ID,
+    MEMORY_ARCHIVE,
+    MEMORY_BACKEND,
+    MEMORY_CONSOLIDATE_INTERVAL_S,
+    MEMORY_CONSOLIDATE_K,
+    MEMORY_CONSOLIDATE_STATE,
+    MEMORY_MERGE_SIM,
+    logger,
+)
+from src.mem_manager import SHARED_SPEAKER, LLM, Embeddings, get_vector_store, memory_metadata
+from src.spells import remember_consolidate
+
+_RUN_LOCK = threading.Lock()
+
+
+def _load_checkpoint() -> Optional[float]:
+    """Start of the last completed pass, or None before the first one."""
+    try:
+        return float(json.loads(Path(MEMORY_CONSOLIDATE_STATE).read_text())["last_run"])
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _save_checkpoint(ts: float):
+    path = Path(MEMORY_CONSOLIDATE_STATE)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps({"last_run": ts}))
+    tmp.replace(path)
+
+
+@contextmanager
+def _exclusive():
+    """Cross-process run lock; yields False (without waiting) when another process holds it."""
+    with _RUN_LOCK, open(MEMORY_CONSOLIDATE_STATE + ".lock", "a+b") as lock:
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def _unit(emb: str) -> np.ndarray:
+    v = np.asarray(json.loads(emb), dtype=np.float32)
+    return v / (np.linalg.norm(v) or 1.0)
+
+
+def _seed_rows(since: Optional[float]):
+    """
+    Rows of this household added after `since` (every row when None):
+    [(id, text, metadata, unit vector)].
+    """
+    if MEMORY_BACKEND == "local":
+        ids, texts, metas, matrix = get_vector_store().rows()
+        return [
+            (i, t, m, matrix[n])
+            for n, (i, t, m) in enumerate(zip(ids, texts, metas))
+            if m.get("household") == HOUSEHOLD_ID
+            and (since is None or float(m.get("added") or 0) > since)
+        ]
+
+    from sqlalchemy import text
+
+    from src.db_pool import get_write_engine
+
+    sql = (
+        "SELECT e.id, e.document, e.cmetadata, e.embedding::text "
+        "FROM langchain_pg_embedding e "
+        "JOIN langchain_pg_collection c ON c.uuid = e.collection_id "
+        "WHERE c.name = :collection AND e.cmetadata->>'household' = :household"
+    )
+    params = {"collection": get_vector_store().collection_name, "household": HOUSEHOLD_ID}
+    if since is not None:
+        sql += " AND coalesce((e.cmetadata->>'added')::float, 0) > :since"
+        params["since"] = since
+    with get_write_engine().connect() as conn:
+        return [(doc_id, doc, meta or {}, _unit(emb)) for doc_id, doc, meta, emb in conn.execute(text(sql), params)]
+
+
+def _vectors(ids) -> dict:
+    """{id: unit vector} for the stored rows among `ids`."""
+    if MEMORY_BACKEND == "local":
+        return get_vector_store().vectors(ids)
+
+    from sqlalchemy import bindparam, text
+
+    from src.db_pool import get_write_engine
+
+    sql = text(
+        "SELECT e.id, e.embedding::text FROM langchain_pg_embedding e WHERE e.id IN :ids"
+    ).bindparams(bindparam("ids", expanding=True))
+    with get_write_engine().connect() as conn:
+        return {doc_id: _unit(emb) for doc_id, emb in conn.execute(sql, {"ids": list(ids)})}
+
+
+def _store_size() -> int:
+    if MEMORY_BACKEND == "local":
+        return len(get_vector_store())
+
+    from sqlalchemy import text
+
+    from src.db_pool import get_write_engine
+
+    with get_write_engine().connect() as conn:
+        return conn.execute(
+            text(
+                "SELECT count(*) FROM langchain_pg_embedding e "
+                "JOIN langchain_pg_collection c ON c.uuid = e.collection_id "
+                "WHERE c.name = :collection AND e.cmetadata->>'household' = :household"
+            ),
+            {"collection": get_vector_store().collection_name, "household": HOUSEHOLD_ID},
+        ).scalar()
+
+
+class _UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, x):
+        self.parent.setdefault(x, x)
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a, b):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[rb] = ra
+
+
+def _clusters(seeds):
+    """Union seeds with their neighbours above MEMORY_MERGE_SIM among the speaker's own and shared rows."""
+    uf, docs, store = _UnionFind(), {}, get_vector_store()
+    for doc_id, doc, meta, vec in seeds:
+        docs[doc_id] = (doc, meta)
+        uf.find(doc_id)
+        speakers = sorted({meta.get("speaker") or SHARED_SPEAKER, SHARED_SPEAKER})
+        scope = {"household": {"$in": [HOUSEHOLD_ID]}, "speaker": {"$in": speakers}}
+        for near, distance in store.similarity_search_with_score_by_vector(
+            vec.tolist(), k=MEMORY_CONSOLIDATE_K, filter=scope
+        ):
+            near_id = near.id or near.metadata.get("id")
+            if not near_id or near_id == doc_id or 1.0 - float(distance) < MEMORY_MERGE_SIM:
+                continue
+            docs.setdefault(near_id, (near.page_content, near.metadata))
+            uf.union(doc_id, near_id)
+
+    groups = {}
+    for doc_id in docs:
+        groups.setdefault(uf.find(doc_id), []).append(doc_id)
+    return [[(i, *docs[i]) for i in g] for g in groups.values() if len(g) > 1]
+
+
+def _canonical(members):
+    """
+    Split a cluster into (kept row, rows to merge into it). The kept row is
+    the newest shared one, else the newest; members not themselves within
+    MEMORY_MERGE_SIM of it (reached only through a chain) are left out.
+    """
+    members = sorted(
+        members,
+        key=lambda m: (m[2].get("speaker") == SHARED_SPEAKER, float(m[2].get("added") or 0)),
+    )
+    keep = members[-1]
+    vecs = _vectors([m[0] for m in members])
+    if keep[0] not in vecs:
+        return keep, []
+    return keep, [
+        m for m in members[:-1]
+        if m[0] in vecs and float(vecs[m[0]] @ vecs[keep[0]]) >= MEMORY_MERGE_SIM
+    ]
+
+
+def _archive(rows, reason: str):
+    with open(MEMORY_ARCHIVE, "a", encoding="utf-8") as f:
+        for doc_id, doc, meta in rows:
+            rec = {"id": doc_id, "text": doc, "metadata": meta, "archived": time.time(), "reason": reason}
+            f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+def consolidate(full: bool = False, summarize: bool = False, archive: bool = True, dry_run: bool = False) -> dict:
+    """One consolidation pass; returns a report of what it merged and how much the store shrank."""
+    with _exclusive() as acquired:
+        if not acquired:
+            logger.info("memory consolidation: skipped, another process is running a pass")
+            return {"skipped": "running in another process"}
+        started = time.time()
+        since = None if full else _load_checkpoint()
+        store = get_vector_store()
+        before = _store_size()
+        seeds = _seed_rows(since)
+        clusters = _clusters(seeds)
+
+        report = {
+            "since": since, "seeds": len(seeds), "clusters": len(clusters),
+            "rows_before": before, "deleted": 0, "summarized": 0,
+        }
+        for members in clusters:
+            (keep_id, keep_doc, keep_meta), drop = _canonical(members)
+            if not drop:
+                continue
+            if dry_run:
+                report["deleted"] += len(drop)
+                continue
+
+            if summarize:
+                facts = [d for _, d, _ in drop] + [keep_doc]
+                merged = LLM.invoke(
+                    remember_consolidate.format(facts="\n".join(f"- {d}" for d in facts))
+                ).content.strip()
+                if merged and merged != keep_doc:
+                    meta = {**keep_meta, **memory_metadata(keep_meta.get("speaker")), "id": keep_id}
+                    meta["added"] = keep_meta.get("added") or meta["added"]  # no re-seeding next run
+                    store.add_embeddings(
+                        [merged], [Embeddings.embed_query(merged)], metadatas=[meta], ids=[keep_id]
+                    )
+                    report["summarized"] += 1
+
+            if archive:
+                _archive(drop, reason=f"merged into {keep_id}")
+            store.delete(ids=[doc_id for doc_id, _, _ in drop])
+            report["deleted"] += len(drop)
+
+        if not dry_run:
+            _save_checkpoint(started)
+            if report["deleted"]:
+                from src.memory_cache import get_retrieval_cache
+
+                get_retrieval_cache().clear()
+        report["rows_after"] = before - report["deleted"]
+        report["shrink_pct"] = round(100.0 * report["deleted"] / before, 1) if before else 0.0
+        report["seconds"] = round(time.time() - started, 2)
+        logger.info("memory consolidation: %s", report)
+        return report
+
+
+def start_scheduler(interval_s: float = MEMORY_CONSOLIDATE_INTERVAL_S) -> threading.Thread:
+    """Run `consolidate()` every `interval_s` in a daemon thread (0 disables)."""
+
+    def _loop():
+        while True:
+            time.sleep(interval_s)
+            if time.time() - (_load_checkpoint() or 0.0) < interval_s / 2:
+                continue  # another worker has just run a pass
+            try:
+                consolidate()
+            except Exception as e:
+                logger.exception(f"memory consolidation failed: {e}")
+
+    t = threading.Thread(target=_loop, name="memory-consolidate", daemon=True)
+    if interval_s > 0:
+        t.start()
+    return t
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--full", action="store_true", help="ignore the checkpoint, seed from every row")
+    ap.add_argument("--summarize", action="store_true", help="LLM-merge each cluster into one fact")
+    ap.add_argument("--no-archive", action="store_true")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    print(json.dumps(
+        consolidate(args.full, args.summarize, not args.no_archive, args.dry_run), indent=2
+    ))
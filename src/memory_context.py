@@ -0,0 +1,94 @@
+"""
+Compact, token-budgeted memory block for the per-turn system message.
+
+Instead of the repr of the retrieval dict (ids, scores, metadata and
+near-duplicate sentences), the prompt gets plain bullet lines:
+
+1. matches below `min_sim` cosine similarity to the query are dropped;
+2. the rest are ordered by maximal marginal relevance on their stored
+   embeddings, so "Hilla likes cats" does not appear three times;
+3. lines are added in that order while they fit `budget_tokens`, counted
+   with the model's tokenizer.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+from src.config import (
+    MEMORY_CONTEXT_MIN_SIM,
+    MEMORY_CONTEXT_MMR_LAMBDA,
+    MEMORY_CONTEXT_TOKENS,
+    MODEL_ID,
+)
+
+NO_MEMORIES = "(no relevant memories)"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(MODEL_ID)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")  # gpt-4o / gpt-5 family
+
+
+def count_tokens(text: str) -> int:
+    return len(_encoding().encode(text))
+
+
+def _mmr_order(rel: np.ndarray, sims: np.ndarray, lam: float) -> list[int]:
+    """Greedy MMR: argmax lam*rel - (1-lam)*max similarity to what is already picked."""
+    n = len(rel)
+    picked, redundancy = [], np.full(n, -np.inf)
+    left = np.ones(n, dtype=bool)
+    for _ in range(n):
+        penalty = np.where(np.isfinite(redundancy), redundancy, 0.0)
+        score = np.where(left, lam * rel - (1.0 - lam) * penalty, -np.inf)
+        best = int(np.argmax(score))
+        picked.append(best)
+        left[best] = False
+        redundancy = np.maximum(redundancy, sims[best])
+    return picked
+
+
+def build_memory_context(
+    retrieval,
+    budget_tokens: int = MEMORY_CONTEXT_TOKENS,
+    min_sim: float = MEMORY_CONTEXT_MIN_SIM,
+    mmr_lambda: float = MEMORY_CONTEXT_MMR_LAMBDA,
+) -> str:
+    """`memory_cache.Retrieval` -> bullet lines of memory text within the token budget."""
+    seen, items = set(), []
+    for m in retrieval.matches:
+        text = " ".join((m.get("content") or "").split())
+        key = text.lower().rstrip(".!")
+        if not text or key in seen:
+            continue
+        seen.add(key)
+        vec = retrieval.vectors.get(m.get("id"))
+        # rescore against this turn's query when the vector is known (cache hits
+        # carry the distances of an earlier, merely similar query)
+        sim = float(vec @ retrieval.query) if vec is not None else 1.0 - float(m["score"])
+        if sim >= min_sim:
+            items.append((text, sim, vec))
+    if not items:
+        return NO_MEMORIES
+
+    rel = np.array([sim for _, sim, _ in items], dtype=np.float32)
+    sims = np.zeros((len(items), len(items)), dtype=np.float32)
+    with_vec = [i for i, (_, _, v) in enumerate(items) if v is not None]
+    if with_vec:
+        m = np.stack([items[i][2] for i in with_vec])
+        sims[np.ix_(with_vec, with_vec)] = m @ m.T
+
+    lines, used = [], 0
+    for i in _mmr_order(rel, sims, mmr_lambda):
+        line = f"- {items[i][0]}"
+        cost = count_tokens(line + "\n")
+        if used + cost > budget_tokens:
+            continue  # a shorter, less relevant fact may still fit
+        lines.append(line)
+        used += cost
+    return "\n".join(lines) if lines else NO_MEMORIES
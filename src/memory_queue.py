@@ -0,0 +1,262 @@
+"""
+Durable, bounded write-behind queue for interaction memories.
+
+Interactions are appended to a local SQLite journal and drained by a fixed
+number of worker threads, so memory writes never spawn unbounded threads
+and survive a process restart.
+
+Several processes (gunicorn workers) share the journal. A claim runs in
+one `BEGIN IMMEDIATE` transaction and stamps the rows with the claiming
+pid and a lease of MEMORY_LEASE_S; rows whose lease has run out (their
+worker crashed or hung) go back to "pending", at startup and then once a
+minute. Rows another live process is working on are left alone. Claims use
+their own connection and lock, so `enqueue` and `stats` never wait behind
+a claim that is itself waiting for another process's transaction; they are
+still blocking SQLite calls, so async callers run them in a thread.
+
+A worker waits until a speaker's oldest pending interaction is
+`coalesce_s` old, then claims *all* of that speaker's pending interactions
+and hands them to the handler as one job. Failures are retried with
+exponential backoff up to `max_attempts`, after which the rows are kept as
+"dead" for inspection.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable
+
+from src.config import (
+    MEMORY_COALESCE_S,
+    MEMORY_JOURNAL,
+    MEMORY_LEASE_S,
+    MEMORY_MAX_ATTEMPTS,
+    MEMORY_WORKER_NICE,
+    MEMORY_WORKERS,
+    logger,
+)
+from src.turns import span
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS memory_jobs (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    speaker   TEXT NOT NULL,
+    payload   TEXT NOT NULL,
+    created   REAL NOT NULL,
+    next_at   REAL NOT NULL,
+    attempts  INTEGER NOT NULL DEFAULT 0,
+    status    TEXT NOT NULL DEFAULT 'pending',
+    error     TEXT,
+    owner     INTEGER,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS memory_jobs_ready ON memory_jobs (status, next_at, speaker);
+"""
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+
+class MemoryWriteQueue:
+    def __init__(
+        self,
+        handler: Callable[[str, list[str]], None],
+        path: str = MEMORY_JOURNAL,
+        workers: int = MEMORY_WORKERS,
+        coalesce_s: float = MEMORY_COALESCE_S,
+        max_attempts: int = MEMORY_MAX_ATTEMPTS,
+        lease_s: float = MEMORY_LEASE_S,
+    ):
+        self.handler = handler
+        self.coalesce_s = coalesce_s
+        self.max_attempts = max_attempts
+        self.lease_s = lease_s
+        self._owner = os.getpid()
+        self._db = _connect(path)
+        self._db.executescript(_SCHEMA)
+        columns = {r[1] for r in self._db.execute("PRAGMA table_info(memory_jobs)")}
+        for name, kind in (("owner", "INTEGER"), ("lease_until", "REAL")):
+            if name not in columns:  # journal from before leases
+                self._db.execute(f"ALTER TABLE memory_jobs ADD COLUMN {name} {kind}")
+        self._lock = threading.Lock()  # `_db`: enqueue, stats, results
+        self._wake = threading.Condition(self._lock)
+        self._enqueued = 0  # bumped by enqueue, so a worker never sleeps through one
+        self._claim_db = _connect(path)  # only used under `_claim_lock`
+        self._claim_lock = threading.Lock()
+        self._next_reap = 0.0
+        self.processed = 0
+        self.failed = 0
+
+        with self._claim_lock:
+            self._reap()
+
+        self._threads = [
+            threading.Thread(target=self._run, name=f"memory-writer-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def enqueue(self, speaker: str, interaction: str):
+        """Durably record one interaction; returns once it is in the journal."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO memory_jobs (speaker, payload, created, next_at) VALUES (?, ?, ?, ?)",
+                (speaker, interaction, now, now + self.coalesce_s),
+            )
+            self._enqueued += 1
+            self._wake.notify()
+
+    def _reap(self):
+        """Put rows whose lease has expired back to "pending" (caller holds `_claim_lock`)."""
+        now = time.time()
+        self._next_reap = now + 60.0
+        n = self._claim_db.execute(
+            "UPDATE memory_jobs SET status = 'pending', owner = NULL, lease_until = NULL "
+            "WHERE status = 'inflight' AND (lease_until IS NULL OR lease_until < ?)",
+            (now,),
+        ).rowcount
+        if n:
+            logger.info("memory journal: re-queued %d interrupted interactions", n)
+
+    def _claim(self):
+        """
+        Claim every ready interaction of one speaker, or return the seconds to
+        wait (caller holds `_claim_lock`).
+        """
+        db = self._claim_db
+        now = time.time()
+        if now >= self._next_reap:
+            self._reap()
+        db.execute("BEGIN IMMEDIATE")  # other processes claim from the same journal
+        try:
+            row = db.execute(
+                "SELECT speaker, MIN(next_at) FROM memory_jobs WHERE status = 'pending' "
+                "GROUP BY speaker ORDER BY MIN(next_at) LIMIT 1"
+            ).fetchone()
+            if row is None:
+                db.execute("COMMIT")
+                return None, 5.0
+            speaker, ready_at = row
+            if ready_at > now:
+                db.execute("COMMIT")
+                return None, ready_at - now
+            rows = db.execute(
+                "SELECT id, payload, attempts FROM memory_jobs "
+                "WHERE status = 'pending' AND speaker = ? ORDER BY id",
+                (speaker,),
+            ).fetchall()
+            claimed = [
+                r for r in rows
+                if db.execute(
+                    "UPDATE memory_jobs SET status = 'inflight', owner = ?, lease_until = ? "
+                    "WHERE id = ? AND status = 'pending'",
+                    (self._owner, now + self.lease_s, r[0]),
+                ).rowcount
+            ]
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        return ((speaker, claimed), 0.0) if claimed else (None, 0.0)
+
+    def _run(self):
+        try:
+            # lower only this thread's priority; the event loop keeps its own
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), MEMORY_WORKER_NICE)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            with self._lock:
+                enqueued = self._enqueued
+            with self._claim_lock:
+                try:
+                    job, wait_s = self._claim()
+                except sqlite3.OperationalError as e:
+                    # another process held the journal past the busy timeout
+                    logger.warning("memory journal: claim failed: %s", e)
+                    job, wait_s = None, 1.0
+            if job is None:
+                with self._lock:
+                    if self._enqueued == enqueued:
+                        self._wake.wait(timeout=min(wait_s, 5.0))
+                continue
+            speaker, rows = job
+            ids = [(r[0],) for r in rows]
+            try:
+                with span("memory_write"):
+                    self.handler(speaker, [r[1] for r in rows])
+            except Exception as e:
+                self._fail(rows, e)
+                continue
+            with self._lock:
+                self._db.executemany("DELETE FROM memory_jobs WHERE id = ?", ids)
+                self.processed += len(rows)
+
+    def _fail(self, rows, error: Exception):
+        logger.warning("memory write failed for %d interactions: %s", len(rows), error)
+        now = time.time()
+        with self._lock:
+            for job_id, _, attempts in rows:
+                attempts += 1
+                dead = attempts >= self.max_attempts
+                self._db.execute(
+                    "UPDATE memory_jobs SET status = ?, attempts = ?, next_at = ?, error = ?, "
+                    "owner = NULL, lease_until = NULL WHERE id = ?",
+                    (
+                        "dead" if dead else "pending",
+                        attempts,
+                        now + min(300.0, 2.0**attempts),
+                        repr(error),
+                        job_id,
+                    ),
+                )
+                self.failed += dead
+
+    def stats(self) -> dict:
+        """Queue depth, in-flight and dead counts, and lag of the oldest pending item."""
+        with self._lock:
+            counts = dict(
+                self._db.execute("SELECT status, COUNT(*) FROM memory_jobs GROUP BY status")
+            )
+            oldest = self._db.execute(
+                "SELECT MIN(created) FROM memory_jobs WHERE status IN ('pending', 'inflight')"
+            ).fetchone()[0]
+        return {
+            "depth": counts.get("pending", 0),
+            "inflight": counts.get("inflight", 0),
+            "dead": counts.get("dead", 0),
+            "lag_s": round(time.time() - oldest, 1) if oldest else 0.0,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+
+def persist_interactions(speaker: str, interactions: list[str]):
+    """Extract, dedupe and store the facts of a speaker's coalesced interactions."""
+    from src.memory_cache import get_retrieval_cache
+    from src.memory_writer import write_memories
+
+    counts = write_memories(speaker, interactions)
+    if counts["shared"]:
+        get_retrieval_cache().clear()
+    elif counts["written"] or counts["updated"]:
+        get_retrieval_cache().invalidate(speaker)
+    logger.info("memory: %d interactions of %s -> %s", len(interactions), speaker, counts)
+
+
+_QUEUE = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_memory_queue() -> MemoryWriteQueue:
+    global _QUEUE
+    with _QUEUE_LOCK:
+        if _QUEUE is None:
+            _QUEUE = MemoryWriteQueue(persist_interactions)
+    return _QUEUE
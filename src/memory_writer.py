@@ -0,0 +1,118 @@
+"""
+Deterministic memory write path (replaces the ReAct MemoryAgent for writes).
+
+One turn of work, always the same shape:
+
+1. one structured-output LLM call extracts candidate facts from the
+   (coalesced) interactions;
+2. one embeddings call embeds all candidates;
+3. each candidate is compared with the closest existing memory in the same
+   scope (exact top-1 by vector, no extra embedding):
+   - similarity >= MEMORY_DUPLICATE_SIM              -> skip (already known)
+   - similarity >= MEMORY_UPDATE_SIM and kind=update -> upsert over that memory
+   - otherwise                                        -> new memory
+4. one `add_embeddings` call writes everything that survived.
+"""
+from typing import Literal
+from uuid import uuid4
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from src.config import MEMORY_DUPLICATE_SIM, MEMORY_UPDATE_SIM, logger
+from src.mem_manager import (
+    LLM,
+    SHARED_SPEAKER,
+    Embeddings,
+    get_vector_store,
+    memory_filter,
+    memory_metadata,
+)
+from src.spells import remember_extract
+
+
+class MemoryFact(BaseModel):
+    text: str = Field(description="One short, neutral sentence stating the fact.")
+    about: Literal["speaker", "household"] = Field(
+        description="'speaker' if it is about the speaker, 'household' if shared by the family."
+    )
+    kind: Literal["new", "update"] = Field(
+        description="'update' if it corrects or replaces something said before, else 'new'."
+    )
+
+
+class MemoryFacts(BaseModel):
+    facts: list[MemoryFact] = Field(default_factory=list)
+
+
+_EXTRACTOR = LLM.with_structured_output(MemoryFacts, include_raw=True)
+
+
+def _unit_rows(vectors) -> np.ndarray:
+    m = np.asarray(vectors, dtype=np.float32)
+    n = np.linalg.norm(m, axis=1, keepdims=True)
+    n[n == 0] = 1.0
+    return m / n
+
+
+def extract_facts(speaker: str, interactions: list[str]) -> list[MemoryFact]:
+    payload = "\n\n---\n\n".join(interactions)
+    out = _EXTRACTOR.invoke(remember_extract.format(speaker=speaker, payload=payload))
+    usage = getattr(out.get("raw"), "usage_metadata", None) or {}
+    logger.info(
+        "memory extract: 1 LLM call, %s tokens in / %s out",
+        usage.get("input_tokens", "?"), usage.get("output_tokens", "?"),
+    )
+    if out.get("parsing_error") is not None:
+        raise ValueError(f"memory extractor returned unparseable output: {out['parsing_error']}")
+    parsed = out.get("parsed")
+    return parsed.facts if parsed else []
+
+
+def write_memories(speaker: str, interactions: list[str]) -> dict:
+    """
+    Extract, dedupe and store the durable facts of a speaker's interactions.
+    Returns counts: {"candidates", "written", "updated", "duplicates", "shared"}
+    ("shared": how many of the stored facts are household-wide).
+    """
+    facts = [f for f in extract_facts(speaker, interactions) if f.text.strip()]
+    counts = {"candidates": len(facts), "written": 0, "updated": 0, "duplicates": 0, "shared": 0}
+    if not facts:
+        return counts
+
+    store = get_vector_store()
+    vecs = _unit_rows(Embeddings.embed_documents([f.text.strip() for f in facts]))
+    texts, rows, metas, ids, kept = [], [], [], [], []
+    for fact, vec in zip(facts, vecs):
+        # candidates of this same batch count as existing memories too
+        if kept and float(np.max(np.stack(kept) @ vec)) >= MEMORY_DUPLICATE_SIM:
+            counts["duplicates"] += 1
+            continue
+        owner = speaker if fact.about == "speaker" else SHARED_SPEAKER
+        nearest = store.similarity_search_with_score_by_vector(
+            vec.tolist(), k=1, filter=memory_filter(owner)
+        )
+        doc_id = None
+        if nearest:
+            doc, distance = nearest[0]
+            sim = 1.0 - float(distance)
+            if sim >= MEMORY_DUPLICATE_SIM:
+                counts["duplicates"] += 1
+                continue
+            if sim >= MEMORY_UPDATE_SIM and fact.kind == "update":
+                doc_id = doc.id or doc.metadata.get("id")
+        if doc_id:
+            counts["updated"] += 1
+        else:
+            counts["written"] += 1
+            doc_id = uuid4().hex
+        counts["shared"] += owner == SHARED_SPEAKER
+        texts.append(fact.text.strip())
+        rows.append(vec.tolist())
+        metas.append({"id": doc_id, **memory_metadata(owner)})
+        ids.append(doc_id)
+        kept.append(vec)
+
+    if texts:
+        store.add_embeddings(texts, rows, metadatas=metas, ids=ids)
+    return counts
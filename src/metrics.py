@@ -0,0 +1,149 @@
+"""
+In-process metrics, rendered in the Prometheus text format by GET /metrics.
+
+Deliberately tiny (no client library): an observation is one bisect and a
+few increments under an uncontended lock, so spans can be recorded on the
+hot path. Quantiles (p50/p95/p99) are computed at scrape time from a
+sliding window of the latest observations and exported as a summary next
+to each histogram; cumulative buckets stay available for
+`histogram_quantile()` across instances.
+
+Gauges that mirror other subsystems (admission queues, readiness) are read
+at scrape time through `register_collector`; ones that need blocking I/O
+(the memory queue's SQLite counts) are fetched off the event loop by the
+endpoint and handed to `render`.
+
+Metrics are per process: with several gunicorn workers, scrape each one
+(or run one worker per container).
+"""
+import bisect
+import threading
+from collections import deque
+from typing import Callable
+
+_PREFIX = "peepapoop_"
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = _PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        out += [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in items]
+        return out
+
+
+class _Series:
+    __slots__ = ("buckets", "sum", "count", "recent")
+
+    def __init__(self, n_buckets: int, window: int):
+        self.buckets = [0] * n_buckets
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+
+class Histogram:
+    """Histogram (cumulative buckets) plus a `<name>_recent` summary of the last `window` values."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets=_BUCKETS, window: int = 1024):
+        self.name = _PREFIX + name
+        self.help = help
+        self.labelnames = labelnames
+        self.bounds = tuple(buckets)
+        self.window = window
+        self._series: dict[tuple, _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = _Series(len(self.bounds) + 1, self.window)
+            s.buckets[i] += 1
+            s.sum += value
+            s.count += 1
+            s.recent.append(value)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            snap = {
+                k: (list(s.buckets), s.sum, s.count, sorted(s.recent))
+                for k, s in sorted(self._series.items())
+            }
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for k, (buckets, total, count, _) in snap.items():
+            running = 0
+            for bound, n in zip(self.bounds + (float("inf"),), buckets):
+                running += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                out.append(f"{self.name}_bucket{_labels(self.labelnames, k, le)} {running}")
+            out.append(f"{self.name}_sum{_labels(self.labelnames, k)} {total}")
+            out.append(f"{self.name}_count{_labels(self.labelnames, k)} {count}")
+
+        recent_name = self.name + "_recent"
+        out += [f"# HELP {recent_name} {self.help} (last {self.window} observations)",
+                f"# TYPE {recent_name} summary"]
+        for k, (_, _, _, recent) in snap.items():
+            for q in _QUANTILES if recent else ():
+                v = recent[min(len(recent) - 1, int(q * len(recent)))]
+                ql = f'quantile="{q}"'
+                out.append(f"{recent_name}{_labels(self.labelnames, k, ql)} {v}")
+            out.append(f"{recent_name}_sum{_labels(self.labelnames, k)} {sum(recent)}")
+            out.append(f"{recent_name}_count{_labels(self.labelnames, k)} {len(recent)}")
+        return out
+
+
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent per pipeline stage.", ("stage",))
+STAGE_ERRORS = Counter("stage_errors_total", "Stages that raised (cancellation excluded).", ("stage",))
+TURNS = Counter("turns_total", "Finished turns by outcome.", ("outcome",))
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens reported by the API.", ("kind",))
+LLM_DELTAS = Counter("llm_deltas_total", "Streamed reply deltas (also counted for aborted replies).")
+CHUNKS = Counter("chunks_emitted_total", "Reply sentences handed to the client.")
+
+_METRICS = [STAGE_SECONDS, STAGE_ERRORS, TURNS, LLM_TOKENS, LLM_DELTAS, CHUNKS]
+_COLLECTORS: list[Callable[[], list[tuple]]] = []
+
+
+def register_collector(fn: Callable[[], list[tuple]]):
+    """`fn()` -> [(name, help, type, [(labels dict, value)])], called at every scrape."""
+    _COLLECTORS.append(fn)
+
+
+def render(*collectors: Callable[[], list[tuple]]) -> str:
+    """The registered metrics and collectors, then `collectors` (for state the caller fetched itself)."""
+    lines = []
+    for m in _METRICS:
+        lines += m.render()
+    for fn in [*_COLLECTORS, *collectors]:
+        try:
+            families = fn()
+        except Exception:
+            continue  # a broken collector must not take /metrics down
+        for name, help, kind, samples in families:
+            full = _PREFIX + name
+            lines += [f"# HELP {full} {help}", f"# TYPE {full} {kind}"]
+            for labels, value in samples:
+                lines.append(f"{full}{_labels(labels.keys(), labels.values())} {value}")
+    return "\n".join(lines) + "\n"
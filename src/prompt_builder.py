@@ -0,0 +1,41 @@
+"""
+Chat prompt assembly with a cache-friendly layout.
+
+The static persona (`spells.pipa_core`) always comes first and never
+changes between requests, so the provider's prompt cache can reuse it.
+Everything that varies per turn (current time, speaker, memories) goes in a
+second system message after it, followed by the user's utterance.
+"""
+from src.config import local_now
+from src.spells import pipa_core, pipa_turn
+
+_SAID = "said:"
+
+
+def speaker_from_identity(identity: str) -> str:
+    """'Hilla said: ' -> 'Hilla'."""
+    identity = identity.strip()
+    return identity[: -len(_SAID)].strip() if identity.endswith(_SAID) else identity
+
+
+def build_messages(input_text: str, speaker: str, memories) -> list[dict]:
+    now = local_now().strftime("%A %Y-%m-%d %H:%M")
+    return [
+        {"role": "system", "content": pipa_core},
+        {"role": "system", "content": pipa_turn.format(now=now, speaker=speaker, memories=memories)},
+        {"role": "user", "content": input_text},
+    ]
+
+
+def log_usage(usage, logger):
+    """Log prompt/cached/completion token counts from a response `usage` field."""
+    if usage is None:
+        return
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    logger.info(
+        "LLM usage: prompt %s tokens (%s cached), completion %s tokens",
+        usage.prompt_tokens,
+        cached,
+        usage.completion_tokens,
+    )
@@ -0,0 +1,158 @@
+"""
+Incremental sentence segmentation for streamed LLM replies.
+
+`SentenceSegmenter.push(delta)` returns the chunks that became ready. It
+only scans characters it has not looked at yet (plus a short undecided
+tail), and it avoids the usual false splits: decimals ("3.5"),
+abbreviations ("Dr.", "Inc."), dotted acronyms ("U.S.", "p.m.", "e.g."),
+initials ("J.") and punctuation followed by closing quotes or emoji
+("Yay! 🎉") which stay with their sentence. A sentence that really ends in
+one of those runs on into the next chunk, which only costs a little
+latency.
+
+The first chunk is flushed eagerly, because time-to-first-audible-chunk
+is what the listener notices: at a clause boundary once `first_min_chars`
+are buffered, or at a word boundary once `first_max_ms` have passed since
+the first delta. After that, chunks end at sentence boundaries.
+"""
+import time
+import unicodedata
+from typing import Callable, Optional
+
+from src.config import SEGMENT_FIRST_MAX_MS, SEGMENT_FIRST_MIN_CHARS
+
+TERMINALS = ".!?…"
+CLAUSE = ",;:—–"
+CLOSERS = "\"')]}»”’"
+ABBREVIATIONS = frozenset(
+    {
+        "mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "approx", "ca",
+        "mt", "ft", "rev", "capt", "lt", "sgt", "gov", "inc", "ltd", "corp", "dept",
+        "jan", "feb", "aug", "sept", "oct", "nov",
+        # not "no", "fig", "gen", ...: ordinary words that end sentences too
+    }
+)
+_MIN_TIMED_CHARS = 12
+
+
+def _is_emoji(ch: str) -> bool:
+    cat = unicodedata.category(ch)
+    return cat in ("So", "Sk", "Cf") or ch == "\ufe0f" or 0x1F3FB <= ord(ch) <= 0x1F3FF
+
+
+class SentenceSegmenter:
+    def __init__(
+        self,
+        first_min_chars: int = SEGMENT_FIRST_MIN_CHARS,
+        first_max_ms: float = SEGMENT_FIRST_MAX_MS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.first_min_chars = first_min_chars
+        self.first_max_ms = first_max_ms
+        self._clock = clock
+        self._buf = ""
+        self._scan = 0              # next index in _buf not yet examined
+        self._last_clause = -1      # end of the latest clause boundary seen (first chunk only)
+        self._last_space = -1       # latest whitespace index (first chunk only)
+        self._started_at: Optional[float] = None
+        self.emitted = 0
+
+    def _word_before(self, i: int) -> str:
+        j = i
+        while j > 0 and (self._buf[j - 1].isalpha() or self._buf[j - 1] == "."):
+            j -= 1
+        return self._buf[j:i].lower()
+
+    def _sentence_end(self, i: int) -> Optional[int]:
+        """
+        For terminal punctuation at i: index just past the sentence
+        (including closers/emoji), -1 if not a boundary, None if we need
+        more text to decide.
+        """
+        buf = self._buf
+        ch = buf[i]
+        if ch == ".":
+            prev = buf[i - 1] if i > 0 else ""
+            if prev.isdigit() and (i + 1 >= len(buf) or buf[i + 1].isdigit()):
+                return None if i + 1 >= len(buf) else -1
+            word = self._word_before(i)
+            if word in ABBREVIATIONS or (len(word) == 1 and buf[i - 1].isupper()):
+                return -1
+            parts = word.split(".")
+            if len(parts) > 1 and all(len(p) == 1 for p in parts):
+                return -1  # dotted acronym: "U.S.", "p.m.", "e.g.", "i.e."
+        j = i + 1
+        while j < len(buf) and (buf[j] in TERMINALS or buf[j] in CLOSERS or _is_emoji(buf[j])):
+            j += 1
+        if j >= len(buf):
+            return None
+        if not buf[j].isspace():
+            return -1
+        # "Great job! 🎉🐰 Now..." - emoji trailing a sentence belong to it
+        k = j
+        while k < len(buf) and buf[k] in " \t":
+            k += 1
+        if k >= len(buf):
+            return None
+        if not _is_emoji(buf[k]):
+            return j
+        while k < len(buf) and _is_emoji(buf[k]):
+            k += 1
+        if k >= len(buf):
+            return None
+        return k if buf[k].isspace() else j
+
+    def _cut(self, end: int) -> str:
+        chunk, self._buf = self._buf[:end], self._buf[end:]
+        self._scan = max(0, self._scan - end)
+        self._last_clause = -1
+        self._last_space = -1
+        self.emitted += 1
+        return chunk
+
+    def push(self, delta: str) -> list[str]:
+        if not delta:
+            return []
+        if self._started_at is None:
+            self._started_at = self._clock()
+        self._buf += delta
+        out = []
+
+        i = self._scan
+        while i < len(self._buf):
+            ch = self._buf[i]
+            if ch in TERMINALS:
+                end = self._sentence_end(i)
+                if end is None:
+                    break  # undecided: re-check from here when more text arrives
+                if end > 0:
+                    out.append(self._cut(end))
+                    i = 0
+                    continue
+            elif self.emitted == 0:
+                if ch.isspace():
+                    self._last_space = i
+                    if i > 0 and self._buf[i - 1] in CLAUSE:
+                        self._last_clause = i
+            i += 1
+        self._scan = i
+
+        if self.emitted == 0 and not out:
+            chunk = self._eager_first()
+            if chunk:
+                out.append(chunk)
+        return out
+
+    def _eager_first(self) -> Optional[str]:
+        if self._last_clause >= self.first_min_chars:
+            return self._cut(self._last_clause)
+        waited_ms = (self._clock() - self._started_at) * 1000
+        if waited_ms >= self.first_max_ms and self._last_space >= _MIN_TIMED_CHARS:
+            return self._cut(self._last_space)
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Whatever is left at the end of the stream."""
+        if not self._buf:
+            return None
+        return self._cut(len(self._buf))
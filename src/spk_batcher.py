@@ -0,0 +1,72 @@
+"""
+Cross-request micro-batching for ECAPA speaker embeddings.
+
+Concurrent callers hand in preprocessed 16 kHz waveforms; a single collector
+thread groups whatever arrives within a short window into one
+`encode_batch` call and resolves each caller's future with its own
+unit-normalized embedding.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from src.config import SPK_BATCH_MAX, SPK_BATCH_WAIT_MS, logger
+from src.enroll_voice import embed_batch
+
+
+class EmbeddingBatcher:
+    def __init__(self, max_batch: int = SPK_BATCH_MAX, max_wait_ms: float = SPK_BATCH_WAIT_MS):
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._q: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="spk-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, wav) -> Future:
+        """Queue one (1, samples) 16 kHz waveform; the future yields its embedding."""
+        fut: Future = Future()
+        self._q.put((wav, fut))
+        return fut
+
+    def embed(self, wav, timeout=None):
+        return self.submit(wav).result(timeout=timeout)
+
+    def _collect(self) -> list:
+        items = [self._q.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                items.append(self._q.get(timeout=remaining) if remaining > 0 else self._q.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            items = [(w, f) for w, f in items if f.set_running_or_notify_cancel()]
+            if not items:
+                continue
+            try:
+                embs = embed_batch([w for w, _ in items])
+            except Exception as e:
+                logger.exception("speaker embedding batch of %d failed", len(items))
+                for _, f in items:
+                    f.set_exception(e)
+                continue
+            for (_, f), emb in zip(items, embs):
+                f.set_result(emb)
+
+
+_BATCHER = None
+_BATCHER_LOCK = threading.Lock()
+
+
+def get_batcher() -> EmbeddingBatcher:
+    global _BATCHER
+    with _BATCHER_LOCK:
+        if _BATCHER is None:
+            _BATCHER = EmbeddingBatcher()
+        return _BATCHER
@@ -0,0 +1,254 @@
+"""
+Process-pool speaker identification.
+
+Each worker is a long-lived process that loads the ECAPA model and the
+voiceprint index once, pins torch to a fixed number of intra-op threads and
+then serves identify requests one at a time. WAV bytes travel through
+`multiprocessing.shared_memory` instead of being pickled onto a pipe.
+
+In the parent, one dispatcher thread per worker pulls jobs from a shared
+queue, so a crashed worker only affects its own in-flight job: the process
+is restarted and that job retried once, while the other workers carry on.
+A worker that dies again while starting is retried with backoff; its
+dispatcher takes no jobs until it is back.
+"""
+import collections
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+from src.audio_front import DecodedAudio, decode_wav
+from src.config import SPK_POOL_TORCH_THREADS, SPK_POOL_WORKERS, logger
+
+_CTX = mp.get_context("spawn")
+_POLL_S = 0.5
+_RESTART_BACKOFF_S = (0.5, 30.0)  # first and longest wait between failed restarts
+
+
+def _worker_main(conn, torch_threads: int):
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    torch.set_num_interop_threads(1)
+
+    from src.config import VOICEPRINT_DB
+    from src.enroll_voice import get_classifier
+    from src.whos_voice import _resolve_db, get_index, who_is_speaking
+
+    get_classifier()
+    resolved = _resolve_db(VOICEPRINT_DB)
+    if resolved is not None:
+        get_index(resolved).snapshot()
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        shm_name, nbytes, kwargs = msg
+        shm = shared_memory.SharedMemory(name=shm_name)
+        try:
+            # decode straight out of shared memory; no copy of the payload. One request
+            # at a time per process: the in-process batcher would only add its wait window
+            audio = decode_wav(shm.buf[:nbytes])
+            conn.send(("ok", who_is_speaking(audio, batch=False, **kwargs)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+        finally:
+            try:
+                shm.close()
+            except BufferError:
+                # a view is still referenced (e.g. by a traceback); let GC close it
+                pass
+
+
+class _Slot:
+    """Parent-side handle for one worker process."""
+
+    def __init__(self, idx: int, torch_threads: int):
+        self.idx = idx
+        self.torch_threads = torch_threads
+        self.proc = None
+        self.conn = None
+        self.busy = False
+        self.busy_s = 0.0
+        self.restarts = 0
+        self.started_at = time.monotonic()
+
+    def start(self):
+        parent, child = _CTX.Pipe()
+        self.proc = _CTX.Process(
+            target=_worker_main,
+            args=(child, self.torch_threads),
+            name=f"spk-worker-{self.idx}",
+            daemon=True,
+        )
+        self.proc.start()
+        child.close()
+        self.conn = parent
+        status, pid = self.conn.recv()
+        logger.info("speaker-ID worker %d ready (pid %s)", self.idx, pid)
+
+    def _stop(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        if self.proc.is_alive():
+            self.proc.kill()
+        self.proc.join(timeout=5)
+
+    def restart(self):
+        """
+        Replace the worker process; retries with backoff until one comes up.
+        Blocks the slot's dispatcher meanwhile, so it takes no jobs while down.
+        """
+        delay, longest = _RESTART_BACKOFF_S
+        while True:
+            self.restarts += 1
+            self._stop()
+            logger.warning("restarting speaker-ID worker %d (restart #%d)", self.idx, self.restarts)
+            try:
+                self.start()
+                return
+            except (EOFError, OSError) as e:
+                # died while loading (e.g. out of memory): try again later
+                logger.error("speaker-ID worker %d failed to start: %r; retrying in %.1fs", self.idx, e, delay)
+                time.sleep(delay)
+                delay = min(2 * delay, longest)
+
+    def call(self, shm_name: str, nbytes: int, kwargs: dict):
+        """Send one job and wait for its reply; raises ChildProcessError if the worker died."""
+        try:
+            self.conn.send((shm_name, nbytes, kwargs))
+            while not self.conn.poll(_POLL_S):
+                if not self.proc.is_alive():
+                    raise ChildProcessError(f"worker exited with code {self.proc.exitcode}")
+            return self.conn.recv()
+        except (EOFError, OSError) as e:  # OSError: also a closed or broken connection
+            raise ChildProcessError(str(e)) from e
+
+
+class SpeakerIdPool:
+    def __init__(
+        self,
+        workers: int = SPK_POOL_WORKERS,
+        torch_threads: int = SPK_POOL_TORCH_THREADS,
+        latency_window: int = 1024,
+    ):
+        self._jobs: "queue.Queue[tuple]" = queue.Queue()
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._lat_lock = threading.Lock()
+        self._slots = [_Slot(i, torch_threads) for i in range(max(1, workers))]
+        for slot in self._slots:
+            slot.start()
+            threading.Thread(
+                target=self._dispatch, args=(slot,), name=f"spk-dispatch-{slot.idx}", daemon=True
+            ).start()
+
+    def submit(self, wav, **kwargs) -> Future:
+        """
+        Queue WAV bytes or a DecodedAudio for identification; the future
+        yields who_is_speaking's dict.
+        """
+        fut: Future = Future()
+        parts = wav.wav_parts() if isinstance(wav, DecodedAudio) else [memoryview(wav).cast("B")]
+        nbytes = sum(len(p) for p in parts)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, nbytes))
+        pos = 0
+        for p in parts:
+            shm.buf[pos : pos + len(p)] = p
+            pos += len(p)
+        self._jobs.put((shm, nbytes, kwargs, fut, time.monotonic()))
+        return fut
+
+    def identify(self, wav, timeout=None, **kwargs) -> dict:
+        return self.submit(wav, **kwargs).result(timeout=timeout)
+
+    def _dispatch(self, slot: _Slot):
+        while True:
+            shm, nbytes, kwargs, fut, queued_at = self._jobs.get()
+            try:
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                t0 = time.monotonic()
+                slot.busy = True
+                reply = None
+                for attempt in range(2):
+                    try:
+                        reply = slot.call(shm.name, nbytes, kwargs)
+                        break
+                    except ChildProcessError as e:
+                        logger.error("speaker-ID worker %d crashed: %s", slot.idx, e)
+                        slot.restart()
+                        if attempt == 1:
+                            reply = ("error", f"worker crashed twice: {e}")
+                slot.busy = False
+                done = time.monotonic()
+                slot.busy_s += done - t0
+                with self._lat_lock:
+                    self._latencies.append(done - queued_at)
+
+                status, payload = reply
+                if status == "ok":
+                    fut.set_result(payload)
+                else:
+                    fut.set_exception(RuntimeError(f"speaker identification failed: {payload}"))
+            except Exception as e:
+                slot.busy = False
+                logger.exception("speaker-ID dispatch failed")
+                if not fut.done():
+                    fut.set_exception(e)
+            finally:
+                shm.close()
+                shm.unlink()
+
+    def stats(self) -> dict:
+        """Queue depth, per-worker utilisation and recent end-to-end latency."""
+        now = time.monotonic()
+        with self._lat_lock:
+            lat = sorted(self._latencies)
+
+        def pct(p):
+            return round(lat[int(p * (len(lat) - 1))] * 1000, 1) if lat else None
+
+        return {
+            "queue_depth": self._jobs.qsize(),
+            "workers": [
+                {
+                    "pid": s.proc.pid,
+                    "busy": s.busy,
+                    "utilisation": round(s.busy_s / max(now - s.started_at, 1e-9), 3),
+                    "restarts": s.restarts,
+                }
+                for s in self._slots
+            ],
+            "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "count": len(lat)},
+        }
+
+    def close(self):
+        for s in self._slots:
+            try:
+                s.conn.send(None)
+            except Exception:
+                pass
+            s.proc.join(timeout=5)
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool() -> SpeakerIdPool:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = SpeakerIdPool()
+        return _POOL
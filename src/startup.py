@@ -0,0 +1,216 @@
+"""
+Cold start: lazy imports, one explicit warm-up, a readiness flag.
+
+Importing `src.app` no longer loads any model or touches the database;
+everything heavy is behind a `get_*()` accessor and is loaded here, in two
+halves:
+
+- `warm_models()`: read-only state that survives a fork: ECAPA weights, the
+  voiceprint index, the wake bank, the tokenizer and (for a local STT
+  policy) the Vosk model. With `preload_app` (gunicorn.conf.py) it runs once
+  in the gunicorn master and the forked workers share those pages
+  copy-on-write; otherwise every worker runs it itself. No forward pass and
+  no threads here: OpenMP and thread pools do not survive a fork.
+- `awarm_worker()`: per-process state: a first ECAPA forward pass, the
+  speaker-ID process pool, memory store + DB pools and the memory queue.
+  It runs as a background task at app startup, so the socket is accepted
+  immediately; `is_ready()` (and `/ready`) flips once it has finished.
+  A failed step is retried every STARTUP_RETRY_S until it succeeds.
+
+Every step is timed; each process logs its breakdown once it is ready,
+marking the steps it inherited from the master.
+"""
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from src.config import (
+    SPK_POOL_WORKERS,
+    STARTUP_RETRY_S,
+    STREAM_STT,
+    STT_POLICY,
+    VOICEPRINT_DB,
+    logger,
+)
+
+_T0 = time.perf_counter()
+_PHASES: list[dict] = []
+_PHASES_LOCK = threading.Lock()
+_last_mark = _T0
+
+_MODELS_LOCK = threading.Lock()
+_models_pid = None  # pid of the process that ran warm_models()
+_done: set[str] = set()
+_ready = False
+_started_at = None  # awarm_worker() start: this worker's clock when the master preloaded
+_ready_at = None
+_error = None
+
+
+def _record(name: str, seconds: float, ok: bool = True):
+    global _last_mark
+    with _PHASES_LOCK:
+        _PHASES.append({"phase": name, "seconds": round(seconds, 3), "pid": os.getpid(), "ok": ok})
+        _last_mark = time.perf_counter()
+
+
+@contextmanager
+def phase(name: str):
+    """Time the block as startup phase `name` (recorded as failed if it raises)."""
+    t = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        _record(name, time.perf_counter() - t, ok=False)
+        raise
+    _record(name, time.perf_counter() - t)
+
+
+def mark(name: str):
+    """Record the time since the previous phase (or since this module was imported) as `name`."""
+    _record(name, time.perf_counter() - _last_mark)
+
+
+def uses_vosk() -> bool:
+    """Whether this server runs Vosk (and so warms its model); streams may only pick "vosk" then."""
+    return STT_POLICY != "cloud" or STREAM_STT == "vosk"
+
+
+def warm_models():
+    """Load the fork-safe, read-only models once per process tree (idempotent)."""
+    global _models_pid
+    with _MODELS_LOCK:
+        if _models_pid is not None:
+            return
+        if SPK_POOL_WORKERS == 0:
+            # with a speaker-ID pool, its spawned processes hold the model instead
+            with phase("ecapa_load"):
+                from src.enroll_voice import get_classifier
+
+                get_classifier()
+            with phase("voiceprints"):
+                from src.whos_voice import _resolve_db, get_index
+
+                resolved = _resolve_db(VOICEPRINT_DB)
+                if resolved is not None:
+                    get_index(resolved).snapshot()
+        with phase("wake_bank"):
+            from src.wakeup import get_wake_bank
+
+            get_wake_bank()
+        with phase("tokenizer"):
+            from src.memory_context import count_tokens
+
+            count_tokens("")
+        if uses_vosk():
+            with phase("vosk_model"):
+                from src.vosk_model import get_vosk_model
+
+                get_vosk_model()
+        _models_pid = os.getpid()
+
+
+def _ecapa_forward():
+    import torch
+
+    from src.enroll_voice import embed_batch
+
+    embed_batch([torch.zeros(1, 16000)])  # 1 s of silence: allocator + thread pools
+
+
+def _speaker_pool():
+    from src.spk_pool import get_pool
+
+    get_pool()  # blocks until every worker process has loaded its model
+
+
+def _memory_queue():
+    from src.memory_queue import get_memory_queue
+
+    get_memory_queue()
+
+
+async def _memory_store():
+    from src.mem_manager import awarm_pools
+
+    await awarm_pools()
+
+
+def _worker_steps():
+    steps = [("models", lambda: asyncio.to_thread(warm_models))]
+    if SPK_POOL_WORKERS == 0:
+        steps.append(("ecapa_forward", lambda: asyncio.to_thread(_ecapa_forward)))
+    else:
+        steps.append(("speaker_pool", lambda: asyncio.to_thread(_speaker_pool)))
+    steps += [
+        ("memory_store", _memory_store),
+        ("memory_queue", lambda: asyncio.to_thread(_memory_queue)),
+    ]
+    return steps
+
+
+async def awarm_worker():
+    """Run the per-process warm-up until every step has succeeded, then mark the process ready."""
+    global _ready, _started_at, _ready_at, _error
+    _started_at = time.perf_counter()
+    while True:
+        try:
+            for name, step in _worker_steps():
+                if name in _done:
+                    continue
+                if name == "models":
+                    await step()  # times its own sub-phases
+                else:
+                    with phase(name):
+                        await step()
+                _done.add(name)
+            break
+        except Exception as e:
+            _error = f"{name}: {e!r}"
+            logger.exception("startup step %s failed; retrying in %.0fs", name, STARTUP_RETRY_S)
+            await asyncio.sleep(STARTUP_RETRY_S)
+    _error = None
+    _ready, _ready_at = True, time.perf_counter()
+    log_breakdown()
+
+
+def is_ready() -> bool:
+    return _ready
+
+
+def breakdown() -> dict:
+    """Per-phase startup times of this process; phases run in the master are marked `inherited`."""
+    pid = os.getpid()
+    preloaded = _models_pid is not None and _models_pid != pid
+    with _PHASES_LOCK:
+        phases = [
+            {**{k: v for k, v in p.items() if k != "pid"}, "inherited": p["pid"] != pid}
+            for p in _PHASES
+        ]
+    return {
+        "ready": _ready,
+        "pid": pid,
+        "preloaded": preloaded,
+        "seconds_to_ready": (
+            round(_ready_at - (_started_at if preloaded else _T0), 3) if _ready_at is not None else None
+        ),
+        "error": _error,
+        "phases": phases,
+    }
+
+
+def log_breakdown():
+    b = breakdown()
+    lines = [
+        f"  {p['phase']:<14} {p['seconds']:>8.3f}s"
+        + (" (master)" if p["inherited"] else "")
+        + ("" if p["ok"] else " FAILED")
+        for p in b["phases"]
+    ]
+    logger.info(
+        "startup of pid %s: ready after %ss%s\n%s",
+        b["pid"], b["seconds_to_ready"], " (models preloaded)" if b["preloaded"] else "",
+        "\n".join(lines),
+    )
@@ -0,0 +1,206 @@
+"""
+Streaming ingestion for one utterance.
+
+The websocket client sends a start frame with the PCM format, then raw PCM
+chunks, then an end frame. Every chunk is fed to incremental consumers as it
+arrives, so recognition overlaps the upload:
+
+- StreamingVad tracks speech and pauses;
+- speaker ID starts as soon as a full embedding window has been buffered;
+- STT is either a local Vosk recognizer fed chunk by chunk, or the cloud
+  client transcribing each pause-delimited segment while later audio is
+  still arriving.
+
+`finish()` waits for whatever is still running and returns the same
+(identity prefix, transcript) pair as `transcribe_with_identify_async`.
+"""
+import asyncio
+import json
+from typing import Optional, Tuple
+
+import numpy as np
+
+from src.audio_front import from_pcm, mono_float
+from src.config import (
+    STREAM_SEGMENT_PAUSE_MS,
+    STREAM_SPK_WINDOW_S,
+    STREAM_STT,
+    VAD_MIN_SPEECH_S,
+    logger,
+)
+from src.startup import uses_vosk
+from src.stt_backends import get_stt
+from src.transcribe import _compose, _identify_async, _stt_async
+from src.vad import StreamingVad, detect_speech
+
+_MIN_SEGMENT_SPEECH_S = 1.0
+
+
+class StreamFormatError(ValueError):
+    pass
+
+
+class _VoskStream:
+    """Full-vocabulary Vosk recognizer fed from a queue on a worker thread."""
+
+    def __init__(self, sample_rate: int):
+        from vosk import KaldiRecognizer
+
+        from src.vosk_model import get_vosk_model
+
+        # same shared model as VoskBackend; only the recognizer is per-stream
+        self._rec = KaldiRecognizer(get_vosk_model(get_stt().local.model_path), sample_rate)
+        self._q: asyncio.Queue = asyncio.Queue()
+        self._parts: list[str] = []
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            chunk = await self._q.get()
+            if chunk is None:
+                final = await asyncio.to_thread(self._rec.FinalResult)
+                self._parts.append(json.loads(final).get("text", ""))
+                return
+            if await asyncio.to_thread(self._rec.AcceptWaveform, chunk):
+                self._parts.append(json.loads(self._rec.Result()).get("text", ""))
+
+    def feed(self, mono_int16: bytes):
+        self._q.put_nowait(mono_int16)
+
+    def cancel(self):
+        self._task.cancel()
+
+    async def finish(self) -> str:
+        self._q.put_nowait(None)
+        await self._task
+        return " ".join(p for p in self._parts if p)
+
+
+class StreamingSession:
+    def __init__(
+        self,
+        sample_rate: int,
+        channels: int = 1,
+        sample_width: int = 2,
+        stt: str = STREAM_STT,
+    ):
+        if sample_rate < 1 or channels < 1 or sample_width not in (1, 2, 4):
+            raise StreamFormatError("unsupported stream format")
+        if stt not in ("cloud", "vosk"):
+            raise StreamFormatError(f"unknown stt: {stt!r}")
+        if stt == "vosk" and not uses_vosk():
+            # its model is not warmed here: loading it would stall the event loop
+            raise StreamFormatError("local STT (vosk) is not enabled on this server")
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.bits = sample_width * 8
+        self._align = channels * sample_width
+        self._pcm = bytearray()
+        self._pending = b""
+        self._vad = StreamingVad(sample_rate)
+        self._speaker: Optional[asyncio.Task] = None
+        self._segments: list[asyncio.Task] = []
+        self._segment_start = 0
+        self._segment_speech_at_start = 0.0
+        self._vosk = _VoskStream(sample_rate) if stt == "vosk" else None
+
+    @classmethod
+    def from_start_frame(cls, frame: dict) -> "StreamingSession":
+        try:
+            return cls(
+                sample_rate=int(frame.get("sample_rate", 16000)),
+                channels=int(frame.get("channels", 1)),
+                sample_width=int(frame.get("sample_width", 2)),
+                stt=frame.get("stt", STREAM_STT),
+            )
+        except (TypeError, ValueError) as e:
+            raise StreamFormatError(str(e)) from e
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._pcm)
+
+    def _audio(self, start: int = 0, end: Optional[int] = None):
+        return from_pcm(bytes(self._pcm[start:end]), self.sample_rate, self.channels, self.bits)
+
+    def feed(self, chunk: bytes):
+        """Accept one PCM chunk; never blocks on recognition."""
+        data = self._pending + chunk
+        cut = len(data) - len(data) % self._align
+        data, self._pending = data[:cut], data[cut:]
+        if not data:
+            return
+        self._pcm += data
+
+        piece = from_pcm(data, self.sample_rate, self.channels, self.bits)
+        mono = mono_float(piece)
+        self._vad.feed(mono)
+
+        if self._vosk is not None:
+            self._vosk.feed(np.clip(mono * 32768.0, -32768, 32767).astype("<i2").tobytes())
+
+        if self._speaker is None and self._vad.speech_s >= STREAM_SPK_WINDOW_S:
+            # enough voiced audio for a stable embedding: identify now, not at the end
+            self._speaker = asyncio.create_task(_identify_async(self._audio()))
+
+        if (
+            self._vosk is None
+            and self._vad.pause_ms >= STREAM_SEGMENT_PAUSE_MS
+            and self._vad.speech_s - self._segment_speech_at_start >= _MIN_SEGMENT_SPEECH_S
+        ):
+            end = len(self._pcm)
+            self._segments.append(
+                asyncio.create_task(_stt_async(self._audio(self._segment_start, end), get_stt().cloud))
+            )
+            self._segment_start = end
+            self._segment_speech_at_start = self._vad.speech_s
+
+    async def finish(self) -> Tuple[Optional[str], str]:
+        """
+        Close the stream. Returns (identity prefix, transcript), or (None, "")
+        when the VAD found no usable speech.
+        """
+        audio = self._audio()
+        speech = await asyncio.to_thread(detect_speech, mono_float(audio), self.sample_rate)
+        if speech.speech_s < VAD_MIN_SPEECH_S:
+            self.cancel()
+            logger.info(
+                "empty capture (VAD): %.2fs speech in %.2fs", speech.speech_s, speech.total_s
+            )
+            return None, ""
+
+        if self._speaker is None:
+            self._speaker = asyncio.create_task(
+                _identify_async(audio.trim(speech.start, speech.end))
+            )
+
+        if self._vosk is not None:
+            text_task = asyncio.ensure_future(self._vosk.finish())
+        else:
+            if self._segment_start < len(self._pcm) and self._vad.speech_s > self._segment_speech_at_start:
+                self._segments.append(
+                    asyncio.create_task(_stt_async(self._audio(self._segment_start), get_stt().cloud))
+                )
+            text_task = asyncio.ensure_future(self._join_segments())
+
+        try:
+            speaker, text = await asyncio.gather(self._speaker, text_task)
+        except BaseException:
+            # one side failed: gather does not stop the other, so drop it here
+            text_task.cancel()
+            self.cancel()
+            raise
+        logger.info("Speaker ID result: %s", speaker)
+        logger.info("Transcribed (stream): %s", text)
+        return _compose(speaker, text)
+
+    def cancel(self):
+        """Drop all background recognition for an abandoned stream."""
+        for t in self._segments + ([self._speaker] if self._speaker else []):
+            t.cancel()
+        if self._vosk is not None:
+            self._vosk.cancel()
+
+    async def _join_segments(self) -> str:
+        parts = await asyncio.gather(*self._segments)
+        return " ".join(p.strip() for p in parts if p and p.strip())
@@ -0,0 +1,173 @@
+"""
+Pluggable transcription backends.
+
+- OpenAIBackend: the hosted `gpt-4o-mini-transcribe` model (the original path).
+- VoskBackend: in-process Kaldi recognizer; the model is loaded once and
+  shared by every request, each request only creates a cheap recognizer.
+
+`SttRouter` picks between them per utterance:
+
+    "cloud"        always OpenAI
+    "local"        always Vosk
+    "local-first"  Vosk for utterances up to STT_LOCAL_MAX_S, OpenAI above
+    "race"         run both, take the first acceptable (non-empty) result
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from src.audio_front import DecodedAudio, mono_float
+from src.config import STT_LOCAL_MAX_S, STT_POLICY, VOSK_MODEL_PATH, aclient, client, logger
+
+OPENAI_STT_MODEL = "gpt-4o-mini-transcribe"
+
+
+def _acceptable(text) -> bool:
+    return bool(text and str(text).strip())
+
+
+class TranscriptionBackend:
+    name = "base"
+
+    def transcribe(self, audio: DecodedAudio) -> str:
+        raise NotImplementedError
+
+    async def atranscribe(self, audio: DecodedAudio) -> str:
+        return await asyncio.to_thread(self.transcribe, audio)
+
+
+class OpenAIBackend(TranscriptionBackend):
+    name = "openai"
+
+    def __init__(self, model: str = OPENAI_STT_MODEL):
+        self.model = model
+
+    def transcribe(self, audio: DecodedAudio) -> str:
+        return client.audio.transcriptions.create(
+            model=self.model,
+            file=audio.file(),     # read-only view over the payload, named speech.wav
+            response_format="text" # Whisper-style plain string
+        )
+
+    async def atranscribe(self, audio: DecodedAudio) -> str:
+        return await aclient.audio.transcriptions.create(
+            model=self.model,
+            file=audio.file(),
+            response_format="text",
+        )
+
+
+class VoskBackend(TranscriptionBackend):
+    name = "vosk"
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH):
+        self.model_path = model_path
+
+    def transcribe(self, audio: DecodedAudio, cancelled: threading.Event = None) -> str:
+        from vosk import KaldiRecognizer
+
+        from src.vosk_model import get_vosk_model
+
+        rec = KaldiRecognizer(get_vosk_model(self.model_path), audio.sample_rate)
+        pcm = np.clip(mono_float(audio) * 32768.0, -32768, 32767).astype("<i2").tobytes()
+        parts = []
+        step = audio.sample_rate * 2  # ~1 s of int16 per call
+        for i in range(0, len(pcm), step):
+            if cancelled is not None and cancelled.is_set():
+                return ""  # nobody is waiting for this any more
+            if rec.AcceptWaveform(pcm[i : i + step]):
+                parts.append(json.loads(rec.Result()).get("text", ""))
+        parts.append(json.loads(rec.FinalResult()).get("text", ""))
+        return " ".join(p for p in parts if p)
+
+    async def atranscribe(self, audio: DecodedAudio) -> str:
+        # the thread cannot be cancelled; it checks this flag between ~1 s chunks
+        cancelled = threading.Event()
+        try:
+            return await asyncio.to_thread(self.transcribe, audio, cancelled)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+
+class SttRouter:
+    def __init__(
+        self,
+        policy: str = STT_POLICY,
+        local_max_s: float = STT_LOCAL_MAX_S,
+        cloud: TranscriptionBackend = None,
+        local: TranscriptionBackend = None,
+    ):
+        if policy not in ("cloud", "local", "local-first", "race"):
+            raise ValueError(f"unknown STT policy: {policy}")
+        self.policy = policy
+        self.local_max_s = local_max_s
+        self.cloud = cloud or OpenAIBackend()
+        self.local = local or VoskBackend()
+        self._race_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="stt-race")
+
+    def _pick(self, audio: DecodedAudio) -> TranscriptionBackend:
+        if self.policy == "local":
+            return self.local
+        if self.policy == "local-first" and audio.duration_s <= self.local_max_s:
+            return self.local
+        return self.cloud
+
+    def transcribe(self, audio: DecodedAudio) -> str:
+        if self.policy != "race":
+            return self._pick(audio).transcribe(audio)
+
+        futures = {self._race_pool.submit(b.transcribe, audio): b for b in (self.local, self.cloud)}
+        pending, last_error = set(futures), None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    text = f.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if _acceptable(text):
+                    logger.info("STT race won by %s", futures[f].name)
+                    return text
+        if last_error is not None:
+            raise last_error
+        return ""
+
+    async def atranscribe(self, audio: DecodedAudio) -> str:
+        if self.policy != "race":
+            return await self._pick(audio).atranscribe(audio)
+
+        tasks = {
+            asyncio.ensure_future(b.atranscribe(audio)): b for b in (self.local, self.cloud)
+        }
+        pending, last_error = set(tasks), None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    if t.exception() is not None:
+                        last_error = t.exception()
+                        continue
+                    if _acceptable(t.result()):
+                        logger.info("STT race won by %s", tasks[t].name)
+                        return t.result()
+        finally:
+            for t in pending:
+                t.cancel()
+        if last_error is not None:
+            raise last_error
+        return ""
+
+
+_ROUTER = None
+
+
+def get_stt() -> SttRouter:
+    global _ROUTER
+    if _ROUTER is None:
+        _ROUTER = SttRouter()
+    return _ROUTER
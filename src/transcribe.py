@@ -1,98 +1,79 @@
-import io
-import queue
-import sys
-import threading
-import wave
-from typing import Tuple
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Union
 
-import numpy as np
-import sounddevice as sd
-from openai import OpenAI
+from src import admission, turns
+from src.audio_front import DecodedAudio, decode_wav
+from src.config import SPK_BATCH_MAX, SPK_POOL_WORKERS, logger
+from src.spk_pool import get_pool
+from src.stt_backends import get_stt
+from src.whos_voice import who_is_speaking
 
-from src.config import client, logger
-from whos_voice import who_is_speaking
 
-MODEL = "gpt-4o-mini-transcribe"
 
+def _as_audio(wav_bytes) -> DecodedAudio:
+    if isinstance(wav_bytes, DecodedAudio):
+        return wav_bytes
+    if isinstance(wav_bytes, (bytes, bytearray, memoryview)):
+        # Parses the RIFF header; raises ValueError on anything that isn't WAV
+        return decode_wav(wav_bytes)
+    raise TypeError("transcribe_with_identify_async expects WAV bytes")
 
 
-def transcribe_with_identify(wav_bytes: bytes) -> Tuple[str, str]:
+def _compose(speaker_dict, text) -> Tuple[str, str]:
+    speaker_dict = speaker_dict or {}
+    speaker_id = speaker_dict.get("speaker_id", "Someone")
+    return f"{speaker_id} said: ", text or ""
+
+
+# Sized so concurrent requests can fill a speaker-embedding micro-batch
+_SPEAKER_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(2, SPK_BATCH_MAX), thread_name_prefix="speaker-identify"
+)
+
+
+async def _identify_async(audio: DecodedAudio) -> dict:
+    async with admission.stage("speaker_id").slot():
+        with turns.span("speaker_id"):
+            if SPK_POOL_WORKERS > 0:
+                return await asyncio.wrap_future(get_pool().submit(audio))
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(_SPEAKER_EXECUTOR, who_is_speaking, audio)
+
+
+async def _stt_async(audio: DecodedAudio, backend=None) -> str:
+    async with admission.stage("stt").slot():
+        with turns.span("stt"):
+            return await (backend or get_stt()).atranscribe(audio)
+
+
+async def transcribe_with_identify_async(
+    wav_bytes: Union[bytes, DecodedAudio],
+) -> Tuple[str, str]:
     """
-    Accepts raw WAV bytes, identifies the speaker, and transcribes the audio
-    in parallel threads.
+    Accepts raw WAV bytes (or audio already decoded and trimmed by the
+    front end), identifies the speaker and transcribes the audio
+    concurrently. STT is awaited through the configured backend router and
+    speaker ID runs off-loop (thread executor or the speaker-ID process
+    pool), so other sockets keep being served. The payload is decoded
+    once; both read the same buffer without copying it.
 
     Returns:
         (f"{speaker_id} said: ", transcript_text)
 
     Raises:
-        TypeError: if wav_bytes is not bytes/bytearray
+        TypeError: if wav_bytes is not bytes/bytearray/DecodedAudio
         ValueError: if the payload doesn't look like a WAV file
-        Any exception raised by who_is_speaking or the transcription client
+        Any exception raised by speaker ID or the transcription backend
     """
-
-    if not isinstance(wav_bytes, (bytes, bytearray)):
-        raise TypeError("transcribe_with_identify expects WAV bytes")
-
-    # Minimal RIFF/WAVE sanity check
-    if len(wav_bytes) < 12 or wav_bytes[:4] != b"RIFF" or wav_bytes[8:12] != b"WAVE":
-        raise ValueError("Provided data does not appear to be a valid WAV file")
-
-    # Independent buffers for each worker to avoid pointer contention
-    stt_buf = io.BytesIO(wav_bytes)
-    stt_buf.name = "speech.wav"
-    stt_buf.seek(0)
-
-    spk_buf = io.BytesIO(wav_bytes)
-    spk_buf.name = "speech.wav"
-    spk_buf.seek(0)
-
-    # Shared result/exception holders
-    results = {"speaker": None, "text": None}
-    errors = {"speaker": None, "stt": None}
-
-    def speaker_worker():
-        try:
-            speaker_dict = who_is_speaking(spk_buf)
-            logger.info("Speaker ID result: %s", speaker_dict)
-            results["speaker"] = speaker_dict
-        except Exception as e:  # propagate later
-            errors["speaker"] = e
-
-    def stt_worker():
-        try:
-            # Ensure buffer is at start in case client reads from current offset
-            stt_buf.seek(0)
-            txt = client.audio.transcriptions.create(
-                model=MODEL,           # e.g., "whisper-1" or "gpt-4o-transcribe"
-                file=stt_buf,          # file-like; .name is set above
-                response_format="text" # Whisper-style plain string
-            )
-            logger.info("Transcribed: %s", txt)
-            results["text"] = txt
-        except Exception as e:
-            errors["stt"] = e
-
-    t_speaker = threading.Thread(target=speaker_worker, name="speaker-identify", daemon=True)
-    t_stt = threading.Thread(target=stt_worker, name="speech-to-text", daemon=True)
-
-    # Kick off both in parallel
-    t_speaker.start()
-    t_stt.start()
-
-    # Wait for both to finish
-    t_speaker.join()
-    t_stt.join()
-
-    # If either thread failed, raise the first encountered error
-    if errors["speaker"]:
-        raise errors["speaker"]
-    if errors["stt"]:
-        raise errors["stt"]
-
-    # Compose result
-    speaker_dict = results["speaker"] or {}
-    speaker_id = speaker_dict.get("speaker_id", "Someone")
-    identity_prefix = f"{speaker_id} said: "
-    transcript_text = results["text"] or ""
-
-    return identity_prefix, transcript_text
+    audio = _as_audio(wav_bytes)
+    speaker, text = await asyncio.gather(
+        _identify_async(audio), _stt_async(audio), return_exceptions=True
+    )
+    if isinstance(speaker, BaseException):
+        raise speaker
+    if isinstance(text, BaseException):
+        raise text
+    logger.info("Speaker ID result: %s", speaker)
+    logger.info("Transcribed: %s", text)
+    return _compose(speaker, text)
@@ -0,0 +1,160 @@
+"""
+Per-turn bookkeeping shared by the server and the pipeline.
+
+`ws_handler` creates a `Turn` (with its request ID) for every message that
+starts a pipeline and `_run_turn` binds it to the context the pipeline task
+is created in, so everything the turn awaits (`awake_mode` ->
+`transcribe_with_identify_async` -> `memory_cache` / `mem_manager`) sees it
+without passing it around. Stages are wrapped in `span("stt")`: the
+duration goes to the `stage_seconds` histogram (see `metrics`), failures to
+`stage_errors_total`, and both to the turn's own breakdown, which is
+logged in full for turns slower than SLOW_TURN_MS.
+
+When the client disconnects mid-turn, the task is cancelled and
+`record_abort` logs the work that was spent for nobody (wall time, stage
+reached, reply tokens generated, sentences never delivered) and adds it to
+the totals in `abort_stats()`.
+"""
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+from uuid import uuid4
+
+from src.config import SLOW_TURN_LOG, SLOW_TURN_MS, logger
+from src.metrics import STAGE_ERRORS, STAGE_SECONDS, TURNS
+
+
+@dataclass
+class Turn:
+    request_id: str = field(default_factory=lambda: uuid4().hex[:12])
+    started: float = field(default_factory=time.perf_counter)
+    stage: str = "received"
+    spans: list = field(default_factory=list)  # (stage, start offset s, seconds, ok)
+    reply: str = ""             # reply text generated so far (set when the turn is cut short)
+    chunks_emitted: int = 0     # sentences handed to the server
+    chunks_sent: int = 0        # sentences that reached the socket
+    persisted: Optional[str] = None  # MEMORY_ON_ABORT outcome for an interrupted turn
+
+
+_CURRENT: ContextVar[Optional[Turn]] = ContextVar("turn", default=None)
+
+_ABORTS = {"turns": 0, "wasted_s": 0.0, "reply_tokens": 0, "undelivered_chunks": 0, "by_stage": {}}
+
+
+def bind(turn: Turn):
+    """Make `turn` current for tasks created from here on; returns the token for `unbind`."""
+    return _CURRENT.set(turn)
+
+
+def unbind(token):
+    _CURRENT.reset(token)
+
+
+def current() -> Optional[Turn]:
+    return _CURRENT.get()
+
+
+@contextmanager
+def span(name: str, turn: Optional[Turn] = None):
+    """Time one pipeline stage (of `turn`, default: the current one; also fine outside a turn)."""
+    turn = turn or _CURRENT.get()
+    if turn is not None:
+        turn.stage = name
+    t = time.perf_counter()
+    ok = False
+    try:
+        yield
+        ok = True
+    except asyncio.CancelledError:
+        raise
+    except BaseException:
+        STAGE_ERRORS.inc(name)
+        raise
+    finally:
+        seconds = time.perf_counter() - t
+        if ok:
+            STAGE_SECONDS.observe(seconds, name)
+        if turn is not None:
+            turn.spans.append((name, t - turn.started, seconds, ok))
+
+
+def observe(name: str, seconds: float):
+    """Record an interval measured by the caller (e.g. time to first token) as a stage."""
+    STAGE_SECONDS.observe(seconds, name)
+    turn = _CURRENT.get()
+    if turn is not None:
+        turn.spans.append((name, time.perf_counter() - turn.started - seconds, seconds, True))
+
+
+def _log_slow(turn: Turn, outcome: str, total: float):
+    rows = "\n".join(
+        f"  {name:<22} +{1000 * start:>7.0f} ms {1000 * seconds:>9.1f} ms" + ("" if ok else "  FAILED")
+        for name, start, seconds, ok in sorted(turn.spans, key=lambda s: s[1])
+    )
+    logger.warning("slow turn %s (%s): %.0f ms\n%s", turn.request_id, outcome, 1000 * total, rows)
+    if SLOW_TURN_LOG:
+        rec = {
+            "request_id": turn.request_id,
+            "outcome": outcome,
+            "total_ms": round(1000 * total, 1),
+            "spans": [
+                {"stage": n, "start_ms": round(1000 * st, 1), "ms": round(1000 * sec, 1), "ok": ok}
+                for n, st, sec, ok in turn.spans
+            ],
+        }
+        try:
+            with open(SLOW_TURN_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec) + "\n")
+        except OSError as e:
+            logger.warning("could not write slow turn log: %s", e)
+
+
+# turns refused before the pipeline ran: counted, but kept out of the "turn" latency
+_REFUSED = {"busy", "rate_limited", "invalid", "abandoned", "timeout"}
+
+
+def finish(turn: Turn, outcome: str) -> float:
+    """Close the turn: total latency, outcome counter and, past SLOW_TURN_MS, the breakdown."""
+    total = time.perf_counter() - turn.started
+    if outcome not in _REFUSED:
+        STAGE_SECONDS.observe(total, "turn")
+    TURNS.inc(outcome)
+    logger.info("turn %s %s in %.0f ms", turn.request_id, outcome, 1000 * total)
+    if SLOW_TURN_MS and 1000 * total >= SLOW_TURN_MS:
+        _log_slow(turn, outcome, total)
+    return total
+
+
+def record_abort(turn: Turn, reason: str) -> dict:
+    """Log and total what an abandoned turn cost."""
+    from src.memory_context import count_tokens
+
+    try:
+        reply_tokens = count_tokens(turn.reply) if turn.reply else 0
+    except Exception:
+        reply_tokens = len(turn.reply) // 4  # tokenizer unavailable: rough estimate
+    wasted = {
+        "request_id": turn.request_id,
+        "reason": reason,
+        "stage": turn.stage,
+        "seconds": round(time.perf_counter() - turn.started, 3),
+        "reply_tokens": reply_tokens,
+        "undelivered_chunks": max(0, turn.chunks_emitted - turn.chunks_sent),
+        "persisted": turn.persisted,
+    }
+    _ABORTS["turns"] += 1
+    _ABORTS["wasted_s"] += wasted["seconds"]
+    _ABORTS["reply_tokens"] += reply_tokens
+    _ABORTS["undelivered_chunks"] += wasted["undelivered_chunks"]
+    _ABORTS["by_stage"][turn.stage] = _ABORTS["by_stage"].get(turn.stage, 0) + 1
+    logger.info("turn aborted: %s", wasted)
+    finish(turn, "aborted")
+    return wasted
+
+
+def abort_stats() -> dict:
+    return {**_ABORTS, "wasted_s": round(_ABORTS["wasted_s"], 3), "by_stage": dict(_ABORTS["by_stage"])}
@@ -0,0 +1,172 @@
+"""
+Frame-level voice activity detection in numpy.
+
+Frames whose log energy rises far enough above an adaptive noise floor
+(and whose zero-crossing rate is not pure hiss) count as voiced. Short gaps
+are bridged with a hangover, isolated clicks are dropped, and the result
+says where speech starts and ends and how much of it there is.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+# StreamingVad's level histogram: 0.25 dB bins over the range rms can take
+_DB_MIN, _DB_STEP = -120.0, 0.25
+_DB_BINS = int(-_DB_MIN / _DB_STEP) + 1
+
+
+@dataclass
+class VadResult:
+    sample_rate: int
+    start: int             # first speech sample (padded), 0 if none
+    end: int               # one past the last speech sample (padded)
+    speech_s: float        # voiced duration, excluding gaps and padding
+    total_s: float
+
+    @property
+    def has_speech(self) -> bool:
+        return self.speech_s > 0.0
+
+
+def _frames(x: np.ndarray, frame: int) -> np.ndarray:
+    n = len(x) // frame
+    return x[: n * frame].reshape(n, frame)
+
+
+def _fill_gaps(active: np.ndarray, max_gap: int) -> np.ndarray:
+    """Bridge runs of inactive frames no longer than `max_gap` between voiced frames."""
+    idx = np.flatnonzero(active)
+    if len(idx) < 2:
+        return active
+    out = active.copy()
+    gaps = np.diff(idx)
+    bridge = (gaps > 1) & (gaps <= max_gap + 1)
+    for a, b in zip(idx[:-1][bridge], idx[1:][bridge]):
+        out[a:b] = True
+    return out
+
+
+def _drop_short(active: np.ndarray, min_run: int) -> np.ndarray:
+    """Clear voiced runs shorter than `min_run` frames."""
+    if min_run <= 1 or not active.any():
+        return active
+    edges = np.diff(np.concatenate(([0], active.view(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    out = active.copy()
+    for s, e in zip(starts, ends):
+        if e - s < min_run:
+            out[s:e] = False
+    return out
+
+
+def detect_speech(
+    mono: np.ndarray,
+    sample_rate: int,
+    frame_ms: float = 20.0,
+    margin_db: float = 12.0,
+    floor_db: float = -55.0,
+    ceiling_db: float = -35.0,
+    max_zcr: float = 0.45,
+    hangover_ms: float = 300.0,
+    min_speech_ms: float = 120.0,
+    pad_ms: float = 150.0,
+) -> VadResult:
+    """
+    Locate speech in a float mono signal in [-1, 1].
+
+    - margin_db: how far above the estimated noise floor a frame must be.
+    - floor_db / ceiling_db: bounds on the threshold, so a capture that is
+      all speech (noise floor == speech level) is still detected.
+    - max_zcr: frames with a higher zero-crossing rate are treated as hiss.
+    - hangover_ms / min_speech_ms: gap bridging and click rejection.
+    - pad_ms: context kept around the detected span when trimming.
+    """
+    total_s = len(mono) / float(sample_rate)
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    f = _frames(np.asarray(mono, dtype=np.float32), frame)
+    if len(f) == 0:
+        return VadResult(sample_rate, 0, 0, 0.0, total_s)
+
+    rms = np.sqrt(np.mean(np.square(f, dtype=np.float32), axis=1) + 1e-12)
+    db = 20.0 * np.log10(rms)
+    noise = np.percentile(db, 10)
+    threshold = min(max(noise + margin_db, floor_db), ceiling_db)
+
+    zcr = np.mean(np.signbit(f[:, 1:]) != np.signbit(f[:, :-1]), axis=1)
+    active = (db > threshold) & (zcr < max_zcr)
+
+    active = _fill_gaps(active, int(hangover_ms / frame_ms))
+    active = _drop_short(active, int(np.ceil(min_speech_ms / frame_ms)))
+
+    voiced = np.flatnonzero(active)
+    if len(voiced) == 0:
+        return VadResult(sample_rate, 0, 0, 0.0, total_s)
+
+    pad = int(sample_rate * pad_ms / 1000)
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(mono), (voiced[-1] + 1) * frame + pad)
+    return VadResult(sample_rate, start, end, len(voiced) * frame / float(sample_rate), total_s)
+
+
+class StreamingVad:
+    """
+    Incremental counterpart of `detect_speech` for audio that arrives in
+    chunks. It keeps a fixed-size histogram of frame levels (not the audio),
+    so the noise floor (10th percentile, to 0.25 dB) over everything heard
+    so far costs the same on every chunk however long the stream runs. It
+    tracks how much speech has been heard and how long the current pause
+    is, so a streaming consumer can cut segments at pauses. The final trim
+    should still come from `detect_speech` over the whole utterance.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        frame_ms: float = 20.0,
+        margin_db: float = 12.0,
+        floor_db: float = -55.0,
+        ceiling_db: float = -35.0,
+        max_zcr: float = 0.45,
+    ):
+        self.sample_rate = sample_rate
+        self.frame = max(1, int(sample_rate * frame_ms / 1000))
+        self.frame_ms = frame_ms
+        self.margin_db, self.floor_db, self.ceiling_db = margin_db, floor_db, ceiling_db
+        self.max_zcr = max_zcr
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._levels = np.zeros(_DB_BINS, dtype=np.int64)  # frame count per dB bin
+        self.voiced_frames = 0
+        self.pause_frames = 0
+        self.frames = 0
+
+    @property
+    def speech_s(self) -> float:
+        return self.voiced_frames * self.frame / float(self.sample_rate)
+
+    @property
+    def pause_ms(self) -> float:
+        return self.pause_frames * self.frame_ms
+
+    def feed(self, mono: np.ndarray):
+        x = np.concatenate((self._tail, np.asarray(mono, dtype=np.float32)))
+        f = _frames(x, self.frame)
+        self._tail = x[len(f) * self.frame :]
+        if len(f) == 0:
+            return
+        rms = np.sqrt(np.mean(np.square(f, dtype=np.float32), axis=1) + 1e-12)
+        db = 20.0 * np.log10(rms)
+        zcr = np.mean(np.signbit(f[:, 1:]) != np.signbit(f[:, :-1]), axis=1)
+        bins = np.clip(((db - _DB_MIN) / _DB_STEP).astype(np.int64), 0, _DB_BINS - 1)
+        self._levels += np.bincount(bins, minlength=_DB_BINS)
+        n = self.frames + len(f)
+        rank = int(0.1 * (n - 1))  # of the 10th percentile among all frames so far
+        b = int(np.searchsorted(np.cumsum(self._levels), rank, side="right"))
+        noise = _DB_MIN + (b + 0.5) * _DB_STEP
+        threshold = min(max(noise + self.margin_db, self.floor_db), self.ceiling_db)
+        for voiced in (db > threshold) & (zcr < self.max_zcr):
+            if voiced:
+                self.voiced_frames += 1
+                self.pause_frames = 0
+            else:
+                self.pause_frames += 1
+        self.frames += len(f)
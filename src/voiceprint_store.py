@@ -0,0 +1,183 @@
+"""
+Binary voiceprint store.
+
+Layout (for the default base ``voiceprints``):
+
+    voiceprints.npy    float32 (n_templates, dim) matrix of unit templates
+    voiceprints.jsonl  one manifest line per row: {"person", "source", "added"}
+
+Both files are append-only. Enrollment writes the new rows, then their
+manifest lines, then patches the fixed-size .npy header so the shape covers
+the new rows. Readers memory-map the matrix and trust only the rows that
+are both fully on disk and listed in the manifest, so a crash
+mid-enrollment never yields a half-written template.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+
+from src.config import logger
+
+_MAGIC = b"\x93NUMPY\x01\x00"
+_HEADER_LEN = 128  # total bytes incl. magic; fixed so the header can be patched in place
+
+
+def _npy_header(rows: int, dim: int) -> bytes:
+    body = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % (rows, dim)
+    pad = _HEADER_LEN - len(_MAGIC) - 2 - len(body) - 1
+    if pad < 0:
+        raise ValueError("voiceprint matrix shape does not fit the fixed header")
+    body = body + " " * pad + "\n"
+    return _MAGIC + len(body).to_bytes(2, "little") + body.encode("latin1")
+
+
+def _unit_rows(vectors: Iterable, dim: Optional[int] = None) -> np.ndarray:
+    rows = []
+    for v in vectors:
+        v = np.asarray(v, dtype=np.float32).reshape(-1)
+        if dim is not None and v.shape[0] != dim:
+            raise ValueError(f"template has dim {v.shape[0]}, store expects {dim}")
+        n = float(np.linalg.norm(v))
+        if not np.isfinite(n) or n < 1e-9:
+            raise ValueError("refusing to store an empty or non-finite template")
+        rows.append(v / n)
+    return np.ascontiguousarray(np.stack(rows, axis=0), dtype="<f4")
+
+
+class VoiceprintStore:
+    """Append-only float32 template matrix plus a JSONL manifest."""
+
+    def __init__(self, path="voiceprints.npy"):
+        self.matrix_path = Path(path).with_suffix(".npy")
+        self.manifest_path = Path(path).with_suffix(".jsonl")
+        self._write_lock = threading.Lock()
+
+    def exists(self) -> bool:
+        return self.matrix_path.exists() and self.manifest_path.exists()
+
+    def stamp(self):
+        a, b = os.stat(self.matrix_path), os.stat(self.manifest_path)
+        return (a.st_ino, a.st_mtime_ns, a.st_size, b.st_ino, b.st_mtime_ns, b.st_size)
+
+    def _manifest(self) -> tuple[list[dict], int]:
+        """Return (entries, byte length of the intact prefix)."""
+        entries, good = [], 0
+        with open(self.manifest_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn final line from an interrupted append
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+                good += len(line)
+        return entries, good
+
+    def _dim(self) -> int:
+        with open(self.matrix_path, "rb") as f:
+            np.lib.format.read_magic(f)
+            shape, _, _ = np.lib.format.read_array_header_1_0(f)
+        return shape[1]
+
+    def _file_rows(self, dim: int) -> int:
+        return (os.path.getsize(self.matrix_path) - _HEADER_LEN) // (dim * 4)
+
+    def load(self):
+        """
+        Return (owners, templates): the person for each row and a read-only
+        memory-mapped (n, dim) float32 matrix. No template data is copied.
+        """
+        entries, _ = self._manifest()
+        dim = self._dim()
+        n = min(len(entries), self._file_rows(dim))
+        if n == 0:
+            return [], np.zeros((0, dim), dtype=np.float32)
+        matrix = np.memmap(
+            self.matrix_path, dtype="<f4", mode="r", offset=_HEADER_LEN, shape=(n, dim)
+        )
+        return [e["person"] for e in entries[:n]], matrix
+
+    def append(self, person: str, vectors, sources: Optional[list] = None) -> int:
+        """Append templates for `person` without touching existing rows. Returns new total."""
+        sources = sources or [None] * len(vectors)
+        with self._write_lock:
+            if self.exists():
+                dim = self._dim()
+                rows = _unit_rows(vectors, dim)
+                entries, good = self._manifest()
+                start = min(len(entries), self._file_rows(dim))
+                # drop anything left behind by an interrupted append
+                if start < len(entries) or good < os.path.getsize(self.manifest_path):
+                    self._truncate_manifest(entries[:start])
+                with open(self.matrix_path, "r+b") as f:
+                    f.truncate(_HEADER_LEN + start * dim * 4)
+                    f.seek(0, os.SEEK_END)
+                    f.write(rows.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                rows = _unit_rows(vectors)
+                dim, start = rows.shape[1], 0
+                self.matrix_path.parent.mkdir(parents=True, exist_ok=True)
+                self.manifest_path.write_text("", encoding="utf-8")
+                with open(self.matrix_path, "wb") as f:
+                    f.write(_npy_header(0, dim))
+                    f.write(rows.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            added = datetime.now(timezone.utc).isoformat()
+            with open(self.manifest_path, "a", encoding="utf-8") as f:
+                for src in sources:
+                    f.write(json.dumps({"person": person, "source": src, "added": added}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            # header last: plain np.load() readers see the new rows only now
+            total = start + rows.shape[0]
+            with open(self.matrix_path, "r+b") as f:
+                f.write(_npy_header(total, dim))
+                f.flush()
+                os.fsync(f.fileno())
+            return total
+
+    def _truncate_manifest(self, entries: list[dict]):
+        tmp = self.manifest_path.with_suffix(".jsonl.tmp")
+        tmp.write_text("".join(json.dumps(e) + "\n" for e in entries), encoding="utf-8")
+        os.replace(tmp, self.manifest_path)
+
+
+def read_json_db(path="voiceprints.json") -> dict:
+    """Compatibility reader for the legacy JSON file: {person: [template, ...]}."""
+    db = json.loads(Path(path).read_text())
+    out = {}
+    for person, ref in db.items():
+        if isinstance(ref, list) and ref and isinstance(ref[0], (list, tuple)):
+            # legacy files wrap each template as [[...floats]]
+            out[person] = [np.asarray(v, dtype=np.float32).reshape(-1) for v in ref]
+        elif isinstance(ref, list) and ref:
+            out[person] = [np.asarray(ref, dtype=np.float32).reshape(-1)]
+    return out
+
+
+def migrate_json(json_path="voiceprints.json", store_path="voiceprints.npy") -> int:
+    """One-shot migration of the legacy JSON DB into a fresh binary store."""
+    store = VoiceprintStore(store_path)
+    if store.exists():
+        raise FileExistsError(f"{store.matrix_path} already exists; refusing to overwrite")
+    total = 0
+    for person, vecs in read_json_db(json_path).items():
+        total = store.append(person, vecs, sources=[f"migrated:{json_path}"] * len(vecs))
+    logger.info("Migrated %s -> %s (%d templates)", json_path, store.matrix_path, total)
+    return total
+
+
+if __name__ == "__main__":
+    import sys
+
+    migrate_json(*sys.argv[1:3])
@@ -0,0 +1,20 @@
+"""Process-wide Vosk model cache: each model directory is loaded once."""
+import threading
+
+from vosk import Model, SetLogLevel
+
+from src.config import VOSK_MODEL_PATH, logger
+
+SetLogLevel(-1)
+
+_MODELS: dict[str, Model] = {}
+_MODELS_LOCK = threading.Lock()
+
+
+def get_vosk_model(path: str = VOSK_MODEL_PATH) -> Model:
+    with _MODELS_LOCK:
+        model = _MODELS.get(path)
+        if model is None:
+            logger.info("Loading Vosk model from %s", path)
+            model = _MODELS[path] = Model(path)
+        return model
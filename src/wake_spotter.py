@@ -0,0 +1,155 @@
+"""
+Offline wake-word spotting with a grammar-restricted Vosk recognizer.
+
+The recognizer only knows the wake phrases (WAKE_SPOT_PHRASES, else the
+keys of wake_up.json) plus "[unk]", so decoding is cheap and runs
+on-device on a 16 kHz PCM stream. No audio leaves the device until a
+phrase is spotted; the cloud embedding check in `wakeup.is_wake_phrase`
+can optionally confirm the hit.
+
+Vosk silently drops words it does not know from a grammar, so a phrase
+with a made-up name ("hey peepa") could never be recognized as written.
+Each phrase is checked against the model's lexicon: out-of-vocabulary
+words are left out of the form that is matched, as long as at least
+`_MIN_SPOT_WORDS` known words remain ("wake up peepa" is spotted as
+"wake up"); shorter forms would fire on everyday speech and are skipped.
+If no phrase is left, construction fails with a ValueError; set
+WAKE_SPOT_PHRASES to in-vocabulary aliases of the wake word.
+
+This is a standalone on-device tool (`python -m src.wake_spotter`); the
+server does not use it.
+"""
+import json
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+from vosk import KaldiRecognizer
+
+from src.config import VOSK_MODEL_PATH, WAKE_SPOT_PHRASES, logger
+from src.vosk_model import get_vosk_model
+
+SAMPLE_RATE = 16000
+BLOCK_MS = 20
+_MIN_SPOT_WORDS = 2
+
+
+def wake_phrases(path: str = "wake_up.json") -> list[str]:
+    if WAKE_SPOT_PHRASES:
+        return list(WAKE_SPOT_PHRASES)
+    with open(path, "r", encoding="utf-8") as f:
+        return list(json.load(f).keys())
+
+
+def spottable_forms(model, phrases: list[str]) -> dict[str, str]:
+    """{form the recognizer can output: phrase} for the phrases that survive the lexicon."""
+    forms = {}
+    for phrase in phrases:
+        words = phrase.lower().split()
+        known = [w for w in words if model.find_word(w) != -1]
+        if len(known) < len(words):
+            logger.warning(
+                "wake phrase %r: %s not in the Vosk lexicon", phrase,
+                ", ".join(w for w in words if w not in known),
+            )
+        if len(known) < min(_MIN_SPOT_WORDS, len(words)):
+            logger.warning("wake phrase %r cannot be spotted, skipped", phrase)
+            continue
+        forms.setdefault(" ".join(known), phrase)
+    return forms
+
+
+class WakeSpotter:
+    def __init__(
+        self,
+        on_wake: Callable[[str, float], object],
+        phrases: Optional[list[str]] = None,
+        model_path: str = VOSK_MODEL_PATH,
+        min_confidence: float = 0.6,
+        confirm: bool = False,
+        sample_rate: int = SAMPLE_RATE,
+    ):
+        self.on_wake = on_wake
+        model = get_vosk_model(model_path)
+        wanted = phrases or wake_phrases()
+        self._forms = spottable_forms(model, wanted)
+        if not self._forms:
+            raise ValueError(
+                f"none of the wake phrases {wanted} can be spotted with the model in {model_path}; "
+                "set WAKE_SPOT_PHRASES to in-vocabulary aliases"
+            )
+        self.phrases = list(self._forms)
+        self.min_confidence = min_confidence
+        self.confirm = confirm
+        self.sample_rate = sample_rate
+        self._rec = KaldiRecognizer(model, sample_rate, json.dumps(self.phrases + ["[unk]"]))
+        self._rec.SetWords(True)
+
+    def _detect(self, result: dict) -> Optional[tuple[str, float]]:
+        text = result.get("text", "").strip()
+        if text not in self._forms:
+            return None
+        words = result.get("result") or []
+        conf = sum(w.get("conf", 0.0) for w in words) / len(words) if words else 0.0
+        return text, conf
+
+    def feed(self, pcm: bytes) -> Optional[tuple[str, float]]:
+        """
+        Feed 16-bit mono PCM. Returns (phrase, confidence) and fires `on_wake`
+        when a wake phrase is spotted, otherwise None.
+        """
+        if self._rec.AcceptWaveform(pcm):
+            hit = self._detect(json.loads(self._rec.Result()))
+        else:
+            partial = json.loads(self._rec.PartialResult()).get("partial", "").strip()
+            if partial not in self._forms:
+                return None
+            # partial already matches: finalize now instead of waiting for end-of-speech
+            hit = self._detect(json.loads(self._rec.FinalResult()))
+            self._rec.Reset()
+
+        if hit is None or hit[1] < self.min_confidence:
+            return None
+        if self.confirm:
+            from src.wakeup import is_wake_phrase
+
+            if not is_wake_phrase(hit[0]):  # what was heard
+                return None
+        hit = (self._forms[hit[0]], hit[1])  # reported as the configured phrase
+        self.on_wake(*hit)
+        return hit
+
+    def listen(self, stop: Optional[threading.Event] = None, device=None):
+        """Spot wake phrases from the default microphone until `stop` is set."""
+        import sounddevice as sd
+
+        stop = stop or threading.Event()
+        blocks: "queue.Queue[bytes]" = queue.Queue()
+
+        def callback(indata, frames, time_info, status):
+            if status:
+                logger.warning("audio input: %s", status)
+            blocks.put(bytes(indata))
+
+        with sd.RawInputStream(
+            samplerate=self.sample_rate,
+            blocksize=int(self.sample_rate * BLOCK_MS / 1000),
+            dtype="int16",
+            channels=1,
+            device=device,
+            callback=callback,
+        ):
+            logger.info("listening for wake phrases: %s", self.phrases)
+            while not stop.is_set():
+                try:
+                    self.feed(blocks.get(timeout=0.5))
+                except queue.Empty:
+                    continue
+
+
+if __name__ == "__main__":
+    def _on_wake(phrase, conf):
+        print(f"{time.strftime('%H:%M:%S')} wake: {phrase!r} (conf {conf:.2f})")
+
+    WakeSpotter(_on_wake).listen()
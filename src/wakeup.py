@@ -1,10 +1,14 @@
 import json
+import threading
+from collections import OrderedDict
+from typing import Optional
 
 import numpy as np
 
-from config import client, logger
+from src.config import client, logger
 
 OPENAI_ENGINE = "text-embedding-3-small"
+EMBED_CACHE_SIZE = 512
 
 
 def wakeup_bank(path: str = "wake_up.json") -> list[str]:
@@ -17,6 +21,82 @@ def wakeup_bank(path: str = "wake_up.json") -> list[str]:
     return list(wake_up_dict.values())
 
 
+def _normalize_text(text: str) -> str:
+    return " ".join(text.lower().split()).strip(" .,!?")
+
+
+class _EmbeddingCache:
+    """Bounded LRU of normalized text -> unit float32 embedding."""
+
+    def __init__(self, maxsize: int = EMBED_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            v = self._data.get(key)
+            if v is not None:
+                self._data.move_to_end(key)
+            return v
+
+    def put(self, key: str, value: np.ndarray):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def _unit(v) -> np.ndarray:
+    v = np.asarray(v, dtype=np.float32).reshape(-1)
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+
+class WakeBank:
+    """
+    Wake phrases loaded once into a pre-normalized float32 matrix.
+
+    `best_match` scores a text against every phrase with one matrix-vector
+    product; input embeddings are memoized on normalized text.
+    """
+
+    def __init__(self, path: str = "wake_up.json", cache_size: int = EMBED_CACHE_SIZE):
+        with open(path, "r", encoding="utf-8") as f:
+            wake_up_dict = json.load(f)
+        self.phrases = list(wake_up_dict.keys())
+        self.matrix = np.ascontiguousarray(
+            np.stack([_unit(v) for v in wake_up_dict.values()], axis=0), dtype=np.float32
+        )
+        self._cache = _EmbeddingCache(cache_size)
+
+    def embed(self, text: str) -> np.ndarray:
+        key = _normalize_text(text)
+        v = self._cache.get(key)
+        if v is None:
+            v = _unit(embed(key or text))
+            self._cache.put(key, v)
+        return v
+
+    def best_match(self, text: str) -> tuple[str, float]:
+        sims = self.matrix @ self.embed(text)
+        i = int(np.argmax(sims))
+        return self.phrases[i], float(sims[i])
+
+
+_BANK: Optional[WakeBank] = None
+_BANK_LOCK = threading.Lock()
+
+
+def get_wake_bank(path: str = "wake_up.json") -> WakeBank:
+    global _BANK
+    with _BANK_LOCK:
+        if _BANK is None:
+            _BANK = WakeBank(path)
+        return _BANK
+
+
 def embed(text):
     response = client.embeddings.create(
         input=text, model=OPENAI_ENGINE
@@ -37,12 +117,8 @@ def is_wake_phrase(text: str, threshold: float = 0.85) -> bool:
     Returns True if similarity is above `threshold`.
     """
     logger.info("embedding: %s", text)
-    embd_input = embed(text)
-    bank = wakeup_bank()  # list of embeddings from your JSON
-
-    for embd in bank:
-        sim = cosine_similarity(embd_input, embd)
-        if sim >= threshold:
-            logger.info("matches wakeup with sim: %s", sim)
-            return True
+    phrase, sim = get_wake_bank().best_match(text)
+    if sim >= threshold:
+        logger.info("matches wakeup %r with sim: %s", phrase, sim)
+        return True
     return False
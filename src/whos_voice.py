@@ -1,11 +1,15 @@
 import json
+import os
+import threading
 from pathlib import Path
+from typing import Optional
 
 import numpy as np
-import torchaudio
 
-from src.config import logger
-from src.enroll_voice import wav_to_embedding
+from src.config import SPK_BATCH_MAX, VOICEPRINT_DB, logger
+from src.enroll_voice import load_16k_mono, wav_to_embedding
+from src.spk_batcher import get_batcher
+from src.voiceprint_store import VoiceprintStore
 
 
 def _to_unit_vec(x, eps=1e-9):
@@ -17,12 +21,200 @@ def _to_unit_vec(x, eps=1e-9):
     return v / (n + eps)
 
 
+def _iter_templates(ref):
+    """Yield the raw template vectors stored for one person (old or new layout)."""
+    if (
+        isinstance(ref, list)
+        and len(ref) > 0
+        and isinstance(ref[0], (list, tuple, np.ndarray))
+    ):
+        # multiple templates already
+        yield from ref
+    else:
+        # single template stored previously
+        yield ref
+
+
+class _Snapshot:
+    """Immutable, pre-normalized view of the voiceprint DB."""
+
+    def __init__(self, names, owners, templates, centroids, stamp):
+        self.names = names            # list[str], one per person
+        self.owners = owners          # (n_templates,) int32 index into names
+        self.templates = templates    # (n_templates, dim) float32 unit rows
+        self.centroids = centroids    # (n_people, dim) float32 unit rows ("avgref")
+        self.counts = np.bincount(owners, minlength=len(names)).astype(np.float32)
+        self.stamp = stamp
+
+    @property
+    def dim(self) -> int:
+        return self.templates.shape[1] if self.templates.ndim == 2 else 0
+
+    def score(self, probe: np.ndarray, strategy: str = "max") -> np.ndarray:
+        """Return one similarity per person in `names` order."""
+        if strategy == "avgref":
+            return self.centroids @ probe
+        sims = self.templates @ probe
+        if strategy == "max":
+            out = np.full(len(self.names), -np.inf, dtype=np.float32)
+            np.maximum.at(out, self.owners, sims)
+            return out
+        totals = np.bincount(self.owners, weights=sims, minlength=len(self.names))
+        return (totals / self.counts).astype(np.float32)
+
+
+def _snapshot_from_rows(row_owners, templates, stamp) -> _Snapshot:
+    """Group unit-template rows by owner name; `templates` is used as-is (may be a memmap)."""
+    names, lookup = [], {}
+    owners = np.empty(len(row_owners), dtype=np.int32)
+    for i, person in enumerate(row_owners):
+        if person not in lookup:
+            lookup[person] = len(names)
+            names.append(person)
+        owners[i] = lookup[person]
+
+    if not names:
+        empty = np.zeros((0, 0), dtype=np.float32)
+        return _Snapshot([], owners, empty, empty, stamp)
+
+    centroids = np.zeros((len(names), templates.shape[1]), dtype=np.float32)
+    np.add.at(centroids, owners, templates)
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    centroids = np.divide(centroids, norms + 1e-9, out=np.zeros_like(centroids), where=norms > 1e-9)
+
+    return _Snapshot(names, owners, templates, centroids, stamp)
+
+
+def _build_snapshot(db: dict, stamp) -> _Snapshot:
+    """Build a snapshot from the legacy {person: [template, ...]} JSON layout."""
+    row_owners, rows = [], []
+    dim = None
+    for person, ref in db.items():
+        for raw in _iter_templates(ref):
+            v = _to_unit_vec(raw)
+            if v is None or not np.all(np.isfinite(v)):
+                continue
+            if dim is None:
+                dim = v.shape[0]
+            if v.shape[0] != dim:
+                continue
+            row_owners.append(person)
+            rows.append(v)
+
+    templates = (
+        np.ascontiguousarray(np.stack(rows, axis=0), dtype=np.float32)
+        if rows
+        else np.zeros((0, 0), dtype=np.float32)
+    )
+    return _snapshot_from_rows(row_owners, templates, stamp)
+
+
+class VoiceprintIndex:
+    """
+    Loaded-once voiceprint matrix that reloads itself when the store changes.
+
+    Backed by the binary `VoiceprintStore` (memory-mapped, zero-copy) or,
+    for `.json` paths, by the legacy JSON file. Requests always score against
+    a complete snapshot; a stale index is rebuilt by whichever caller notices
+    first while the others keep using the previous snapshot.
+    """
+
+    def __init__(self, path=VOICEPRINT_DB):
+        self.path = Path(path)
+        self._store = None if self.path.suffix == ".json" else VoiceprintStore(self.path)
+        self._snapshot: Optional[_Snapshot] = None
+        self._reload_lock = threading.Lock()
+
+    def _stamp(self):
+        if self._store is not None:
+            return self._store.stamp()
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _load(self, stamp) -> _Snapshot:
+        if self._store is not None:
+            row_owners, templates = self._store.load()
+            snap = _snapshot_from_rows(row_owners, templates, stamp)
+        else:
+            snap = _build_snapshot(json.loads(self.path.read_text()), stamp)
+            logger.warning(
+                "Using legacy voiceprint file %s; run `python -m src.voiceprint_store` to migrate",
+                self.path,
+            )
+        logger.info(
+            "Loaded voiceprint index from %s: %d people, %d templates",
+            self.path,
+            len(snap.names),
+            len(snap.owners),
+        )
+        return snap
+
+    def snapshot(self) -> _Snapshot:
+        """Return the current snapshot, reloading if the file changed on disk."""
+        stamp = self._stamp()
+        current = self._snapshot
+        if current is not None and current.stamp == stamp:
+            return current
+
+        # Someone else is already reloading: keep serving the old snapshot.
+        if current is not None and not self._reload_lock.acquire(blocking=False):
+            return current
+        if current is None:
+            self._reload_lock.acquire()
+        try:
+            current = self._snapshot
+            if current is None or current.stamp != stamp:
+                try:
+                    current = self._load(stamp)
+                    self._snapshot = current
+                except Exception:
+                    if current is None:
+                        raise
+                    logger.exception("voiceprint reload failed; keeping previous index")
+            return current
+        finally:
+            self._reload_lock.release()
+
+
+_INDEXES: dict[str, VoiceprintIndex] = {}
+_INDEXES_LOCK = threading.Lock()
+
+
+def _resolve_db(db_path) -> Optional[Path]:
+    """Prefer the binary store; fall back to a legacy JSON file next to it."""
+    p = Path(db_path)
+    if p.suffix == ".json":
+        return p if p.exists() else None
+    if VoiceprintStore(p).exists():
+        return p
+    legacy = p.with_suffix(".json")
+    return legacy if legacy.exists() else None
+
+
+def get_index(db_path=VOICEPRINT_DB) -> VoiceprintIndex:
+    """Process-wide index per DB path."""
+    key = str(Path(db_path).resolve())
+    with _INDEXES_LOCK:
+        idx = _INDEXES.get(key)
+        if idx is None:
+            idx = _INDEXES[key] = VoiceprintIndex(db_path)
+        return idx
+
+
+def _probe_embedding(wav_path, batch: bool = True):
+    """Embed the probe, sharing an encode_batch call with concurrent requests when enabled."""
+    if batch and SPK_BATCH_MAX > 1:
+        return get_batcher().embed(load_16k_mono(wav_path))
+    return wav_to_embedding(wav_path)
+
+
 def who_is_speaking(
     wav_path,
-    db_json="voiceprints.json",
+    db_path=VOICEPRINT_DB,
     threshold=0.35,  # start a bit lower; calibrate later
     strategy="max",  # "max" (default) | "mean" | "avgref"
     top_k=3,
+    batch=True,  # False: embed right here, bypassing the cross-request batcher
 ):
     """
     Identify the most similar enrolled speaker or 'unknown' if below threshold.
@@ -36,16 +228,16 @@ def who_is_speaking(
     """
 
     # Load DB
-    p = Path(db_json)
-    if not p.exists():
+    resolved = _resolve_db(db_path)
+    if resolved is None:
         return {
             "speaker_id": "unknown",
             "confidence": 0.0,
-            "error": f"DB '{db_json}' not found",
+            "error": f"DB '{db_path}' not found",
         }
 
     try:
-        db = json.loads(p.read_text())
+        snap = get_index(resolved).snapshot()
     except Exception as e:
         return {
             "speaker_id": "unknown",
@@ -54,7 +246,7 @@ def who_is_speaking(
         }
 
     # Probe embedding
-    probe = _to_unit_vec(wav_to_embedding(wav_path))
+    probe = _to_unit_vec(_probe_embedding(wav_path, batch))
     if probe is None or not np.all(np.isfinite(probe)):
         return {
             "speaker_id": "unknown",
@@ -62,46 +254,16 @@ def who_is_speaking(
             "error": "Invalid probe embedding",
         }
 
-    candidates = []
-
-    for person, ref in db.items():
-        # Normalize DB into a list of vectors
-        if (
-            isinstance(ref, list)
-            and len(ref) > 0
-            and isinstance(ref[0], (list, tuple, np.ndarray))
-        ):
-            # multiple templates already
-            vecs = [_to_unit_vec(np.array(v, dtype=np.float32)) for v in ref]
-        else:
-            # single template stored previously
-            vecs = [_to_unit_vec(np.array(ref, dtype=np.float32))]
-
-        vecs = [
-            v
-            for v in vecs
-            if v is not None and v.shape == probe.shape and np.all(np.isfinite(v))
-        ]
-        if not vecs:
-            continue
-
-        if strategy == "avgref":
-            ref_vec = _to_unit_vec(np.mean(np.stack(vecs, axis=0), axis=0))
-            if ref_vec is None or ref_vec.shape != probe.shape:
-                continue
-            sim = float(np.dot(probe, ref_vec))
-        else:
-            sims = [float(np.dot(probe, v)) for v in vecs]
-            sim = max(sims) if strategy == "max" else float(np.mean(sims))
+    if not snap.names or probe.shape[0] != snap.dim:
+        return {"speaker_id": "unknown", "confidence": 0.0}
 
-        if np.isfinite(sim):
-            candidates.append((person, sim))
+    scores = snap.score(probe, strategy)
+    order = [i for i in np.argsort(-scores, kind="stable") if np.isfinite(scores[i])]
+    candidates = [(snap.names[i], float(scores[i])) for i in order]
 
     if not candidates:
         return {"speaker_id": "unknown", "confidence": 0.0}
 
-    # Sort by similarity (desc)
-    candidates.sort(key=lambda x: x[1], reverse=True)
     best_id, best_sim = candidates[0]
     second_sim = candidates[1][1] if len(candidates) > 1 else None
     margin = (best_sim - second_sim) if second_sim is not None else None